@@ -2,24 +2,35 @@
 
 from __future__ import annotations
 
-import base64
-import io
-import os
+import asyncio
+import contextlib
+import functools
+import json
+import time
 import uuid
+import zipfile
+from collections.abc import AsyncIterator, Awaitable, Callable
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, TypeVar
 
-from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Request, Response, UploadFile
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from PIL import Image
 
 from ..config import settings
 from ..db.dependencies import get_db_session
 from ..db.models import OcrTask, TaskStatus, TaskType
+from ..db.session import get_session_factory
 from ..models.schemas import (
+    BatchImageItem,
+    BatchImageOCRResponse,
     BoundingBox,
+    DecodeStats,
+    EngineReconfigureRequest,
     HealthResponse,
     ImageDimensions,
     ImageOCRResponse,
@@ -32,26 +43,103 @@ from ..models.schemas import (
     TaskStatusResponse,
     TaskTiming,
 )
+from ..services import metrics
+from ..services.admission import AdmissionController, AdmissionRejected, Priority
+from ..services.deadline import DeadlineExceeded, bounded_timeout, parse_deadline
+from ..services.decode_plan import DecodedImage
 from ..services.grounding_parser import GroundingParser
+from ..services.preprocess import ImagePreprocessor, PreparedImage, decode_base64_bytes
 from ..services.prompt_builder import PromptBuilder
+from ..services.result_cache import CACHE_BYPASS_VALUES, OcrResultCache
+from ..services.startup import ModelNotReady, StartupState
 from ..services.storage import StorageManager
-from ..services.vllm_direct_engine import VLLMDirectEngine
+from ..services.loop_detector import LoopDetectionConfig
+from ..services.mode_selector import AUTO_MODE, ModeDecision, load_mode_policy, mode_name
+from ..services.engine_pool import EnginePool, NoReplicaAvailable, ReconfigureFailed, ReconfigureInProgress
+from ..services.vllm_direct_engine import InferenceResult, VLLMDirectEngine, WarmupPlan
 from ..tasks.pdf import process_pdf_task
 from ..utils.image_utils import ImageUtils
+from ..vllm_models.config import OCR_MODES, OcrMode, resolve_mode
+from ..vllm_models.process.tiling import plan_tiling
 
 
+T = TypeVar("T")
+
 router = APIRouter()
-_inference_service: Optional[VLLMDirectEngine] = None
+_inference_service: Optional[EnginePool] = None
 _storage = StorageManager()
+_result_cache = OcrResultCache(
+    max_entries=settings.ocr_cache_max_entries,
+    disk_dir=_storage.get_cache_dir("ocr") if settings.ocr_cache_disk_enabled else None,
+)
+_preprocessor = ImagePreprocessor(
+    workers=settings.preprocess_workers,
+    executor=settings.preprocess_executor,
+    max_pending=settings.preprocess_max_pending,
+    shm_slots=settings.preprocess_shm_slots,
+    shm_handoff=settings.preprocess_shm_handoff,
+    # v0 引擎在预处理 worker 中分词；v1 由 EngineCore 进程处理原始图像
+    tokenize_in_worker=not settings.vllm_use_v1,
+)
+_admission = AdmissionController(
+    token_budget=settings.admission_token_budget,
+    max_queue_depth=settings.admission_max_queue_depth,
+    retry_after_seconds=settings.admission_retry_after_seconds,
+)
+_mode_policy = load_mode_policy(settings.ocr_auto_policy)
+# 由 main.lifespan 记录数据库初始化耗时，模型在后台加载
+startup_state = StartupState()
 
 
-async def get_inference_service() -> VLLMDirectEngine:
-    global _inference_service
+async def get_inference_service() -> EnginePool:
+    """模型后台加载期间有限等待，仍未就绪时返回 503"""
+    if _inference_service is not None and _inference_service.is_loaded():
+        return _inference_service
+    try:
+        await startup_state.wait_ready(settings.model_ready_wait_seconds)
+    except ModelNotReady as exc:
+        # 仍在加载时附带 Retry-After，调用方（如 PDF worker）据此退避重试；加载失败则不再重试
+        headers = None
+        if not startup_state.is_failed:
+            headers = {"Retry-After": str(max(int(settings.model_ready_wait_seconds), 1))}
+        raise HTTPException(status_code=503, detail=str(exc), headers=headers) from exc
     if _inference_service is None:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     return _inference_service
 
 
+def _tracked(route: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """记录接口端到端耗时，并为引擎内的阶段指标设置 route 标签"""
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            metrics.current_route.set(route)
+            start = time.perf_counter()
+            status = "200"
+            try:
+                return await func(*args, **kwargs)
+            except HTTPException as exc:
+                status = str(exc.status_code)
+                raise
+            except Exception:
+                status = "500"
+                raise
+            finally:
+                metrics.REQUEST_SECONDS.observe(
+                    time.perf_counter() - start, route=route, status=status
+                )
+
+        return wrapper
+
+    return decorator
+
+
+async def _commit(session: AsyncSession) -> None:
+    with metrics.stage_timer("db_commit"):
+        await session.commit()
+
+
 @router.get("/")
 async def root() -> dict[str, str | int | float | bool]:
     return {
@@ -63,138 +151,626 @@ async def root() -> dict[str, str | int | float | bool]:
 
 
 @router.get("/health", response_model=HealthResponse)
-async def health() -> HealthResponse:
+async def health(response: Response) -> HealthResponse:
     is_loaded = _inference_service is not None and _inference_service.is_loaded()
+    is_ready = _inference_service is not None and _inference_service.is_ready()
+    phase = _inference_service.phase if _inference_service is not None else "idle"
+    report = _inference_service.warmup_report if _inference_service is not None else None
+    if not is_ready:
+        # 预热完成前返回 503，编排系统只把流量路由到已预热的实例
+        response.status_code = 503
+    if startup_state.is_failed:
+        status = "failed"
+    else:
+        status = "healthy" if is_ready else ("warming" if phase == "warming" else "starting")
     return HealthResponse(
-        status="healthy" if is_loaded else "starting",
+        status=status,
         model_loaded=is_loaded,
         inference_engine="vllm_direct",
+        phase=phase,
+        warmup=report.to_dict() if report is not None else None,
+        startup=startup_state.to_dict(),
     )
 
 
 @router.post("/api/ocr/image", response_model=ImageOCRResponse)
+@_tracked("image")
 async def ocr_image(
+    request: Request,
     image: UploadFile = File(..., description="待识别图像"),
+    mode: Optional[str] = Form(default=None, description="OCR 模式档位（tiny/small/base/large/gundam/auto）"),
+    cache_control: Optional[str] = Header(default=None, alias="X-OCR-Cache"),
     session: AsyncSession = Depends(get_db_session),
-    inference_service: VLLMDirectEngine = Depends(get_inference_service),
+    inference_service: EnginePool = Depends(get_inference_service),
 ) -> ImageOCRResponse:
-    tmp_img = None
     task: OcrTask | None = None
+    deadline = _request_deadline(request)
+    ocr_mode = _resolve_ocr_mode(mode)
+    use_cache = _use_result_cache(cache_control)
+    _check_admission(Priority.INTERACTIVE)
 
-    try:
-        tmp_img = await ImageUtils.save_upload_file(image)
-        prompt = PromptBuilder.image_prompt()
+    data = await _read_upload(image)
+    prompt = PromptBuilder.image_prompt()
+    # 单次解码：模式选择与推理共用同一张图像（按模式可用的最大尺寸缩小解码），不落临时文件；
+    # 进程池 + v0 时在同一次 worker 调用中完成模式选择与分词。检测框换算使用原图尺寸
+    decoded, prepared = await _decode_upload(data, ocr_mode, prompt)
 
+    try:
         task_id = uuid.uuid4()
         task = OcrTask(
             id=task_id,
             task_type=TaskType.IMAGE,
-            input_path=tmp_img,
+            input_path=_upload_input_path(image),
             queued_at=datetime.now(timezone.utc),
         )
         session.add(task)
         await session.flush()
 
         task.mark_running()
-        await session.commit()
+        await _commit(session)
         await session.refresh(task)
 
-        raw_text = await inference_service.infer(
-            prompt=prompt,
-            image_path=tmp_img,
-            base_size=settings.base_size,
-            image_size=settings.image_size,
-            crop_mode=settings.crop_mode,
+        with metrics.stage_timer("mode_select"):
+            orig_w, orig_h = decoded.original_size
+            image_digest = await asyncio.to_thread(OcrResultCache.digest_bytes, data) if use_cache else None
+            decision = await _decide_mode(ocr_mode, decoded.image, (orig_w, orig_h), prepared)
+        result = await _run_until_disconnect(
+            request,
+            _infer_with_cache(
+                inference_service,
+                image_digest,
+                prompt=prompt,
+                mode=decision.mode,
+                priority=Priority.INTERACTIVE,
+                image_dims=(orig_w, orig_h),
+                deadline=deadline,
+                image_data=prepared or decoded.image,
+                timeout=settings.inference_timeout_seconds,
+            ),
         )
 
-        orig_w, orig_h = ImageUtils.get_image_dimensions(tmp_img)
-
-        boxes: list[dict[str, Any]] = []
-        if GroundingParser.has_grounding_tags(raw_text) and orig_w and orig_h:
-            boxes = GroundingParser.parse_detections(raw_text, orig_w, orig_h)
-
-        cleaned_text = GroundingParser.clean_grounding_text(raw_text) or raw_text
-
-        payload: dict[str, Any] = {
-            "text": cleaned_text,
-            "raw_text": raw_text,
-            "boxes": boxes,
-        }
-        if orig_w and orig_h:
-            payload["image_dims"] = {"w": orig_w, "h": orig_h}
+        raw_text = result.text
+        payload = _build_image_payload(
+            raw_text, orig_w, orig_h, truncated=result.truncated, decision=decision
+        )
 
         task.mark_succeeded(payload, output_dir=None)
-        await session.commit()
+        await _commit(session)
         await session.refresh(task)
 
         timing = _build_task_timing(task)
 
         return ImageOCRResponse(
             success=True,
-            text=cleaned_text,
+            text=payload["text"],
             raw_text=raw_text,
-            boxes=[BoundingBox(**box) for box in boxes],
+            boxes=[BoundingBox(**box) for box in payload["boxes"]],
             image_dims=ImageDimensions(w=orig_w, h=orig_h) if orig_w and orig_h else None,
+            truncated=result.truncated,
+            mode=decision.name,
+            vision_tokens=decision.vision_tokens,
             task_id=task.id,
             timing=timing,
             duration_ms=task.duration_ms,
+            decode=DecodeStats(**decoded.stats()),
         )
 
     except Exception as exc:
         if task is not None:
             await session.rollback()
+            # 回滚会使已加载属性过期，先刷新再写入，避免在同步代码中触发惰性加载
+            await session.refresh(task)
             task.mark_failed(f"{type(exc).__name__}: {exc}")
             session.add(task)
-            await session.commit()
+            await _commit(session)
         error_detail = f"{type(exc).__name__}: {exc}"
-        raise HTTPException(status_code=500, detail=error_detail) from exc
+        raise HTTPException(
+            status_code=_error_status(exc),
+            detail=error_detail,
+            headers=_error_headers(exc),
+        ) from exc
 
     finally:
-        if tmp_img and os.path.exists(tmp_img):
+        decoded.close()
+
+
+@router.post("/api/ocr/image/stream")
+async def ocr_image_stream(
+    image: UploadFile = File(..., description="待识别图像"),
+    mode: Optional[str] = Form(default=None, description="OCR 模式档位（tiny/small/base/large/gundam/auto）"),
+    cache_control: Optional[str] = Header(default=None, alias="X-OCR-Cache"),
+    inference_service: EnginePool = Depends(get_inference_service),
+) -> StreamingResponse:
+    """以 SSE 流式返回识别结果：start → delta* → done（或 error）"""
+    metrics.current_route.set("stream")
+    started = time.perf_counter()
+    ocr_mode = _resolve_ocr_mode(mode)
+    _check_admission(Priority.INTERACTIVE)
+    data = await _read_upload(image)
+    prompt = PromptBuilder.image_prompt()
+    decoded, prepared = await _decode_upload(data, ocr_mode, prompt)
+    cache_key: Optional[str] = None
+    with metrics.stage_timer("mode_select"):
+        orig_w, orig_h = decoded.original_size
+        decision = await _decide_mode(ocr_mode, decoded.image, (orig_w, orig_h), prepared)
+        if _use_result_cache(cache_control):
+            image_digest = await asyncio.to_thread(OcrResultCache.digest_bytes, data)
+            cache_key = _result_cache_key(image_digest, prompt, decision.mode)
+
+    session_factory = get_session_factory()
+    task_id = uuid.uuid4()
+    async with session_factory() as session:
+        task = OcrTask(
+            id=task_id,
+            task_type=TaskType.IMAGE,
+            input_path=_upload_input_path(image),
+            queued_at=datetime.now(timezone.utc),
+        )
+        task.mark_running()
+        session.add(task)
+        await _commit(session)
+
+    async def event_stream() -> AsyncIterator[str]:
+        raw_text = ""
+        truncated = False
+        status = "200"
+        try:
+            yield _sse_event(
+                "start",
+                {
+                    "task_id": str(task_id),
+                    "mode": decision.name,
+                    "vision_tokens": decision.vision_tokens,
+                    "decode": decoded.stats(),
+                },
+            )
+            cached_text = await _result_cache.get(cache_key) if cache_key else None
+            if cached_text is not None:
+                raw_text = cached_text
+                yield _sse_event("delta", {"text": cached_text})
+            else:
+                cost = _estimate_request_tokens(decision.mode, (orig_w, orig_h))
+                queued_at = time.perf_counter()
+                async with _admission.admit(Priority.INTERACTIVE, cost, str(task_id), shed=False):
+                    metrics.observe_stage("queue_wait", time.perf_counter() - queued_at)
+                    async for chunk in inference_service.infer_stream(
+                        token_cost=cost,
+                        prompt=prompt,
+                        image_data=prepared or decoded.image,
+                        base_size=decision.mode.base_size,
+                        image_size=decision.mode.image_size,
+                        crop_mode=decision.mode.crop_mode,
+                        timeout=settings.inference_timeout_seconds,
+                    ):
+                        raw_text = chunk.text
+                        truncated = chunk.truncated
+                        if chunk.delta:
+                            yield _sse_event("delta", {"text": chunk.delta})
+                if cache_key and raw_text.strip() and not truncated:
+                    await _result_cache.put(cache_key, raw_text)
+
+            # 循环截断时 done 事件中的 raw_text/text 为裁剪后的内容
+            payload = _build_image_payload(
+                raw_text, orig_w, orig_h, truncated=truncated, decision=decision
+            )
+            async with session_factory() as session:
+                db_task = await session.get(OcrTask, task_id)
+                duration_ms = None
+                if db_task is not None:
+                    db_task.mark_succeeded(payload, output_dir=None)
+                    await _commit(session)
+                    duration_ms = db_task.duration_ms
+            yield _sse_event(
+                "done",
+                {**payload, "task_id": str(task_id), "duration_ms": duration_ms},
+            )
+
+        except (Exception, asyncio.CancelledError) as exc:
+            # 客户端断开时生成器被取消/关闭，infer_stream 会同步 abort 引擎请求
+            error_detail = f"{type(exc).__name__}: {exc}"
+            status = "499" if isinstance(exc, asyncio.CancelledError) else str(_error_status(exc))
+            async with session_factory() as session:
+                db_task = await session.get(OcrTask, task_id)
+                if db_task is not None:
+                    db_task.mark_failed(error_detail)
+                    await _commit(session)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            yield _sse_event("error", {"detail": error_detail})
+
+        finally:
+            metrics.REQUEST_SECONDS.observe(
+                time.perf_counter() - started, route="stream", status=status
+            )
+            decoded.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/api/ocr/images", response_model=BatchImageOCRResponse)
+@_tracked("batch")
+async def ocr_images(
+    request: Request,
+    images: list[UploadFile] = File(..., description="待识别图像（可包含 zip 压缩包）"),
+    mode: Optional[str] = Form(default=None, description="OCR 模式档位（tiny/small/base/large/gundam/auto）"),
+    cache_control: Optional[str] = Header(default=None, alias="X-OCR-Cache"),
+    session: AsyncSession = Depends(get_db_session),
+    inference_service: EnginePool = Depends(get_inference_service),
+) -> BatchImageOCRResponse:
+    """批量识别：所有图片并发提交到引擎，由 vLLM 连续批处理合并，结果按输入顺序返回"""
+    ocr_mode = _resolve_ocr_mode(mode)
+    entries = await _collect_batch_entries(images)
+    if not entries:
+        raise HTTPException(status_code=400, detail="未找到可识别的图片")
+    if len(entries) > settings.ocr_batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"图片数量 {len(entries)} 超过上限 {settings.ocr_batch_max_items}",
+        )
+    _check_admission(Priority.BATCH)
+
+    task = OcrTask(
+        id=uuid.uuid4(),
+        task_type=TaskType.IMAGE,
+        input_path=f"batch:{len(entries)}",
+        queued_at=datetime.now(timezone.utc),
+    )
+    task.mark_running()
+    session.add(task)
+    await _commit(session)
+    await session.refresh(task)
+
+    prompt = PromptBuilder.image_prompt()
+    use_cache = _use_result_cache(cache_control)
+    semaphore = asyncio.Semaphore(max(settings.ocr_batch_concurrency, 1))
+
+    async def _run_item(index: int, filename: str, data: bytes) -> BatchImageItem:
+        async with semaphore:
             try:
-                os.remove(tmp_img)
-            except OSError:
-                pass
+                decoded, prepared = await _prepare_image(data, ocr_mode, prompt)
+            except ValueError as exc:
+                return BatchImageItem(index=index, filename=filename, success=False, error=str(exc))
+            _record_decode(decoded)
+
+            try:
+                orig_w, orig_h = decoded.original_size
+                image_digest = (
+                    await asyncio.to_thread(OcrResultCache.digest_bytes, data) if use_cache else None
+                )
+                decision = await _decide_mode(ocr_mode, decoded.image, (orig_w, orig_h), prepared)
+                result = await _infer_with_cache(
+                    inference_service,
+                    image_digest,
+                    prompt=prompt,
+                    mode=decision.mode,
+                    priority=Priority.BATCH,
+                    task_key=str(task.id),
+                    image_dims=(orig_w, orig_h),
+                    # 入口已检查过队列深度，已接收的批量任务逐项排队而不是部分失败
+                    shed=False,
+                    image_data=prepared or decoded.image,
+                    timeout=settings.inference_timeout_seconds,
+                )
+                raw_text = result.text
+                payload = _build_image_payload(
+                    raw_text, orig_w, orig_h, truncated=result.truncated, decision=decision
+                )
+            except Exception as exc:
+                return BatchImageItem(
+                    index=index,
+                    filename=filename,
+                    success=False,
+                    error=f"{type(exc).__name__}: {exc}",
+                )
+            finally:
+                decoded.close()
+
+        return BatchImageItem(
+            index=index,
+            filename=filename,
+            success=True,
+            text=payload["text"],
+            raw_text=raw_text,
+            boxes=[BoundingBox(**box) for box in payload["boxes"]],
+            image_dims=ImageDimensions(w=orig_w, h=orig_h) if orig_w and orig_h else None,
+            truncated=result.truncated,
+            mode=decision.name,
+            vision_tokens=decision.vision_tokens,
+            decode=DecodeStats(**decoded.stats()),
+        )
+
+    try:
+        items = await _run_until_disconnect(
+            request,
+            asyncio.gather(
+                *(_run_item(index, name, data) for index, (name, data) in enumerate(entries))
+            ),
+        )
+    except ClientDisconnected as exc:
+        task.mark_failed("客户端已断开连接")
+        await _commit(session)
+        raise HTTPException(status_code=_error_status(exc), detail="Client disconnected") from exc
+    succeeded = sum(1 for item in items if item.success)
+    failed = len(items) - succeeded
+
+    task_payload: dict[str, Any] = {
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": failed,
+        "items": [item.model_dump(mode="json") for item in items],
+    }
+    if succeeded:
+        task.mark_succeeded(task_payload, output_dir=None)
+    else:
+        task.mark_failed("批量识别全部失败")
+        task.result_payload = task_payload
+    await _commit(session)
+    await session.refresh(task)
+
+    return BatchImageOCRResponse(
+        success=failed == 0,
+        task_id=task.id,
+        total=len(items),
+        succeeded=succeeded,
+        failed=failed,
+        items=list(items),
+        timing=_build_task_timing(task),
+        duration_ms=task.duration_ms,
+    )
 
 
 @router.post("/internal/infer", response_model=InternalInferResponse)
+@_tracked("internal")
 async def internal_infer(
-    payload: InternalInferRequest,
+    request: Request,
     token: str | None = Header(default=None, alias="X-Internal-Token"),
-    inference_service: VLLMDirectEngine = Depends(get_inference_service),
+    cache_control: Optional[str] = Header(default=None, alias="X-OCR-Cache"),
+    inference_service: EnginePool = Depends(get_inference_service),
 ) -> InternalInferResponse:
-    expected_token = settings.internal_api_token
-    if expected_token and token != expected_token:
-        raise HTTPException(status_code=403, detail="Forbidden")
-
-    image_data: Image.Image | None = None
+    """
+    内部推理接口，图像可通过以下任一方式传入（均可省略，仅按提示词生成）：
+    - application/json：image_base64，或共享存储内的 image_path
+    - application/octet-stream：请求体为原始图像字节，其余参数放在查询字符串
+    - multipart/form-data：image 文件字段 + 其余参数表单字段
+    """
+    _check_internal_token(token)
+    deadline = _request_deadline(request)
+    payload, image_bytes = await _read_internal_infer_request(request)
+    use_cache = _use_result_cache(cache_control)
+    image_digest: Optional[str] = None
+
+    decoded: Optional[DecodedImage] = None
+    prepared: Optional[PreparedImage] = None
+    ocr_mode = _resolve_ocr_mode(
+        payload.mode,
+        base_size=payload.base_size,
+        image_size=payload.image_size,
+        crop_mode=payload.crop_mode,
+    )
 
     try:
-        if payload.image_base64:
-            try:
-                image_bytes = base64.b64decode(payload.image_base64)
-                image_data = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            except Exception as exc:
-                raise HTTPException(status_code=400, detail=f"Invalid image payload: {exc}") from exc
-
-        raw_text = await inference_service.infer(
-            prompt=payload.prompt,
-            image_data=image_data,
-            base_size=payload.base_size or settings.base_size,
-            image_size=payload.image_size or settings.image_size,
-            crop_mode=settings.crop_mode if payload.crop_mode is None else payload.crop_mode,
+        try:
+            decode_started = time.perf_counter()
+            image_path = None
+            if image_bytes is None and payload.image_base64:
+                image_bytes = await asyncio.to_thread(decode_base64_bytes, payload.image_base64)
+            if image_bytes is not None:
+                decoded, prepared = await _prepare_image(image_bytes, ocr_mode, payload.prompt)
+            elif payload.image_path:
+                image_path = _resolve_shared_image_path(payload.image_path)
+                decoded, prepared = await _prepare_image(str(image_path), ocr_mode, payload.prompt)
+            if decoded is not None:
+                metrics.observe_stage("image_decode_wait", time.perf_counter() - decode_started)
+                _record_decode(decoded)
+                with metrics.stage_timer("mode_select"):
+                    if use_cache and image_bytes is not None:
+                        image_digest = await asyncio.to_thread(OcrResultCache.digest_bytes, image_bytes)
+                    elif use_cache and image_path is not None:
+                        image_digest = await asyncio.to_thread(OcrResultCache.digest_file, image_path)
+                    decision = await _decide_mode(ocr_mode, decoded.image, decoded.original_size, prepared)
+            else:
+                # 纯文本请求：无需选择模式，也没有视觉 token
+                mode = ocr_mode or settings.default_ocr_mode()
+                decision = ModeDecision(mode_name(mode), mode, 0)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid image payload: {exc}") from exc
+
+        try:
+            result = await _run_until_disconnect(
+                request,
+                _infer_with_cache(
+                    inference_service,
+                    image_digest,
+                    prompt=payload.prompt,
+                    mode=decision.mode,
+                    priority=Priority.PDF_PAGE,
+                    task_key=payload.task_id,
+                    image_dims=decoded.original_size if decoded is not None else None,
+                    deadline=deadline,
+                    image_data=prepared or (decoded.image if decoded is not None else None),
+                    timeout=settings.pdf_worker_timeout_seconds,
+                ),
+            )
+        except (TimeoutError, ClientDisconnected, AdmissionRejected) as exc:
+            if payload.task_id:
+                metrics.PDF_PAGES.inc(status=str(_error_status(exc)))
+            raise HTTPException(
+                status_code=_error_status(exc),
+                detail=str(exc) or type(exc).__name__,
+                headers=_error_headers(exc),
+            ) from exc
+
+        if payload.task_id:
+            metrics.PDF_PAGES.inc(status="truncated" if result.truncated else "ok")
+        return InternalInferResponse(
+            text=result.text,
+            num_tokens=result.num_tokens,
+            truncated=result.truncated,
+            tokens_saved=result.tokens_saved,
+            mode=decision.name,
+            vision_tokens=decision.vision_tokens,
+            decode=DecodeStats(**decoded.stats()) if decoded is not None else None,
         )
 
-        return InternalInferResponse(text=raw_text)
-
     finally:
-        if image_data is not None:
+        if decoded is not None:
             try:
-                image_data.close()
+                decoded.close()
             except Exception:
                 pass
 
 
+@router.get("/internal/stats")
+async def internal_stats(
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+) -> dict[str, Any]:
+    _check_internal_token(token)
+    stats: dict[str, Any] = {
+        "cache": _result_cache.stats(),
+        "admission": _admission.stats(),
+        "preprocess": _preprocessor.describe(),
+    }
+    if _inference_service is not None:
+        stats["engine"] = {
+            "inflight_requests": len(_inference_service.inflight_request_ids()),
+            **_inference_service.stats.to_dict(),
+        }
+        stats["replicas"] = _inference_service.describe()
+    return stats
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus 文本格式指标；与 /health 一样无需内部令牌"""
+    cache_stats = _result_cache.stats()
+    metrics.CACHE_REQUESTS.set(cache_stats["memory_hits"], result="memory_hit")
+    metrics.CACHE_REQUESTS.set(cache_stats["disk_hits"], result="disk_hit")
+    metrics.CACHE_REQUESTS.set(cache_stats["misses"], result="miss")
+    metrics.CACHE_REQUESTS.set(cache_stats["bypassed"], result="bypass")
+    admission_stats = _admission.stats()
+    for priority, class_stats in admission_stats["classes"].items():
+        metrics.ADMISSION_QUEUED.set(class_stats["queued"], priority=priority)
+    inflight = len(_inference_service.inflight_request_ids()) if _inference_service is not None else 0
+    metrics.INFLIGHT_REQUESTS.set(inflight)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get("/internal/replicas")
+async def list_replicas(
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+    inference_service: EnginePool = Depends(get_inference_service),
+) -> list[dict[str, Any]]:
+    _check_internal_token(token)
+    return await inference_service.check_health()
+
+
+@router.post("/internal/replicas/{replica_id}/{action}")
+async def manage_replica(
+    replica_id: int,
+    action: str,
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+    inference_service: EnginePool = Depends(get_inference_service),
+) -> dict[str, Any]:
+    """副本运维：drain 停止路由并等待在途请求完成，resume 恢复路由，restart 排空后重建"""
+    _check_internal_token(token)
+    try:
+        if action == "drain":
+            drained = await inference_service.drain(
+                replica_id, timeout=settings.engine_drain_timeout_seconds
+            )
+        elif action == "resume":
+            inference_service.resume(replica_id)
+            drained = None
+        elif action == "restart":
+            await inference_service.restart(
+                replica_id, drain_timeout=settings.engine_drain_timeout_seconds
+            )
+            drained = None
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown replica action: {action}")
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown replica: {replica_id}") from exc
+    replica = inference_service.describe()[replica_id]
+    return {**replica, **({"drained": drained} if drained is not None else {})}
+
+
+@router.post("/internal/engine/reconfigure")
+async def reconfigure_engine(
+    payload: EngineReconfigureRequest,
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+    inference_service: EnginePool = Depends(get_inference_service),
+) -> dict[str, Any]:
+    """
+    不重启进程修改引擎参数或切换模型：逐个副本构建新引擎，预热完成后切换流量，旧引擎排空后卸载。
+    仅修改 ocr_mode 时不重建引擎。参数在替换任何副本前校验；某个副本失败时已切换的副本恢复旧配置，
+    响应（含失败时的 detail）的 swaps 给出每个副本的结果。
+    """
+    _check_internal_token(token)
+    if payload.ocr_mode is not None:
+        name = payload.ocr_mode.strip().lower()
+        if name != AUTO_MODE and name not in OCR_MODES:
+            raise HTTPException(status_code=400, detail=f"Unknown OCR mode '{payload.ocr_mode}'")
+
+    overrides = payload.model_dump(exclude_none=True, exclude={"ocr_mode", "strategy"})
+    if overrides:
+        try:
+            inference_service.validate_reconfigure(overrides, payload.strategy)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if inference_service.reconfiguring:
+            raise HTTPException(status_code=409, detail="Engine reconfiguration already in progress")
+
+    previous_mode = settings.ocr_mode
+    if payload.ocr_mode is not None:
+        # 默认模式影响预热计划，需在构建新引擎前生效
+        settings.ocr_mode = payload.ocr_mode.strip().lower()
+
+    swaps: list[dict[str, Any]] = []
+    if overrides:
+        if settings.warmup_enabled:
+            overrides["warmup"] = _build_warmup_plan()
+        try:
+            swaps = await inference_service.reconfigure(
+                overrides,
+                strategy=payload.strategy,
+                drain_timeout=settings.engine_drain_timeout_seconds,
+            )
+        except ReconfigureInProgress as exc:
+            settings.ocr_mode = previous_mode
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+        except ValueError as exc:
+            settings.ocr_mode = previous_mode
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        except ReconfigureFailed as exc:
+            settings.ocr_mode = previous_mode
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "error": f"Reconfiguration failed: {exc}",
+                    "swaps": exc.replicas,
+                    "replicas": inference_service.describe(),
+                },
+            ) from exc
+        except Exception as exc:
+            settings.ocr_mode = previous_mode
+            raise HTTPException(
+                status_code=500, detail=f"Reconfiguration failed: {type(exc).__name__}: {exc}"
+            ) from exc
+        # 结果缓存键包含模型路径，切换模型后旧结果自然失效
+        for field_name, value in overrides.items():
+            if field_name != "warmup":
+                setattr(settings, field_name, value)
+    return {
+        "ocr_mode": settings.ocr_mode,
+        "swaps": swaps,
+        "replicas": inference_service.describe(),
+    }
+
+
 @router.post("/api/ocr/pdf", response_model=TaskCreateResponse, status_code=202)
 async def enqueue_pdf_ocr(
     pdf: UploadFile = File(..., description="PDF 文件"),
@@ -279,6 +855,397 @@ async def download_task_file(
     return FileResponse(target, filename=target.name)
 
 
+def _use_result_cache(cache_control: Optional[str]) -> bool:
+    if not settings.ocr_cache_enabled:
+        return False
+    if cache_control and cache_control.strip().lower() in CACHE_BYPASS_VALUES:
+        _result_cache.record_bypass()
+        return False
+    return True
+
+
+def _result_cache_key(
+    image_digest: str,
+    prompt: str,
+    mode: OcrMode,
+    temperature: float = 0.0,
+    max_tokens: int = 8192,
+) -> Optional[str]:
+    # 仅贪心解码的结果是确定的，可以缓存
+    if temperature != 0.0:
+        return None
+    return OcrResultCache.make_key(
+        image_digest, prompt, mode, temperature, max_tokens, settings.model_path
+    )
+
+
+def _estimate_vision_tokens(
+    mode: OcrMode, image_dims: Optional[tuple[Optional[int], Optional[int]]]
+) -> int:
+    """按模式与切片估算视觉 token 数"""
+    width, height = image_dims or (None, None)
+    if not width or not height:
+        # 尺寸未知时按单个全局视图估算
+        width = height = mode.base_size
+    return plan_tiling(width, height, mode).num_image_tokens
+
+
+def _estimate_request_tokens(
+    mode: OcrMode,
+    image_dims: Optional[tuple[Optional[int], Optional[int]]],
+    max_tokens: int = 8192,
+) -> int:
+    """准入成本：视觉 token（按模式与切片估算）+ 最大生成 token"""
+    return _estimate_vision_tokens(mode, image_dims) + max_tokens
+
+
+async def _decide_mode(
+    requested: Optional[OcrMode],
+    source: Optional[str | Image.Image],
+    image_dims: Optional[tuple[Optional[int], Optional[int]]],
+    prepared: Optional[PreparedImage] = None,
+) -> ModeDecision:
+    """
+    确定单张图像的模式；requested 为 None（auto）时由策略按图像信号选择。
+    prepared 表示已在预处理 worker 中完成选择与分词，直接沿用其结果
+    """
+    signals = None
+    if prepared is not None:
+        mode, name, signals = prepared.mode, prepared.mode_name, prepared.signals
+    elif requested is None:
+        try:
+            original_size = image_dims if image_dims and all(image_dims) else None
+            name, signals = await _preprocessor.select_mode(source, _mode_policy, original_size)
+            mode = OCR_MODES[name]
+        except (ValueError, OSError) as exc:
+            # 策略异常不影响识别，退回默认模式
+            print(f"⚠️ 自动模式选择失败，使用默认模式: {exc}")
+            mode = settings.default_ocr_mode()
+            name = mode_name(mode)
+    else:
+        mode, name = requested, mode_name(requested)
+    metrics.MODE_SELECTED.inc(mode=name, auto="true" if requested is None else "false")
+    return ModeDecision(name, mode, _estimate_vision_tokens(mode, image_dims), signals)
+
+
+def _check_admission(priority: Priority) -> None:
+    try:
+        _admission.check_capacity(priority)
+    except AdmissionRejected as exc:
+        _record_rejection("queue_full")
+        raise HTTPException(
+            status_code=_error_status(exc),
+            detail=str(exc),
+            headers=_error_headers(exc),
+        ) from exc
+
+
+async def _infer_with_cache(
+    inference_service: EnginePool,
+    image_digest: Optional[str],
+    *,
+    prompt: str,
+    mode: OcrMode,
+    priority: Priority,
+    task_key: Optional[str] = None,
+    image_dims: Optional[tuple[Optional[int], Optional[int]]] = None,
+    shed: bool = True,
+    deadline: Optional[float] = None,
+    temperature: float = 0.0,
+    max_tokens: int = 8192,
+    timeout: Optional[float] = None,
+    **infer_kwargs: Any,
+) -> InferenceResult:
+    """
+    先查结果缓存，未命中再经准入控制调用引擎并写回；image_digest 为 None 表示不使用缓存。
+    deadline（monotonic）到期时：排队中的请求直接丢弃，运行中的请求被中止，均抛出 DeadlineExceeded。
+    """
+    cache_key = None
+    if image_digest:
+        cache_key = _result_cache_key(image_digest, prompt, mode, temperature, max_tokens)
+    if cache_key:
+        cached_text = await _result_cache.get(cache_key)
+        if cached_text is not None:
+            return InferenceResult(text=cached_text)
+
+    cost = _estimate_request_tokens(mode, image_dims, max_tokens)
+    queued_at = time.perf_counter()
+    try:
+        async with _admission.admit(priority, cost, task_key, shed=shed, deadline=deadline):
+            metrics.observe_stage("queue_wait", time.perf_counter() - queued_at)
+            # 排队之后再按剩余时间收紧引擎超时
+            engine_timeout, deadline_bound = bounded_timeout(timeout, deadline)
+            try:
+                result = await inference_service.infer_result(
+                    token_cost=cost,
+                    prompt=prompt,
+                    base_size=mode.base_size,
+                    image_size=mode.image_size,
+                    crop_mode=mode.crop_mode,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=engine_timeout,
+                    **infer_kwargs,
+                )
+            except TimeoutError as exc:
+                if deadline_bound:
+                    raise DeadlineExceeded("running") from exc
+                _record_rejection("timeout")
+                raise
+    except DeadlineExceeded as exc:
+        _record_rejection(f"deadline_{exc.stage}")
+        raise
+    except AdmissionRejected:
+        _record_rejection("queue_full")
+        raise
+    # 循环截断的结果不写入缓存，保证截断标记与节省 token 的统计真实
+    if cache_key and result.text.strip() and not result.truncated:
+        await _result_cache.put(cache_key, result.text)
+    return result
+
+
+def _request_deadline(request: Request) -> Optional[float]:
+    """解析 X-Deadline / X-Timeout 请求头；到达时已过期直接返回 504"""
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if deadline is not None and deadline <= time.monotonic():
+        _record_rejection("deadline_arrival")
+        raise HTTPException(status_code=504, detail=str(DeadlineExceeded("arrival")))
+    return deadline
+
+
+def _record_rejection(reason: str) -> None:
+    metrics.REJECTIONS.inc(route=metrics.current_route.get(), reason=reason)
+
+
+class ClientDisconnected(Exception):
+    """客户端在推理完成前断开连接"""
+
+
+_DISCONNECT_POLL_SECONDS = 1.0
+
+
+async def _run_until_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """执行推理协程；客户端断开时取消它，由引擎层 abort 对应请求"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+                raise ClientDisconnected("Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _error_status(exc: BaseException) -> int:
+    if isinstance(exc, AdmissionRejected):
+        return 429
+    if isinstance(exc, ClientDisconnected):
+        return 499
+    if isinstance(exc, TimeoutError):
+        return 504
+    if isinstance(exc, NoReplicaAvailable):
+        return 503
+    return 500
+
+
+async def _read_internal_infer_request(
+    request: Request,
+) -> tuple[InternalInferRequest, Optional[bytes]]:
+    """按 Content-Type 解析内部推理请求，返回参数与原始图像字节（JSON 方式或未附带图像时为 None）"""
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    try:
+        if content_type == "application/octet-stream":
+            payload = InternalInferRequest.model_validate(dict(request.query_params))
+            return payload, await request.body() or None
+        if content_type == "multipart/form-data":
+            form = await request.form()
+            fields = {key: value for key, value in form.items() if isinstance(value, str)}
+            payload = InternalInferRequest.model_validate(fields)
+            upload = form.get("image")
+            image_bytes = await upload.read() if upload is not None and not isinstance(upload, str) else None
+            return payload, image_bytes or None
+        return InternalInferRequest.model_validate_json(await request.body()), None
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors()) from exc
+
+
+def _resolve_shared_image_path(image_path: str) -> Path:
+    """将 worker 传来的路径解析到共享存储根目录下，拒绝越界或不存在的文件"""
+    root = _storage.root.resolve()
+    candidate = Path(image_path)
+    if not candidate.is_absolute():
+        candidate = root / candidate
+    resolved = candidate.resolve()
+    if not resolved.is_relative_to(root):
+        raise HTTPException(status_code=403, detail="image_path 不在共享存储目录内")
+    if not resolved.is_file():
+        raise HTTPException(status_code=404, detail=f"图像文件不存在: {image_path}")
+    return resolved
+
+
+def _error_headers(exc: BaseException) -> Optional[dict[str, str]]:
+    if isinstance(exc, AdmissionRejected):
+        return {"Retry-After": str(exc.retry_after)}
+    return None
+
+
+def _check_internal_token(token: Optional[str]) -> None:
+    expected_token = settings.internal_api_token
+    if expected_token and token != expected_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+async def _read_upload(upload: UploadFile) -> bytes:
+    """读取上传内容（Starlette 以 SpooledTemporaryFile 缓存，小文件不落盘）"""
+    with metrics.stage_timer("upload"):
+        try:
+            return await upload.read()
+        finally:
+            await upload.close()
+
+
+async def _decode_upload(
+    data: bytes, requested: Optional[OcrMode], prompt: str
+) -> tuple[DecodedImage, Optional[PreparedImage]]:
+    """在预处理执行器中解码（含 EXIF 旋转与 RGB 转换），无效图像返回 400"""
+    # 含执行器排队时间；worker 内的解码耗时由 _record_decode 记为 image_decode
+    with metrics.stage_timer("image_decode_wait"):
+        try:
+            decoded, prepared = await _prepare_image(data, requested, prompt)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+    _record_decode(decoded)
+    return decoded, prepared
+
+
+async def _prepare_image(
+    source: bytes | str, requested: Optional[OcrMode], prompt: str
+) -> tuple[DecodedImage, Optional[PreparedImage]]:
+    """解码；进程池 + v0 时同一次 worker 调用内完成模式选择与分词（命中结果缓存时分词结果不使用）"""
+    return await _preprocessor.prepare(
+        source,
+        _decode_modes(requested),
+        requested,
+        _mode_policy,
+        settings.default_ocr_mode(),
+        settings.model_path,
+        prompt,
+    )
+
+
+def _decode_modes(requested: Optional[OcrMode]) -> Optional[tuple[OcrMode, ...]]:
+    """解码分辨率需要满足的模式：auto 时为全部档位及回退的默认模式；关闭缩小解码时为 None"""
+    if not settings.decode_reduce_enabled:
+        return None
+    if requested is None:
+        return (*OCR_MODES.values(), settings.default_ocr_mode())
+    return (requested,)
+
+
+def _record_decode(decoded: DecodedImage) -> None:
+    metrics.observe_stage("image_decode", decoded.decode_ms / 1000)
+    metrics.DECODE_PEAK_RSS.set(decoded.peak_rss_mb * 1024 * 1024)
+
+
+def _upload_input_path(upload: UploadFile) -> str:
+    # 单图识别不保留输入文件，仅记录来源文件名
+    return f"upload:{upload.filename or 'image'}"
+
+
+async def _collect_batch_entries(uploads: list[UploadFile]) -> list[tuple[str, bytes]]:
+    entries: list[tuple[str, bytes]] = []
+    extract_budget = settings.ocr_batch_max_extract_mb * 1024 * 1024
+    for upload in uploads:
+        data = await upload.read()
+        await upload.close()
+        filename = upload.filename or f"image-{len(entries)}"
+        if ImageUtils.is_zip_upload(upload.filename, upload.content_type):
+            # 解压在线程中进行，条目数与解压大小在读取前按剩余额度检查
+            try:
+                extracted = await asyncio.to_thread(
+                    ImageUtils.extract_zip_images,
+                    data,
+                    max(settings.ocr_batch_max_items - len(entries), 0),
+                    extract_budget,
+                )
+            except zipfile.BadZipFile as exc:
+                raise HTTPException(status_code=400, detail=f"无效的 zip 文件 {filename}: {exc}") from exc
+            except ValueError as exc:
+                raise HTTPException(status_code=413, detail=f"{filename}: {exc}") from exc
+            extract_budget -= sum(len(content) for _, content in extracted)
+            entries.extend(extracted)
+        else:
+            entries.append((filename, data))
+    return entries
+
+
+def _build_image_payload(
+    raw_text: str,
+    orig_w: Optional[int],
+    orig_h: Optional[int],
+    truncated: bool = False,
+    decision: Optional[ModeDecision] = None,
+) -> dict[str, Any]:
+    boxes: list[dict[str, Any]] = []
+    with metrics.stage_timer("parse"):
+        if GroundingParser.has_grounding_tags(raw_text) and orig_w and orig_h:
+            boxes = GroundingParser.parse_detections(raw_text, orig_w, orig_h)
+
+        cleaned_text = GroundingParser.clean_grounding_text(raw_text) or raw_text
+
+    payload: dict[str, Any] = {
+        "text": cleaned_text,
+        "raw_text": raw_text,
+        "boxes": boxes,
+        "truncated": truncated,
+    }
+    if orig_w and orig_h:
+        payload["image_dims"] = {"w": orig_w, "h": orig_h}
+    if decision is not None:
+        payload["mode"] = decision.name
+        payload["vision_tokens"] = decision.vision_tokens
+        if decision.signals is not None:
+            payload["mode_signals"] = decision.signals.to_dict()
+    return payload
+
+
+def _sse_event(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _resolve_ocr_mode(
+    name: Optional[str],
+    base_size: Optional[int] = None,
+    image_size: Optional[int] = None,
+    crop_mode: Optional[bool] = None,
+) -> Optional[OcrMode]:
+    """返回 None 表示 auto：请求显式指定 auto，或未指定任何参数且进程默认为 auto"""
+    if name and name.strip().lower() == AUTO_MODE:
+        return None
+    explicit = name or base_size is not None or image_size is not None or crop_mode is not None
+    if not explicit and settings.default_mode_is_auto():
+        return None
+    try:
+        return resolve_mode(
+            name,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
+            default=settings.default_ocr_mode(),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
 def _task_path(task_id: uuid.UUID, relative: Optional[str]) -> Optional[str]:
     if not relative:
         return None
@@ -312,6 +1279,10 @@ def _build_task_result(task: OcrTask, payload: dict[str, Any]) -> Optional[TaskR
                 raw_text=page.get("raw_text", ""),
                 image_assets=page.get("image_assets", []),
                 boxes=boxes,
+                truncated=bool(page.get("truncated", False)),
+                tokens_saved=int(page.get("tokens_saved", 0) or 0),
+                mode=page.get("mode"),
+                vision_tokens=page.get("vision_tokens"),
             )
         )
 
@@ -376,21 +1347,93 @@ def _build_task_progress(progress_payload: Any) -> Optional[TaskProgress]:
 
 
 async def initialize_service() -> None:
+    """创建引擎池并在后台加载模型，立即返回；加载进度见 startup_state"""
     global _inference_service
 
-    _inference_service = VLLMDirectEngine()
-    await _inference_service.load(
+    loop_detection = None
+    if settings.loop_detect_enabled:
+        loop_detection = LoopDetectionConfig(
+            max_period=settings.loop_detect_max_period,
+            window=settings.loop_detect_window,
+            min_repeats=settings.loop_detect_min_repeats,
+        )
+
+    def engine_factory() -> VLLMDirectEngine:
+        return VLLMDirectEngine(preprocessor=_preprocessor, loop_detection=loop_detection)
+
+    device_groups = settings.replica_device_groups()
+    if len(device_groups) > 1 and not settings.vllm_use_v1:
+        # 进程内的多个 legacy 引擎会落在同一设备并共享并行状态，只保留第一个设备组
+        print(
+            f"⚠️ legacy 引擎在 API 进程内运行，不支持多副本，仅使用设备组 {','.join(device_groups[0]) or 'inherit'}"
+        )
+        device_groups = device_groups[:1]
+    with startup_state.stage("engine_pool"):
+        _inference_service = EnginePool(
+            engine_factory, device_groups, swap_gpu_budget=settings.engine_swap_gpu_budget
+        )
+    startup_state.start_background("model_load", _load_models(_inference_service))
+
+
+async def _load_models(pool: EnginePool) -> None:
+    try:
+        await pool.load(**_engine_load_kwargs())
+    finally:
+        startup_state.timings.update(
+            {f"engine.{name}": value for name, value in pool.load_timings.items()}
+        )
+
+
+def _engine_load_kwargs() -> dict[str, Any]:
+    return dict(
         model_path=settings.model_path,
         tensor_parallel_size=settings.tensor_parallel_size,
         gpu_memory_utilization=settings.gpu_memory_utilization,
         max_model_len=settings.max_model_len,
         enforce_eager=settings.enforce_eager,
         use_v1_engine=settings.vllm_use_v1,
+        no_repeat_ngram_v1=settings.no_repeat_ngram_v1,
+        warmup=_build_warmup_plan() if settings.warmup_enabled else None,
+    )
+
+
+def _build_warmup_plan() -> WarmupPlan:
+    modes: dict[str, OcrMode] = {}
+    for name in (item.strip().lower() for item in settings.warmup_modes.split(",")):
+        if not name:
+            continue
+        if name not in OCR_MODES:
+            print(f"⚠️ 忽略未知的预热模式: {name}")
+            continue
+        modes[name] = OCR_MODES[name]
+    if not modes and settings.default_mode_is_auto():
+        # auto 模式下任何档位都可能被选中
+        modes = dict(OCR_MODES)
+    if not modes:
+        modes["default"] = settings.default_ocr_mode()
+
+    grids: list[tuple[int, int]] = []
+    for item in settings.warmup_grids.split(","):
+        cols, sep, rows = item.strip().lower().partition("x")
+        if not sep or not cols.isdigit() or not rows.isdigit():
+            if item.strip():
+                print(f"⚠️ 忽略无效的预热网格: {item}")
+            continue
+        grids.append((int(cols), int(rows)))
+
+    return WarmupPlan(
+        modes=modes,
+        grids=grids or [(1, 1)],
+        prompt=settings.pdf_prompt,
+        max_tokens=settings.warmup_max_tokens,
     )
 
 
 async def shutdown_service() -> None:
     global _inference_service
+    # 仍在加载时先取消后台任务，再释放已创建的引擎
+    await startup_state.cancel()
     if _inference_service:
         await _inference_service.unload()
         _inference_service = None
+    _preprocessor.shutdown()
@@ -2,9 +2,13 @@
 配置管理模块 - vLLM Direct 专用
 使用 Pydantic Settings 管理所有配置项
 """
+import os
+
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
+from .vllm_models.config import OcrMode, resolve_mode
+
 
 class Settings(BaseSettings):
     """应用配置 - 基于 vLLM Direct Engine"""
@@ -26,6 +30,31 @@ class Settings(BaseSettings):
         alias="TENSOR_PARALLEL_SIZE",
         description="张量并行大小"
     )
+    engine_replicas: int = Field(
+        default=1,
+        alias="ENGINE_REPLICAS",
+        description="引擎副本数；大于 1 时每个副本依次占用 TENSOR_PARALLEL_SIZE 张可见 GPU"
+    )
+    engine_replica_devices: str = Field(
+        default="",
+        alias="ENGINE_REPLICA_DEVICES",
+        description="显式指定每个副本的 GPU（副本间用 ; 分隔，副本内用 , 分隔，如 0;1;2,3），优先于 ENGINE_REPLICAS"
+    )
+    engine_drain_timeout_seconds: float = Field(
+        default=120.0,
+        alias="ENGINE_DRAIN_TIMEOUT_SECONDS",
+        description="重启副本前等待在途请求完成的最长时间，超时后中止剩余请求"
+    )
+    engine_swap_gpu_budget: float = Field(
+        default=0.95,
+        alias="ENGINE_SWAP_GPU_BUDGET",
+        description="热重配时新旧引擎 GPU_MEMORY_UTILIZATION 之和不超过该值才旁路加载，否则先排空旧引擎"
+    )
+    model_ready_wait_seconds: float = Field(
+        default=5.0,
+        alias="MODEL_READY_WAIT_SECONDS",
+        description="模型后台加载期间推理请求的最长等待时间（秒），超时返回 503；0 表示立即返回"
+    )
     gpu_memory_utilization: float = Field(
         default=0.75,
         alias="GPU_MEMORY_UTILIZATION",
@@ -72,6 +101,22 @@ class Settings(BaseSettings):
     # 上传配置
     max_upload_size_mb: int = Field(default=100, alias="MAX_UPLOAD_SIZE_MB")
     
+    ocr_batch_max_items: int = Field(
+        default=500,
+        alias="OCR_BATCH_MAX_ITEMS",
+        description="批量图片识别单次请求的最大图片数（含 zip 内文件）"
+    )
+    ocr_batch_max_extract_mb: int = Field(
+        default=512,
+        alias="OCR_BATCH_MAX_EXTRACT_MB",
+        description="批量图片识别单次请求中 zip 内图片解压后的总大小上限（MB）"
+    )
+    ocr_batch_concurrency: int = Field(
+        default=64,
+        alias="OCR_BATCH_CONCURRENCY",
+        description="批量图片识别同时提交到引擎的请求数上限"
+    )
+
     # DeepSeek OCR 模式配置
     # Tiny: base_size=512, image_size=512, crop_mode=False
     # Small: base_size=640, image_size=640, crop_mode=False
@@ -93,11 +138,131 @@ class Settings(BaseSettings):
         alias="CROP_MODE",
         description="启用裁剪模式（Gundam 模式）"
     )
+    ocr_mode: str | None = Field(
+        default=None,
+        alias="OCR_MODE",
+        description="默认 OCR 模式档位（tiny/small/base/large/gundam/auto），为空时使用上述三项"
+    )
+    ocr_auto_policy: str = Field(
+        default="heuristic",
+        alias="OCR_AUTO_POLICY",
+        description="auto 模式的选择策略：内置名称（heuristic）或 包.模块:类名"
+    )
+    warmup_enabled: bool = Field(
+        default=True,
+        alias="WARMUP_ENABLED",
+        description="模型加载后执行预热，完成前 /health 返回 warming"
+    )
+    warmup_modes: str = Field(
+        default="",
+        alias="WARMUP_MODES",
+        description="需要预热的 OCR 模式档位（逗号分隔），为空时仅预热默认模式"
+    )
+    warmup_grids: str = Field(
+        default="1x1,2x2,2x3,3x2,3x3",
+        alias="WARMUP_GRIDS",
+        description="裁剪模式下预热的代表性切片网格（列x行，逗号分隔）"
+    )
+    warmup_max_tokens: int = Field(
+        default=16,
+        alias="WARMUP_MAX_TOKENS",
+        description="每个预热请求的最大生成 token 数"
+    )
     pdf_max_concurrency: int = Field(
         default=20,
         alias="PDF_MAX_CONCURRENCY",
         description="PDF 页面并发识别数量上限"
     )
+    ocr_cache_enabled: bool = Field(
+        default=True,
+        alias="OCR_CACHE_ENABLED",
+        description="启用 OCR 结果缓存（按图像内容哈希 + 提示词 + 模式 + 采样参数）"
+    )
+    ocr_cache_max_entries: int = Field(
+        default=2048,
+        alias="OCR_CACHE_MAX_ENTRIES",
+        description="内存 LRU 缓存条目上限"
+    )
+    ocr_cache_disk_enabled: bool = Field(
+        default=False,
+        alias="OCR_CACHE_DISK_ENABLED",
+        description="启用磁盘缓存层（STORAGE_DIR/cache/ocr）"
+    )
+    preprocess_executor: str = Field(
+        default="thread",
+        alias="PREPROCESS_EXECUTOR",
+        description="图像预处理执行器类型（thread/process），负责解码、EXIF 与分词"
+    )
+    preprocess_workers: int = Field(
+        default=0,
+        alias="PREPROCESS_WORKERS",
+        description="图像预处理并发数（0 表示按 CPU 自动选择，最多 8）"
+    )
+    preprocess_max_pending: int = Field(
+        default=0,
+        alias="PREPROCESS_MAX_PENDING",
+        description="已提交到预处理执行器但未完成的任务上限，超出时请求在事件循环中等待（0 表示 4 × 并发数）"
+    )
+    preprocess_shm_handoff: bool = Field(
+        default=True,
+        alias="PREPROCESS_SHM_HANDOFF",
+        description="进程池预处理时 pixel_values / images_crop 经共享内存交接，不 pickle 大数组（仅 v0 引擎分词路径）"
+    )
+    preprocess_shm_slots: int = Field(
+        default=0,
+        alias="PREPROCESS_SHM_SLOTS",
+        description="共享内存 slot 数，即在途分词结果上限（0 表示与预处理并发数相同）"
+    )
+    decode_reduce_enabled: bool = Field(
+        default=True,
+        alias="DECODE_REDUCE_ENABLED",
+        description="大图按所选模式可用的最大尺寸缩小解码（JPEG 使用 draft，其他格式整数倍 reduce）"
+    )
+    admission_token_budget: int = Field(
+        default=262144,
+        alias="ADMISSION_TOKEN_BUDGET",
+        description="引擎在途 token 预算（视觉 token + max_tokens 估算值之和），0 表示不限制"
+    )
+    admission_max_queue_depth: int = Field(
+        default=256,
+        alias="ADMISSION_MAX_QUEUE_DEPTH",
+        description="每个优先级的最大排队请求数，超出后返回 429；0 表示不限制"
+    )
+    admission_retry_after_seconds: int = Field(
+        default=2,
+        alias="ADMISSION_RETRY_AFTER_SECONDS",
+        description="429 响应中 Retry-After 的最小值（秒）"
+    )
+    no_repeat_ngram_v1: bool = Field(
+        default=True,
+        alias="NO_REPEAT_NGRAM_V1",
+        description="v1 引擎下注册批量 n-gram 禁止重复 logits 处理器（ngram=30, window=90）"
+    )
+    loop_detect_enabled: bool = Field(
+        default=True,
+        alias="LOOP_DETECT_ENABLED",
+        description="v1 引擎下在线检测重复循环，检测到后中止请求并裁剪重复尾部"
+    )
+    loop_detect_max_period: int = Field(
+        default=128,
+        alias="LOOP_DETECT_MAX_PERIOD",
+        description="可识别的最长重复单元（token）"
+    )
+    loop_detect_window: int = Field(
+        default=512,
+        alias="LOOP_DETECT_WINDOW",
+        description="尾部连续重复达到该 token 数才判定为循环"
+    )
+    loop_detect_min_repeats: int = Field(
+        default=4,
+        alias="LOOP_DETECT_MIN_REPEATS",
+        description="窗口内重复单元的最少重复次数"
+    )
+    inference_timeout_seconds: int = Field(
+        default=600,
+        alias="INFERENCE_TIMEOUT_SECONDS",
+        description="图片识别单次推理超时（秒），超时后中止引擎请求；0 表示不限制"
+    )
     pdf_worker_bin: str = Field(
         default="/usr/local/bin/pdfworker",
         alias="PDF_WORKER_BIN",
@@ -113,6 +278,11 @@ class Settings(BaseSettings):
         alias="PDF_WORKER_TIMEOUT_SECONDS",
         description="Go worker 调用推理接口的超时时间"
     )
+    pdf_worker_transport: str = Field(
+        default="path",
+        alias="PDF_WORKER_TRANSPORT",
+        description="Go worker 向推理接口传图方式：path（共享 STORAGE_DIR 路径）/binary（原始字节）/base64（JSON）"
+    )
     pdf_render_workers: int = Field(
         default=0,
         alias="PDF_RENDER_WORKERS",
@@ -141,6 +311,37 @@ class Settings(BaseSettings):
         description="Worker 复用 API vLLM 引擎的内部推理地址"
     )
     
+    def default_mode_is_auto(self) -> bool:
+        return (self.ocr_mode or "").strip().lower() == "auto"
+
+    def default_ocr_mode(self) -> OcrMode:
+        """进程默认 OCR 模式（单个请求可通过 mode 参数覆盖）；auto 时为按图像选择前的回退模式"""
+        return resolve_mode(
+            None if self.default_mode_is_auto() else self.ocr_mode,
+            base_size=self.base_size,
+            image_size=self.image_size,
+            crop_mode=self.crop_mode,
+        )
+
+    def replica_device_groups(self) -> list[tuple[str, ...]]:
+        """每个引擎副本绑定的设备组；单副本且未显式指定时返回空组，沿用进程环境"""
+        if self.engine_replica_devices.strip():
+            return [
+                tuple(d.strip() for d in group.split(",") if d.strip())
+                for group in self.engine_replica_devices.split(";")
+                if group.strip()
+            ]
+        replicas = max(self.engine_replicas, 1)
+        if replicas == 1:
+            return [()]
+        visible = [d.strip() for d in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if d.strip()]
+        tp = max(self.tensor_parallel_size, 1)
+        groups = []
+        for replica in range(replicas):
+            indexes = range(replica * tp, (replica + 1) * tp)
+            groups.append(tuple(visible[i] if i < len(visible) else str(i) for i in indexes))
+        return groups
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -8,7 +8,7 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from .config import settings
-from .api.routes import router, initialize_service, shutdown_service
+from .api.routes import router, initialize_service, shutdown_service, startup_state
 from .db.session import init_db
 
 
@@ -22,14 +22,17 @@ async def lifespan(app: FastAPI):
     print(f"📦 Model Path: {settings.model_path}")
     print(f"🎮 GPU Config: TP={settings.tensor_parallel_size}, Memory={settings.gpu_memory_utilization}")
     print(f"📏 Max Model Length: {settings.max_model_len}")
-    print(f"🧩 OCR Mode: base_size={settings.base_size}, image_size={settings.image_size}, crop_mode={settings.crop_mode}")
+    default_mode = settings.default_ocr_mode()
+    print(f"🧩 Default OCR Mode: base_size={default_mode.base_size}, image_size={default_mode.image_size}, crop_mode={default_mode.crop_mode}")
     print(f"🧠 vLLM Engine Mode: {'v1' if settings.vllm_use_v1 else 'legacy'}")
     print("=" * 60)
     
     try:
-        await init_db()
+        with startup_state.stage("db_init"):
+            await init_db()
+        # 模型在后台加载：不依赖模型的接口（PDF 上传、任务查询、下载）立即可用
         await initialize_service()
-        print("✅ Service initialized successfully!")
+        print("✅ Service started, model loading in background")
     except Exception as e:
         print(f"❌ Failed to initialize service: {e}")
         import traceback
@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -27,9 +27,50 @@ class ImageOCRResponse(BaseModel):
     raw_text: str
     boxes: List[BoundingBox] = Field(default_factory=list)
     image_dims: Optional[ImageDimensions] = None
+    truncated: bool = Field(default=False, description="检测到重复循环而提前截断")
+    mode: Optional[str] = Field(default=None, description="使用的 OCR 模式（auto 时为自动选择的结果）")
+    vision_tokens: int = Field(default=0, description="视觉 token 数（估算）")
     task_id: Optional[UUID] = Field(default=None, description="对应的任务 ID（仅同步调用）")
     timing: Optional["TaskTiming"] = None
     duration_ms: Optional[int] = Field(default=None, description="任务耗时（毫秒）")
+    decode: Optional["DecodeStats"] = None
+
+
+class DecodeStats(BaseModel):
+    """图像解码统计：大图按模式可用的最大尺寸缩小解码"""
+
+    decoded_w: int = Field(..., description="解码后的宽度（EXIF 旋转后）")
+    decoded_h: int = Field(..., description="解码后的高度（EXIF 旋转后）")
+    scale: float = Field(default=1.0, description="原图与解码结果的边长比，1 表示按原分辨率解码")
+    decode_ms: float = Field(default=0.0, description="解码耗时（毫秒，含 EXIF 旋转与 RGB 转换）")
+    rss_mb: float = Field(default=0.0, description="解码结束时所在进程的常驻内存（MB）")
+    peak_rss_mb: float = Field(default=0.0, description="所在进程的峰值常驻内存（MB）")
+
+
+class BatchImageItem(BaseModel):
+    index: int = Field(..., description="输入顺序（zip 内文件按压缩包顺序展开）")
+    filename: Optional[str] = None
+    success: bool
+    text: str = ""
+    raw_text: str = ""
+    boxes: List[BoundingBox] = Field(default_factory=list)
+    image_dims: Optional[ImageDimensions] = None
+    truncated: bool = False
+    mode: Optional[str] = None
+    vision_tokens: int = 0
+    decode: Optional[DecodeStats] = None
+    error: Optional[str] = Field(default=None, description="单张图片的失败原因")
+
+
+class BatchImageOCRResponse(BaseModel):
+    success: bool
+    task_id: Optional[UUID] = Field(default=None, description="聚合任务 ID")
+    total: int
+    succeeded: int
+    failed: int
+    items: List[BatchImageItem] = Field(default_factory=list)
+    timing: Optional["TaskTiming"] = None
+    duration_ms: Optional[int] = Field(default=None, description="任务耗时（毫秒）")
 
 
 class TaskCreateResponse(BaseModel):
@@ -42,6 +83,10 @@ class PdfPageResult(BaseModel):
     raw_text: str
     image_assets: List[str]
     boxes: List[BoundingBox]
+    truncated: bool = Field(default=False, description="检测到重复循环而提前截断")
+    tokens_saved: int = Field(default=0, description="循环截断节省的生成 token 数（估算）")
+    mode: Optional[str] = Field(default=None, description="该页使用的 OCR 模式（auto 时为自动选择的结果）")
+    vision_tokens: Optional[int] = Field(default=None, description="该页的视觉 token 数（估算）")
 
 
 class TaskResult(BaseModel):
@@ -84,6 +129,11 @@ class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
     inference_engine: str
+    phase: str = Field(default="idle", description="引擎阶段：idle/loading/warming/ready")
+    warmup: Optional[dict] = Field(default=None, description="预热耗时明细")
+    startup: Optional[dict] = Field(
+        default=None, description="启动阶段与耗时（db_init / engine_pool / model_load 及引擎加载步骤）"
+    )
 
 
 class InternalInferRequest(BaseModel):
@@ -91,13 +141,48 @@ class InternalInferRequest(BaseModel):
     image_base64: Optional[str] = Field(
         default=None, description="Base64 编码的图像数据（JPEG/PNG）"
     )
+    image_path: Optional[str] = Field(
+        default=None, description="共享存储（STORAGE_DIR）内的图像路径，绝对路径或相对根目录"
+    )
+    mode: Optional[str] = Field(
+        default=None,
+        description="OCR 模式档位（auto 按图像自动选择），优先于 base_size/image_size/crop_mode"
+    )
     base_size: Optional[int] = None
     image_size: Optional[int] = None
     crop_mode: Optional[bool] = None
+    task_id: Optional[str] = Field(
+        default=None, description="所属 PDF 任务 ID，用于准入控制的任务间公平调度"
+    )
 
 
 class InternalInferResponse(BaseModel):
     text: str = Field(..., description="模型原始输出文本")
+    num_tokens: int = Field(default=0, description="生成的 token 数（缓存命中时为 0）")
+    truncated: bool = Field(default=False, description="检测到重复循环而提前截断")
+    tokens_saved: int = Field(default=0, description="循环截断节省的生成 token 数（估算）")
+    mode: Optional[str] = Field(default=None, description="使用的 OCR 模式（auto 时为自动选择的结果）")
+    vision_tokens: int = Field(default=0, description="视觉 token 数（估算）")
+    decode: Optional[DecodeStats] = None
+
+
+class EngineReconfigureRequest(BaseModel):
+    """热重配：未给出的字段保持当前值"""
+
+    model_path: Optional[str] = Field(default=None, description="新的模型路径或 HuggingFace 模型名")
+    max_model_len: Optional[int] = Field(default=None, gt=0)
+    gpu_memory_utilization: Optional[float] = Field(default=None, gt=0, le=1)
+    tensor_parallel_size: Optional[int] = Field(default=None, ge=1)
+    enforce_eager: Optional[bool] = None
+    no_repeat_ngram_v1: Optional[bool] = None
+    ocr_mode: Optional[str] = Field(
+        default=None, description="新的默认 OCR 模式（tiny/small/base/large/gundam/auto），无需重建引擎"
+    )
+    strategy: Literal["auto", "side_by_side", "drain"] = Field(
+        default="auto",
+        description="side_by_side 旁路加载并预热后切换；drain 先排空再加载；auto 按显存预算选择",
+    )
 
 
 ImageOCRResponse.model_rebuild()
+BatchImageOCRResponse.model_rebuild()
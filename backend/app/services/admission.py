@@ -0,0 +1,264 @@
+"""
+推理准入控制
+在请求进入 vLLM 引擎之前按优先级排队：交互式图片 > PDF 页面 > 批量图片。
+在途预算以估算 token 数（视觉 token + max_tokens）计量；同一优先级内按任务 ID 轮询，
+避免单个大 PDF 独占引擎；队列超过上限时直接拒绝（由 API 层转换为 429 + Retry-After）。
+携带截止时间的请求在队列中到期时直接丢弃（DeadlineExceeded），不再占用预填充。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Optional
+
+from .deadline import DeadlineExceeded
+
+
+class Priority(IntEnum):
+    """数值越小优先级越高"""
+
+    INTERACTIVE = 0
+    PDF_PAGE = 1
+    BATCH = 2
+
+
+class AdmissionRejected(Exception):
+    """队列已满，请求被卸载"""
+
+    def __init__(self, priority: Priority, retry_after: int) -> None:
+        super().__init__(f"Admission queue for {priority.name.lower()} is full")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    cost: int
+    priority: Priority
+    task_key: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # time.monotonic() 截止时间；None 表示不限制
+    deadline: Optional[float] = None
+
+
+@dataclass
+class _ClassStats:
+    admitted: int = 0
+    rejected: int = 0
+    expired: int = 0
+    wait_seconds_total: float = 0.0
+
+
+class AdmissionController:
+    """基于 token 预算的优先级准入控制器（单事件循环内使用）"""
+
+    def __init__(
+        self,
+        token_budget: int,
+        max_queue_depth: int,
+        retry_after_seconds: int = 1,
+    ) -> None:
+        # token_budget <= 0 表示不限制在途预算，仅做排队统计
+        self.token_budget = token_budget
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = max(retry_after_seconds, 1)
+        # 每个优先级一个按任务 ID 分组的有序字典，字典顺序即轮询顺序
+        self._queues: dict[Priority, OrderedDict[str, Deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._queued = {priority: 0 for priority in Priority}
+        self._stats = {priority: _ClassStats() for priority in Priority}
+        self._inflight_tokens = 0
+        self._inflight_requests = 0
+        # 单个请求占用预算时长的指数滑动平均，用于估算 Retry-After
+        self._hold_seconds_ewma = 0.0
+
+    @contextlib.asynccontextmanager
+    async def admit(
+        self,
+        priority: Priority,
+        cost: int,
+        task_key: Optional[str] = None,
+        shed: bool = True,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[None]:
+        """获取在途预算；退出上下文时归还并唤醒后续等待者
+
+        shed=False 时不受队列深度限制（调用方已在请求入口处做过 check_capacity）。
+        deadline 为 time.monotonic() 截止时间，排队期间到期时抛出 DeadlineExceeded。
+        """
+        cost = max(int(cost), 1)
+        waited = await self._acquire(priority, cost, task_key or "", shed, deadline)
+        started = time.monotonic()
+        class_stats = self._stats[priority]
+        class_stats.admitted += 1
+        class_stats.wait_seconds_total += waited
+        try:
+            yield
+        finally:
+            self._release(cost, time.monotonic() - started)
+
+    def check_capacity(self, priority: Priority) -> None:
+        """队列已满时立即拒绝，用于在开始流式响应或批量任务前提前卸载"""
+        if self.max_queue_depth > 0 and self._queued[priority] >= self.max_queue_depth:
+            self._stats[priority].rejected += 1
+            raise AdmissionRejected(priority, self._estimate_retry_after(priority))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "inflight_tokens": self._inflight_tokens,
+            "inflight_requests": self._inflight_requests,
+            "max_queue_depth": self.max_queue_depth,
+            "classes": {
+                priority.name.lower(): {
+                    "queued": self._queued[priority],
+                    "admitted": self._stats[priority].admitted,
+                    "rejected": self._stats[priority].rejected,
+                    "expired": self._stats[priority].expired,
+                    "avg_wait_ms": round(
+                        self._stats[priority].wait_seconds_total * 1000
+                        / self._stats[priority].admitted,
+                        2,
+                    ) if self._stats[priority].admitted else 0.0,
+                }
+                for priority in Priority
+            },
+        }
+
+    async def _acquire(
+        self,
+        priority: Priority,
+        cost: int,
+        task_key: str,
+        shed: bool,
+        deadline: Optional[float] = None,
+    ) -> float:
+        if deadline is not None and deadline <= time.monotonic():
+            self._stats[priority].expired += 1
+            raise DeadlineExceeded("queue")
+        if not self._has_waiters_at_or_above(priority) and self._fits(cost):
+            self._take(cost)
+            return 0.0
+
+        if shed:
+            self.check_capacity(priority)
+
+        waiter = _Waiter(
+            cost=cost,
+            priority=priority,
+            task_key=task_key,
+            future=asyncio.get_running_loop().create_future(),
+            deadline=deadline,
+        )
+        self._queues[priority].setdefault(task_key, deque()).append(waiter)
+        self._queued[priority] += 1
+        timer = None
+        if deadline is not None:
+            timer = asyncio.get_running_loop().call_later(
+                deadline - time.monotonic(), self._expire, waiter
+            )
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # 已被放行但调用方在拿到预算前被取消，归还预算
+                self._release(cost, None)
+            else:
+                self._remove_waiter(waiter)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return time.monotonic() - waiter.enqueued_at
+
+    def _expire(self, waiter: _Waiter) -> None:
+        """排队中的请求到期：移出队列并通知调用方"""
+        if waiter.future.done():
+            return
+        self._stats[waiter.priority].expired += 1
+        waiter.future.set_exception(DeadlineExceeded("queue"))
+        self._remove_waiter(waiter)
+
+    def _drop_expired(self, waiter: _Waiter) -> None:
+        """在 _dispatch 内丢弃已到期的队首请求（不递归触发 _dispatch）"""
+        queue = self._queues[waiter.priority]
+        waiters = queue[waiter.task_key]
+        waiters.popleft()
+        self._queued[waiter.priority] -= 1
+        if not waiters:
+            queue.pop(waiter.task_key)
+        self._stats[waiter.priority].expired += 1
+        waiter.future.set_exception(DeadlineExceeded("queue"))
+
+    def _release(self, cost: int, held_seconds: Optional[float]) -> None:
+        self._inflight_tokens -= cost
+        self._inflight_requests -= 1
+        if held_seconds is not None:
+            if self._hold_seconds_ewma == 0.0:
+                self._hold_seconds_ewma = held_seconds
+            else:
+                self._hold_seconds_ewma = 0.8 * self._hold_seconds_ewma + 0.2 * held_seconds
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """严格按优先级放行；同一优先级内在任务之间轮询"""
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue:
+                task_key, waiters = next(iter(queue.items()))
+                waiter = waiters[0]
+                if waiter.deadline is not None and waiter.deadline <= time.monotonic():
+                    # 定时器尚未触发但已到期，直接丢弃而不是放行
+                    self._drop_expired(waiter)
+                    continue
+                if not self._fits(waiter.cost):
+                    # 高优先级请求在等预算时，不让低优先级插队
+                    return
+                waiters.popleft()
+                self._queued[priority] -= 1
+                # 被服务的任务移到队尾，实现任务间轮询
+                queue.pop(task_key)
+                if waiters:
+                    queue[task_key] = waiters
+                self._take(waiter.cost)
+                waiter.future.set_result(None)
+
+    def _fits(self, cost: int) -> bool:
+        if self.token_budget <= 0 or self._inflight_requests == 0:
+            # 空闲时总是放行，保证超出预算的单个大请求也能执行
+            return True
+        return self._inflight_tokens + cost <= self.token_budget
+
+    def _take(self, cost: int) -> None:
+        self._inflight_tokens += cost
+        self._inflight_requests += 1
+
+    def _has_waiters_at_or_above(self, priority: Priority) -> bool:
+        return any(self._queued[p] for p in Priority if p <= priority)
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.task_key)
+        if waiters is None:
+            return
+        with contextlib.suppress(ValueError):
+            waiters.remove(waiter)
+            self._queued[waiter.priority] -= 1
+        if not waiters:
+            queue.pop(waiter.task_key, None)
+        # 队首被移除后，后面的请求可能已经可以放行
+        self._dispatch()
+
+    def _estimate_retry_after(self, priority: Priority) -> int:
+        ahead = sum(self._queued[p] for p in Priority if p <= priority)
+        if self._hold_seconds_ewma <= 0.0 or self._inflight_requests == 0:
+            return self.retry_after_seconds
+        drain_seconds = self._hold_seconds_ewma * ahead / self._inflight_requests
+        return max(self.retry_after_seconds, math.ceil(drain_seconds))
@@ -0,0 +1,61 @@
+"""
+请求截止时间
+调用方通过 X-Deadline（Unix 时间戳，秒）或 X-Timeout（相对秒数）声明愿意等待的时间。
+截止时间统一换算为 time.monotonic() 上的绝对值：排队中已过期的请求在预填充前丢弃，
+运行中的请求以剩余时间作为引擎超时，到期即中止，不再为已放弃的调用方生成。
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Mapping, Optional
+
+DEADLINE_HEADER = "X-Deadline"
+TIMEOUT_HEADER = "X-Timeout"
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求已超过调用方的截止时间；stage 为 arrival / queue / running"""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"Request deadline exceeded ({stage})")
+        self.stage = stage
+
+
+def parse_deadline(headers: Mapping[str, str]) -> Optional[float]:
+    """解析请求头，返回 monotonic 截止时间；两者都给出时取较早者，格式错误抛出 ValueError"""
+    now = time.monotonic()
+    deadlines = []
+    timeout = headers.get(TIMEOUT_HEADER)
+    if timeout:
+        deadlines.append(now + _parse_seconds(TIMEOUT_HEADER, timeout))
+    deadline = headers.get(DEADLINE_HEADER)
+    if deadline:
+        # 墙钟时间戳换算到 monotonic，避免处理过程中系统时间被调整
+        deadlines.append(now + _parse_seconds(DEADLINE_HEADER, deadline) - time.time())
+    return min(deadlines) if deadlines else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded_timeout(timeout: Optional[float], deadline: Optional[float]) -> tuple[Optional[float], bool]:
+    """合并配置的超时与截止时间，返回 (超时秒数, 是否由截止时间决定)；超时 <= 0 表示不限制"""
+    left = remaining(deadline)
+    if left is None:
+        return timeout, False
+    if timeout and 0 < timeout <= left:
+        return timeout, False
+    # 引擎把 <= 0 视为不限制，已到期时给一个极小的正值使其立即超时
+    return max(left, 0.001), True
+
+
+def _parse_seconds(name: str, value: str) -> float:
+    try:
+        seconds = float(value)
+    except ValueError as exc:
+        raise ValueError(f"Invalid {name} header: {value!r}") from exc
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid {name} header: {value!r}")
+    return seconds
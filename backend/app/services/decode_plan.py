@@ -0,0 +1,150 @@
+"""
+按模式规划解码分辨率
+手机照片与 600 DPI 扫描件边长可达 4000–8000 像素，而模型最多使用 3×640 的切片与 1024 的全局视图。
+解码前先读取文件头中的尺寸与 EXIF 方向，按候选模式（auto 时为全部档位）计算可用的最大尺寸：
+JPEG 通过 draft() 在 DCT 阶段按 1/2、1/4、1/8 直接缩小解码，其他格式解码后以整数倍 reduce()，
+再做 EXIF 旋转与 RGB 转换。检测框坐标与响应中的 image_dims 仍以原图尺寸为准。
+"""
+from __future__ import annotations
+
+import io
+import math
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence, Union
+
+from PIL import Image
+
+from ..vllm_models.config import OcrMode
+from ..vllm_models.process.tiling import plan_tiling
+
+EXIF_ORIENTATION = 0x0112
+# EXIF 方向 -> 转置操作（与 ImageOps.exif_transpose 一致）
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# reduce() 支持的模式，其余模式先转换为 RGB
+REDUCIBLE_MODES = {"RGB", "RGBA", "L", "LA"}
+
+
+@dataclass
+class DecodedImage:
+    # EXIF 旋转后的 RGB 图像，可能小于原图；在 worker 内已分词时为 None（见 preprocess.prepare_image）
+    image: Optional[Image.Image]
+    # EXIF 旋转后的原图 (宽, 高)
+    original_size: tuple[int, int]
+    decode_ms: float
+    # 解码结束时所在进程的常驻内存与峰值（MB）
+    rss_mb: float
+    peak_rss_mb: float
+    # 解码结果 (宽, 高)，默认取自 image
+    size: tuple[int, int] = (0, 0)
+
+    def __post_init__(self) -> None:
+        if self.image is not None:
+            self.size = self.image.size
+
+    @property
+    def scale(self) -> float:
+        """原图与解码结果的边长比（1 表示按原分辨率解码）"""
+        return round(self.original_size[0] / max(self.size[0], 1), 3)
+
+    def close(self) -> None:
+        if self.image is not None:
+            self.image.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "decoded_w": self.size[0],
+            "decoded_h": self.size[1],
+            "scale": self.scale,
+            "decode_ms": round(self.decode_ms, 1),
+            "rss_mb": round(self.rss_mb, 1),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+        }
+
+
+def required_size(width: int, height: int, modes: Sequence[OcrMode]) -> tuple[int, int]:
+    """候选模式下处理器会用到的最大 (宽, 高)，不超过原图"""
+    need_w = need_h = 1
+    for mode in modes:
+        plan = plan_tiling(width, height, mode)
+        if plan.resize_to is not None:
+            need_w, need_h = max(need_w, plan.resize_to[0]), max(need_h, plan.resize_to[1])
+        if not mode.crop_mode and mode.image_size <= 640:
+            # tokenize_with_images 先把整图缩放为 image_size 的正方形
+            need_w, need_h = max(need_w, mode.image_size), max(need_h, mode.image_size)
+        # 全局视图按长边缩放到 base_size
+        scale = mode.base_size / max(width, height)
+        need_w = max(need_w, math.ceil(width * scale))
+        need_h = max(need_h, math.ceil(height * scale))
+    return min(need_w, width), min(need_h, height)
+
+
+def decode_image(source: Union[bytes, str], modes: Optional[Sequence[OcrMode]] = None) -> DecodedImage:
+    """
+    解码字节或文件路径；给定 modes 时按其可用的最大尺寸缩小解码，否则按原分辨率解码
+
+    Raises:
+        ValueError: 数据无法解码为图像
+    """
+    started = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+            swapped = orientation in (5, 6, 7, 8)
+            width, height = img.size
+            original_size = (height, width) if swapped else (width, height)
+
+            target = None
+            if modes:
+                need_w, need_h = required_size(*original_size, modes)
+                # 目标尺寸换回文件存储方向
+                target = (need_h, need_w) if swapped else (need_w, need_h)
+                # JPEG：按 DCT 缩放直接解码到不小于目标的尺寸；其他格式无效果
+                img.draft("RGB", target)
+
+            image = img
+            if image.mode not in REDUCIBLE_MODES:
+                image = image.convert("RGB")
+            if target is not None:
+                factor = min(image.width // target[0], image.height // target[1])
+                if factor >= 2:
+                    image = image.reduce(factor)
+            transpose = ORIENTATION_TRANSPOSE.get(orientation)
+            if transpose is not None:
+                image = image.transpose(transpose)
+            if image is img or image.mode != "RGB":
+                # 同时与即将关闭的文件对象脱离
+                image = image.convert("RGB")
+    except Exception as exc:
+        raise ValueError(f"无法解码图像: {exc}") from exc
+    rss_mb, peak_rss_mb = _memory_usage_mb()
+    return DecodedImage(
+        image=image,
+        original_size=original_size,
+        decode_ms=(time.perf_counter() - started) * 1000,
+        rss_mb=rss_mb,
+        peak_rss_mb=peak_rss_mb,
+    )
+
+
+def _memory_usage_mb() -> tuple[float, float]:
+    """当前进程的 (常驻内存, 峰值常驻内存)，单位 MB"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以 KB 为单位，macOS 以字节为单位
+        peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+        return peak_mb, peak_mb
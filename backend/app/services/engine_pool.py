@@ -0,0 +1,511 @@
+"""
+推理引擎副本池
+在多 GPU 机器上启动 K 个引擎副本，每个副本绑定独立的设备组（CUDA_VISIBLE_DEVICES），
+按在途 token 数把请求路由到负载最低的副本；单个副本可排空（drain）、恢复与重启，
+引擎后台进程异常时自动摘除。引擎由工厂函数创建，测试时可注入 CPU 上的桩引擎。
+
+热重配（reconfigure）逐个副本替换引擎：显存允许时在旧引擎旁加载并预热新引擎后原子切换，
+否则先排空旧引擎再加载；旧引擎在其在途请求完成后卸载。某个副本失败时，已切换的副本重新应用旧参数，
+保证所有副本使用同一配置。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Sequence
+
+from .vllm_direct_engine import EngineStats, InferenceResult, StreamChunk
+
+# 返回一个未加载的引擎实例（需实现 VLLMDirectEngine 的 load/unload/infer_* 等接口）
+EngineFactory = Callable[[], Any]
+
+# 请求本身的错误不代表副本故障，不触发健康检查
+_REQUEST_ERRORS = (TimeoutError, ValueError, asyncio.CancelledError)
+
+SWAP_STRATEGIES = ("auto", "side_by_side", "drain")
+
+# 对外展示的引擎配置项（不含预热计划等对象）
+_CONFIG_KEYS = (
+    "model_path",
+    "max_model_len",
+    "gpu_memory_utilization",
+    "tensor_parallel_size",
+    "enforce_eager",
+    "use_v1_engine",
+    "no_repeat_ngram_v1",
+)
+
+
+class NoReplicaAvailable(RuntimeError):
+    """没有可接收请求的副本（均在加载、排空或故障中）"""
+
+
+class ReconfigureInProgress(RuntimeError):
+    """已有热重配在进行中"""
+
+
+class ReconfigureFailed(RuntimeError):
+    """热重配失败；replicas 为每个副本的结果（applied / failed / rolled_back / rollback_failed / skipped）"""
+
+    def __init__(self, message: str, replicas: list[dict[str, Any]]) -> None:
+        super().__init__(message)
+        self.replicas = replicas
+
+
+@dataclass
+class EngineReplica:
+    replica_id: int
+    devices: tuple[str, ...]
+    engine: Any
+    draining: bool = False
+    healthy: bool = True
+    inflight_tokens: int = 0
+    inflight_requests: int = 0
+    dispatched: int = 0
+    restarts: int = 0
+    last_error: Optional[str] = None
+    # 当前引擎的加载参数，重启与热重配以此为基础
+    load_kwargs: dict[str, Any] = field(default_factory=dict)
+    # 正在旁路加载的新引擎（side_by_side 切换前）
+    pending: Optional[str] = None
+    idle: asyncio.Event = field(default_factory=asyncio.Event)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def __post_init__(self) -> None:
+        self.idle.set()
+
+    @property
+    def state(self) -> str:
+        if not self.healthy:
+            return "unhealthy"
+        if self.draining:
+            return "draining"
+        return self.engine.phase
+
+    def accepts_requests(self, require_ready: bool) -> bool:
+        if not self.healthy or self.draining or not self.engine.is_loaded():
+            return False
+        return self.engine.is_ready() or not require_ready
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "replica_id": self.replica_id,
+            "devices": list(self.devices),
+            "state": self.state,
+            "config": {key: self.load_kwargs[key] for key in _CONFIG_KEYS if key in self.load_kwargs},
+            "pending": self.pending,
+            "inflight_tokens": self.inflight_tokens,
+            "inflight_requests": self.inflight_requests,
+            "dispatched": self.dispatched,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
+
+
+@contextlib.contextmanager
+def _pinned_devices(devices: Sequence[str]) -> Iterator[None]:
+    """创建引擎期间临时设置 CUDA_VISIBLE_DEVICES，由 v1 引擎的后台进程继承"""
+    if not devices:
+        yield
+        return
+    previous = os.environ.get("CUDA_VISIBLE_DEVICES")
+    os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(devices)
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+        else:
+            os.environ["CUDA_VISIBLE_DEVICES"] = previous
+
+
+def _both_v1(current: dict[str, Any], incoming: dict[str, Any]) -> bool:
+    """新旧引擎都使用 v1（EngineCore 在独立进程）时才能并存；legacy 引擎共享进程内的并行状态"""
+    return bool(current.get("use_v1_engine")) and bool(incoming.get("use_v1_engine"))
+
+
+class EnginePool:
+    """对外提供与 VLLMDirectEngine 相同的推理接口，内部在多个副本之间路由"""
+
+    def __init__(
+        self,
+        engine_factory: EngineFactory,
+        device_groups: Sequence[Sequence[str]],
+        swap_gpu_budget: float = 0.95,
+    ) -> None:
+        if not device_groups:
+            raise ValueError("EnginePool requires at least one replica")
+        self._factory = engine_factory
+        self.replicas = [
+            EngineReplica(replica_id=index, devices=tuple(devices), engine=engine_factory())
+            for index, devices in enumerate(device_groups)
+        ]
+        self._load_kwargs: dict[str, Any] = {}
+        # 新旧引擎 gpu_memory_utilization 之和不超过该值时才能并存
+        self.swap_gpu_budget = swap_gpu_budget
+        self._reconfigure_lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def load(self, **kwargs: Any) -> None:
+        """依次加载所有副本；部分副本失败时继续，全部失败才抛出"""
+        self._check_replica_count(kwargs)
+        self._load_kwargs = dict(kwargs)
+        last_error: Optional[BaseException] = None
+        for replica in self.replicas:
+            replica.load_kwargs = dict(kwargs)
+            try:
+                await self._load_replica(replica, replica.engine, replica.load_kwargs)
+            except Exception as exc:
+                last_error = exc
+                replica.healthy = False
+                replica.last_error = f"{type(exc).__name__}: {exc}"
+                print(f"❌ 副本 {replica.replica_id} 加载失败: {exc}")
+        if last_error is not None and not any(r.healthy for r in self.replicas):
+            raise last_error
+
+    async def _load_replica(self, replica: EngineReplica, engine: Any, kwargs: dict[str, Any]) -> None:
+        devices = ",".join(replica.devices) or "inherit"
+        print(f"🧩 加载引擎副本 {replica.replica_id}（devices={devices}）")
+        with _pinned_devices(replica.devices):
+            await engine.load(**kwargs)
+
+    async def unload(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.unload()
+
+    async def drain(self, replica_id: int, timeout: Optional[float] = None) -> bool:
+        """停止向副本路由新请求并等待在途请求完成，返回是否在超时前排空"""
+        replica = self._replica(replica_id)
+        replica.draining = True
+        print(f"🚰 排空副本 {replica_id}，在途 {replica.inflight_requests} 个请求")
+        try:
+            await asyncio.wait_for(replica.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def resume(self, replica_id: int) -> None:
+        self._replica(replica_id).draining = False
+
+    async def restart(self, replica_id: int, drain_timeout: Optional[float] = None) -> None:
+        """排空后重建副本；超时仍未完成的请求会被中止"""
+        replica = self._replica(replica_id)
+        async with replica.lock:
+            if not await self.drain(replica_id, drain_timeout):
+                for request_id in replica.engine.inflight_request_ids():
+                    await replica.engine.abort(request_id, reason="restart")
+            print(f"🔄 重启副本 {replica_id}")
+            with contextlib.suppress(Exception):
+                await replica.engine.unload()
+            replica.engine = self._factory()
+            try:
+                await self._load_replica(replica, replica.engine, replica.load_kwargs)
+            except Exception as exc:
+                replica.healthy = False
+                replica.last_error = f"{type(exc).__name__}: {exc}"
+                raise
+            replica.healthy = True
+            replica.last_error = None
+            replica.draining = False
+            replica.restarts += 1
+
+    @property
+    def reconfiguring(self) -> bool:
+        return self._reconfigure_lock.locked()
+
+    def validate_reconfigure(self, overrides: dict[str, Any], strategy: str = "auto") -> None:
+        """在替换任何副本之前检查参数，不合法时抛出 ValueError"""
+        if strategy not in SWAP_STRATEGIES:
+            raise ValueError(f"Unknown swap strategy '{strategy}', expected one of: {', '.join(SWAP_STRATEGIES)}")
+        unknown = sorted(set(overrides) - set(_CONFIG_KEYS) - {"warmup"})
+        if unknown:
+            raise ValueError(f"Unknown engine options: {', '.join(unknown)}")
+        self._check_replica_count({**self._load_kwargs, **overrides})
+
+    async def reconfigure(
+        self,
+        overrides: dict[str, Any],
+        strategy: str = "auto",
+        drain_timeout: Optional[float] = None,
+    ) -> list[dict[str, Any]]:
+        """
+        按新加载参数逐个替换副本引擎，其余副本继续服务，返回每个副本的结果。
+        strategy：side_by_side 旁路加载后切换；drain 先排空再加载；auto 按显存预算选择。
+        某个副本失败时保留其旧引擎（side_by_side）或回退到旧参数（drain），跳过后续副本，
+        并对已切换的副本重新应用旧参数，最后抛出 ReconfigureFailed。
+        """
+        self.validate_reconfigure(overrides, strategy)
+        if self._reconfigure_lock.locked():
+            raise ReconfigureInProgress("Engine reconfiguration already in progress")
+        async with self._reconfigure_lock:
+            results: list[dict[str, Any]] = [
+                {"replica_id": replica.replica_id, "status": "skipped"} for replica in self.replicas
+            ]
+            applied: list[tuple[EngineReplica, dict[str, Any]]] = []
+            for replica, result in zip(self.replicas, results):
+                previous = replica.load_kwargs
+                try:
+                    result.update(
+                        await self._reconfigure_replica(replica, {**previous, **overrides}, strategy, drain_timeout)
+                    )
+                except Exception as exc:
+                    result.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+                    await self._roll_back(applied, results, strategy, drain_timeout)
+                    raise ReconfigureFailed(
+                        f"Replica {replica.replica_id} failed: {type(exc).__name__}: {exc}", results
+                    ) from exc
+                result["status"] = "applied"
+                applied.append((replica, previous))
+            self._load_kwargs = {**self._load_kwargs, **overrides}
+            return results
+
+    async def _reconfigure_replica(
+        self, replica: EngineReplica, kwargs: dict[str, Any], strategy: str, drain_timeout: Optional[float]
+    ) -> dict[str, Any]:
+        async with replica.lock:
+            used = strategy
+            if used == "auto":
+                used = "side_by_side" if self._fits_side_by_side(replica, kwargs) else "drain"
+            elif used == "side_by_side" and not _both_v1(replica.load_kwargs, kwargs):
+                print("⚠️ legacy 引擎共享 API 进程内的并行状态，无法新旧并存，改为 drain")
+                used = "drain"
+            print(f"🔁 热重配副本 {replica.replica_id}（{used}）")
+            started = time.perf_counter()
+            if used == "side_by_side":
+                await self._swap_side_by_side(replica, kwargs, drain_timeout)
+            else:
+                await self._swap_after_drain(replica, kwargs, drain_timeout)
+            return {"strategy": used, "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    async def _roll_back(
+        self,
+        applied: list[tuple[EngineReplica, dict[str, Any]]],
+        results: list[dict[str, Any]],
+        strategy: str,
+        drain_timeout: Optional[float],
+    ) -> None:
+        """已切换到新参数的副本重新应用旧参数"""
+        for replica, previous in reversed(applied):
+            result = results[replica.replica_id]
+            print(f"↩️ 副本 {replica.replica_id} 恢复热重配前的配置")
+            try:
+                await self._reconfigure_replica(replica, previous, strategy, drain_timeout)
+                result["status"] = "rolled_back"
+            except Exception as exc:
+                result.update(status="rollback_failed", error=f"{type(exc).__name__}: {exc}")
+
+    def _check_replica_count(self, kwargs: dict[str, Any]) -> None:
+        """legacy 引擎在 API 进程内运行：CUDA_VISIBLE_DEVICES 不按副本生效，且卸载一个副本会拆掉共享的并行状态"""
+        if len(self.replicas) > 1 and not kwargs.get("use_v1_engine"):
+            raise ValueError(
+                f"Legacy (v0) engine supports a single replica, got {len(self.replicas)}; "
+                "enable VLLM_USE_V1 or configure one device group"
+            )
+
+    def _fits_side_by_side(self, replica: EngineReplica, kwargs: dict[str, Any]) -> bool:
+        if not replica.healthy or not replica.engine.is_loaded():
+            return False
+        if not _both_v1(replica.load_kwargs, kwargs):
+            return False
+        current = float(replica.load_kwargs.get("gpu_memory_utilization", 1.0))
+        incoming = float(kwargs.get("gpu_memory_utilization", 1.0))
+        return current + incoming <= self.swap_gpu_budget
+
+    async def _swap_side_by_side(
+        self, replica: EngineReplica, kwargs: dict[str, Any], drain_timeout: Optional[float]
+    ) -> None:
+        engine = self._factory()
+        replica.pending = "loading"
+        try:
+            await self._load_replica(replica, engine, kwargs)
+            replica.pending = "warming"
+            await engine.wait_until_warm()
+        except BaseException:
+            replica.pending = None
+            with contextlib.suppress(Exception):
+                await engine.unload()
+            raise
+        # 原子切换：之后的请求路由到新引擎，已开始的请求在旧引擎上完成
+        old_engine, replica.engine = replica.engine, engine
+        replica.load_kwargs = kwargs
+        replica.pending = None
+        replica.healthy = True
+        replica.last_error = None
+        await self._retire(old_engine, drain_timeout)
+
+    async def _swap_after_drain(
+        self, replica: EngineReplica, kwargs: dict[str, Any], drain_timeout: Optional[float]
+    ) -> None:
+        previous = replica.load_kwargs
+        if not await self.drain(replica.replica_id, drain_timeout):
+            for request_id in replica.engine.inflight_request_ids():
+                await replica.engine.abort(request_id, reason="reconfigure")
+        try:
+            with contextlib.suppress(Exception):
+                await replica.engine.unload()
+            replica.engine = self._factory()
+            try:
+                await self._load_replica(replica, replica.engine, kwargs)
+                replica.load_kwargs = kwargs
+            except Exception as exc:
+                print(f"❌ 副本 {replica.replica_id} 新配置加载失败，回退旧配置: {exc}")
+                with contextlib.suppress(Exception):
+                    await replica.engine.unload()
+                replica.engine = self._factory()
+                try:
+                    await self._load_replica(replica, replica.engine, previous)
+                except Exception as rollback_exc:
+                    replica.healthy = False
+                    replica.last_error = f"{type(rollback_exc).__name__}: {rollback_exc}"
+                raise
+            replica.healthy = True
+            replica.last_error = None
+        finally:
+            replica.draining = False
+        # 预热期间已可接收流量（其余副本就绪时优先路由到它们），预热完成后再处理下一个副本
+        await replica.engine.wait_until_warm()
+
+    async def _retire(self, engine: Any, timeout: Optional[float], poll: float = 0.2) -> None:
+        """等待旧引擎上的在途请求完成（超时后中止），再卸载"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while engine.inflight_request_ids():
+            if deadline is not None and time.monotonic() >= deadline:
+                for request_id in engine.inflight_request_ids():
+                    await engine.abort(request_id, reason="reconfigure")
+                break
+            await asyncio.sleep(poll)
+        await engine.unload()
+
+    async def check_health(self) -> list[dict[str, Any]]:
+        """探测所有副本的引擎后台进程，返回副本状态"""
+        for replica in self.replicas:
+            if replica.engine.is_loaded():
+                await self._check_replica(replica)
+        return self.describe()
+
+    async def _check_replica(self, replica: EngineReplica) -> None:
+        check = getattr(replica.engine, "check_health", None)
+        healthy = await check() if check is not None else True
+        if not healthy and replica.healthy:
+            print(f"⚠️ 副本 {replica.replica_id} 健康检查失败，停止路由")
+        replica.healthy = healthy
+
+    # ------------------------------------------------------------------
+    # 与 VLLMDirectEngine 兼容的状态接口
+    # ------------------------------------------------------------------
+
+    def is_loaded(self) -> bool:
+        return any(r.engine.is_loaded() for r in self.replicas)
+
+    def is_ready(self) -> bool:
+        return any(r.accepts_requests(require_ready=True) for r in self.replicas)
+
+    @property
+    def phase(self) -> str:
+        if self.is_ready():
+            return "ready"
+        phases = {r.engine.phase for r in self.replicas if r.healthy}
+        for phase in ("warming", "loading"):
+            if phase in phases:
+                return phase
+        return "idle"
+
+    @property
+    def warmup_report(self) -> Any:
+        for replica in self.replicas:
+            if replica.engine.warmup_report is not None:
+                return replica.engine.warmup_report
+        return None
+
+    @property
+    def load_timings(self) -> dict[str, float]:
+        for replica in self.replicas:
+            timings = getattr(replica.engine, "load_timings", None)
+            if timings:
+                return dict(timings)
+        return {}
+
+    @property
+    def stats(self) -> EngineStats:
+        merged = EngineStats()
+        for replica in self.replicas:
+            merged.merge(replica.engine.stats)
+        return merged
+
+    def inflight_request_ids(self) -> list[str]:
+        return [rid for r in self.replicas for rid in r.engine.inflight_request_ids()]
+
+    async def abort(self, request_id: str, reason: str = "manual") -> bool:
+        for replica in self.replicas:
+            if await replica.engine.abort(request_id, reason):
+                return True
+        return False
+
+    def describe(self) -> list[dict[str, Any]]:
+        return [replica.to_dict() for replica in self.replicas]
+
+    # ------------------------------------------------------------------
+    # 推理
+    # ------------------------------------------------------------------
+
+    def _replica(self, replica_id: int) -> EngineReplica:
+        if not 0 <= replica_id < len(self.replicas):
+            raise KeyError(f"Unknown replica: {replica_id}")
+        return self.replicas[replica_id]
+
+    def _select(self) -> EngineReplica:
+        """优先选择已预热的副本；都在预热时退回到已加载的副本"""
+        for require_ready in (True, False):
+            candidates = [r for r in self.replicas if r.accepts_requests(require_ready)]
+            if candidates:
+                return min(
+                    candidates,
+                    key=lambda r: (r.inflight_tokens, r.inflight_requests, r.dispatched),
+                )
+        raise NoReplicaAvailable("No engine replica available")
+
+    @contextlib.asynccontextmanager
+    async def _lease(self, cost: int) -> AsyncIterator[EngineReplica]:
+        replica = self._select()
+        replica.inflight_tokens += cost
+        replica.inflight_requests += 1
+        replica.dispatched += 1
+        replica.idle.clear()
+        try:
+            yield replica
+        except _REQUEST_ERRORS:
+            raise
+        except Exception as exc:
+            replica.last_error = f"{type(exc).__name__}: {exc}"
+            await self._check_replica(replica)
+            raise
+        finally:
+            replica.inflight_tokens -= cost
+            replica.inflight_requests -= 1
+            if replica.inflight_requests == 0:
+                replica.idle.set()
+
+    async def infer_stream(
+        self, *args: Any, token_cost: Optional[int] = None, **kwargs: Any
+    ) -> AsyncIterator[StreamChunk]:
+        """token_cost 为调用方估算的请求 token 数（视觉 token + max_tokens），缺省按 max_tokens 计"""
+        cost = token_cost if token_cost is not None else kwargs.get("max_tokens", 8192)
+        async with self._lease(cost) as replica:
+            async for chunk in replica.engine.infer_stream(*args, **kwargs):
+                yield chunk
+
+    async def infer_result(
+        self, *args: Any, token_cost: Optional[int] = None, **kwargs: Any
+    ) -> InferenceResult:
+        cost = token_cost if token_cost is not None else kwargs.get("max_tokens", 8192)
+        async with self._lease(cost) as replica:
+            return await replica.engine.infer_result(*args, **kwargs)
+
+    async def infer(self, *args: Any, token_cost: Optional[int] = None, **kwargs: Any) -> str:
+        return (await self.infer_result(*args, token_cost=token_cost, **kwargs)).text
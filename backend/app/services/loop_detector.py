@@ -0,0 +1,72 @@
+"""
+重复循环检测
+n-gram 禁止重复只覆盖 90 个 token 的窗口（且可关闭），个别页面（表格、目录引导点等）
+仍可能陷入更长周期的重复直到 max_tokens。这里在流式输出的 token 序列上在线检测尾部周期性重复，
+由引擎在检测到循环时中止请求并裁剪重复尾部。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class LoopDetectionConfig:
+    """循环检测参数（单位均为 token）"""
+
+    max_period: int = 128
+    window: int = 512
+    min_repeats: int = 4
+    check_interval: int = 32
+
+
+@dataclass(frozen=True)
+class LoopMatch:
+    period: int
+    # 周期性重复区的起点（token 下标）
+    repeat_start: int
+    # 裁剪后保留的 token 数：重复区之前的内容 + 一个重复单元
+    keep_tokens: int
+
+
+class RepetitionDetector:
+    """判断输出尾部 window 个 token 是否为周期 ≤ max_period 的重复"""
+
+    def __init__(self, config: LoopDetectionConfig) -> None:
+        self.config = config
+        # 满足 min_repeats 的最大周期
+        self._max_period = min(config.max_period, config.window // max(config.min_repeats, 1))
+        self._last_checked = 0
+
+    def check(self, token_ids: Sequence[int]) -> Optional[LoopMatch]:
+        """每累计 check_interval 个新 token 检测一次；发现循环时返回匹配信息"""
+        n = len(token_ids)
+        if n < self.config.window or n - self._last_checked < self.config.check_interval:
+            return None
+        self._last_checked = n
+        if self._max_period < 1:
+            return None
+
+        tail = np.asarray(token_ids[-self.config.window:], dtype=np.int64)
+        # 候选周期 p 需满足 tail[-1] == tail[-1 - p]，先整体过滤以减少逐个比较
+        lookback = tail[-1 - self._max_period:-1][::-1]
+        candidates = np.nonzero(lookback == tail[-1])[0] + 1
+        for period in candidates:
+            period = int(period)
+            if np.array_equal(tail[period:], tail[:-period]):
+                return self._locate(token_ids, period)
+        return None
+
+    @staticmethod
+    def _locate(token_ids: Sequence[int], period: int) -> LoopMatch:
+        """向前扩展到整段周期性重复区的起点"""
+        seq = np.asarray(token_ids, dtype=np.int64)
+        mismatches = np.nonzero(seq[period:] != seq[:-period])[0]
+        repeat_start = int(mismatches[-1]) + 1 if mismatches.size else 0
+        return LoopMatch(
+            period=period,
+            repeat_start=repeat_start,
+            keep_tokens=min(repeat_start + period, len(seq)),
+        )
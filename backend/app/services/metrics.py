@@ -0,0 +1,231 @@
+"""
+Prometheus 文本格式指标
+不依赖 prometheus_client：计数器、仪表与直方图在单个事件循环内更新，
+由 /metrics 渲染为 text/plain; version=0.0.4 格式。
+各阶段耗时统一记录到 ocr_stage_seconds{route, stage}，用于区分 CPU / GPU / 数据库瓶颈。
+"""
+from __future__ import annotations
+
+import contextlib
+import math
+import time
+from contextvars import ContextVar
+from typing import Iterator, Optional, Sequence
+
+# 当前请求所属的接口，引擎内的阶段（预处理 / 首 token / 解码）据此打标签
+current_route: ContextVar[str] = ContextVar("ocr_metrics_route", default="other")
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: str) -> None:
+        """导出其他组件已累计的计数（如结果缓存命中数）"""
+        self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 每组标签：[各桶计数..., 总和, 样本数]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets):
+                cumulative += series[index]
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None,
+    ) -> Histogram:
+        return self._register(  # type: ignore[return-value]
+            Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS)
+        )
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ocr_stage_seconds",
+    "Latency of each request stage (observed once per request): upload, image_decode_wait, image_decode, mode_select, preprocess, slot_wait, queue_wait, ttft, decode, parse, db_commit",
+    ("route", "stage"),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "ocr_request_seconds", "End-to-end request latency", ("route", "status")
+)
+VISION_TOKENS = REGISTRY.counter(
+    "ocr_vision_tokens_total", "Estimated vision tokens submitted to the engine", ("route",)
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    "ocr_generated_tokens_total", "Tokens generated by the engine", ("route",)
+)
+DECODE_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ocr_decode_tokens_per_second",
+    "Per-request decode throughput after the first token",
+    ("route",),
+    TOKENS_PER_SECOND_BUCKETS,
+)
+INFLIGHT_REQUESTS = REGISTRY.gauge(
+    "ocr_inflight_requests", "Requests currently running in the engine"
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "ocr_admission_queued_requests", "Requests waiting in the admission queue", ("priority",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "ocr_cache_requests_total", "OCR result cache lookups", ("result",)
+)
+MODE_SELECTED = REGISTRY.counter(
+    "ocr_mode_selected_total", "OCR mode used per image (auto: chosen by the policy)", ("mode", "auto")
+)
+REJECTIONS = REGISTRY.counter(
+    "ocr_rejected_requests_total",
+    "Requests shed or aborted before completion: queue_full, deadline_arrival, deadline_queue, deadline_running, timeout",
+    ("route", "reason"),
+)
+DECODE_PEAK_RSS = REGISTRY.gauge(
+    "ocr_decode_peak_rss_bytes", "Peak RSS of the process that decoded the latest image"
+)
+PREPROCESS_WAITING = REGISTRY.gauge(
+    "ocr_preprocess_waiting_tasks", "Preprocess tasks waiting because the executor is at PREPROCESS_MAX_PENDING"
+)
+PDF_PAGES = REGISTRY.counter(
+    "ocr_pdf_pages_total", "PDF pages processed through /internal/infer", ("status",)
+)
+
+
+def observe_stage(stage: str, seconds: float, route: Optional[str] = None) -> None:
+    STAGE_SECONDS.observe(seconds, route=route or current_route.get(), stage=stage)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, route: Optional[str] = None) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, route)
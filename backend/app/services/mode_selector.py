@@ -0,0 +1,170 @@
+"""
+按图像自动选择 OCR 模式
+全局固定 Gundam 时，400×300 的小票与 A3 密排扫描件都按最多 9 个切片处理，视觉 token 从约 100
+到约 1800 不等。auto 模式根据尺寸、文本行数、墨迹占比与边缘密度等廉价信号，为每张图像选择
+能保证文字可读的最便宜档位（tiny/small/base/large/gundam）。
+
+策略可插拔：实现 select(signals) -> 模式名 的任意对象，通过 OCR_AUTO_POLICY 指定内置名称
+或 "包.模块:类名"。信号计算与策略都在预处理执行器中运行，因此需为模块级可 pickle 对象。
+"""
+from __future__ import annotations
+
+import importlib
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, Protocol, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from ..vllm_models.config import OCR_MODES, OcrMode
+
+AUTO_MODE = "auto"
+CUSTOM_MODE = "custom"
+
+# 计算信号时的缩略图长边，足以分辨 A4 页面上约 60 行正文
+SIGNAL_MAX_SIDE = 1024
+
+
+@dataclass(frozen=True)
+class ImageSignals:
+    width: int
+    height: int
+    # 深色像素占比
+    ink_ratio: float
+    # 强梯度像素占比，文字越密越高
+    edge_density: float
+    # 按行投影估计的文本行数
+    text_lines: int
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class ModeDecision:
+    name: str
+    mode: OcrMode
+    vision_tokens: int
+    signals: Optional[ImageSignals] = None
+
+
+class ModePolicy(Protocol):
+    def select(self, signals: ImageSignals) -> str:
+        """返回 OCR_MODES 中的模式名"""
+
+
+@dataclass(frozen=True)
+class HeuristicModePolicy:
+    """按文本行在模型输入中的像素高度选择最小的足够档位"""
+
+    # 每行文字在模型输入中至少需要的像素高度
+    min_line_pixels: float = 20.0
+    # 低于该边缘密度且行数很少时视为空白或稀疏页面
+    sparse_edge_density: float = 0.01
+    # 需要的分辨率超过最大单视图档位、且文字足够密集时才使用切片
+    crop_edge_density: float = 0.04
+
+    def select(self, signals: ImageSignals) -> str:
+        long_side = max(signals.width, signals.height, 1)
+        if signals.text_lines <= 1 and signals.edge_density < self.sparse_edge_density:
+            return "tiny"
+
+        # 模型把长边缩放到 base_size：行高 = height / lines * base_size / long_side
+        required = (
+            signals.text_lines * self.min_line_pixels * long_side / max(signals.height, 1)
+        )
+        # 不需要超过原图分辨率
+        required = min(required, long_side)
+        for name in ("tiny", "small", "base", "large"):
+            if OCR_MODES[name].base_size >= required:
+                return name
+        if signals.edge_density >= self.crop_edge_density:
+            return "gundam"
+        return "large"
+
+
+MODE_POLICIES: dict[str, type] = {"heuristic": HeuristicModePolicy}
+
+
+def load_mode_policy(spec: str) -> ModePolicy:
+    """按名称或 "包.模块:类名" 加载策略"""
+    spec = (spec or "heuristic").strip()
+    if spec in MODE_POLICIES:
+        return MODE_POLICIES[spec]()
+    module_name, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(
+            f"Unknown OCR auto policy '{spec}', expected one of: "
+            f"{', '.join(MODE_POLICIES)} or 'package.module:ClassName'"
+        )
+    policy = getattr(importlib.import_module(module_name), attr)()
+    if not callable(getattr(policy, "select", None)):
+        raise ValueError(f"OCR auto policy '{spec}' has no select(signals) method")
+    return policy
+
+
+def compute_image_signals(image: Image.Image, max_side: int = SIGNAL_MAX_SIDE) -> ImageSignals:
+    """在灰度缩略图上计算廉价信号（尺寸取原图）"""
+    width, height = image.size
+    gray = image.convert("L")
+    if max(width, height) > max_side:
+        gray.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.float32) / 255.0
+    if pixels.size == 0:
+        return ImageSignals(width, height, 0.0, 0.0, 0)
+
+    # 以背景亮度为基准判定墨迹，适配偏灰的扫描件
+    background = float(np.percentile(pixels, 90))
+    ink = pixels < background - 0.25
+    ink_ratio = float(ink.mean())
+
+    dx = np.abs(np.diff(pixels, axis=1))
+    dy = np.abs(np.diff(pixels, axis=0))
+    edge_density = float(((dx > 0.25).mean() + (dy > 0.25).mean()) / 2)
+
+    # 行投影：有墨迹的行连续成段即为一行文本
+    row_ink = ink.mean(axis=1) > 0.005
+    starts = np.flatnonzero(row_ink[1:] & ~row_ink[:-1])
+    text_lines = int(starts.size + (1 if row_ink[0] else 0))
+    return ImageSignals(width, height, ink_ratio, edge_density, text_lines)
+
+
+def load_signal_image(image_path: str, max_side: int = SIGNAL_MAX_SIDE) -> tuple[Image.Image, tuple[int, int]]:
+    """加载用于计算信号的灰度图与原图尺寸（已按 EXIF 旋转）；JPEG 使用 draft 直接按缩小比例解码"""
+    with Image.open(image_path) as img:
+        width, height = img.size
+        img.draft("L", (max_side, max_side))
+        draft_size = img.size
+        image = ImageOps.exif_transpose(img).convert("L")
+    if image.size != draft_size:
+        # EXIF 旋转了 90°/270°
+        width, height = height, width
+    return image, (width, height)
+
+
+def select_mode_name(
+    source: Union[str, Image.Image],
+    policy: ModePolicy,
+    original_size: Optional[tuple[int, int]] = None,
+) -> tuple[str, ImageSignals]:
+    """在预处理执行器中运行：计算信号并由策略选择模式名；original_size 为缩小解码前的原图尺寸"""
+    if isinstance(source, str):
+        image, original_size = load_signal_image(source)
+        signals = compute_image_signals(image)
+    else:
+        signals = compute_image_signals(source)
+    if original_size is not None:
+        # draft 解码后的尺寸小于原图，尺寸信号以原图为准
+        width, height = original_size
+        signals = ImageSignals(width, height, signals.ink_ratio, signals.edge_density, signals.text_lines)
+    name = policy.select(signals)
+    if name not in OCR_MODES:
+        raise ValueError(f"OCR auto policy returned unknown mode '{name}'")
+    return name, signals
+
+
+def mode_name(mode: OcrMode) -> str:
+    for name, preset in OCR_MODES.items():
+        if preset == mode:
+            return name
+    return CUSTOM_MODE
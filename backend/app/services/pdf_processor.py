@@ -19,6 +19,10 @@ class PageResult:
     raw_text: str
     image_assets: list[str]
     boxes: list[dict[str, Any]]
+    truncated: bool = False
+    tokens_saved: int = 0
+    mode: Optional[str] = None
+    vision_tokens: Optional[int] = None
 
 
 @dataclass
@@ -136,6 +140,7 @@ def process_pdf(
 
     infer_url = settings.worker_remote_infer_url or f"http://{settings.api_host}:{settings.api_port}/internal/infer"
     effective_concurrency = max_concurrency or settings.pdf_max_concurrency
+    ocr_mode = settings.default_ocr_mode()
 
     config: dict[str, Any] = {
         "task_id": task_id or "",
@@ -145,12 +150,15 @@ def process_pdf(
         "prompt": settings.pdf_prompt,
         "infer_url": infer_url,
         "auth_token": settings.internal_api_token,
-        "base_size": settings.base_size,
-        "image_size": settings.image_size,
-        "crop_mode": settings.crop_mode,
+        "base_size": ocr_mode.base_size,
+        "image_size": ocr_mode.image_size,
+        "crop_mode": ocr_mode.crop_mode,
+        # auto 时由 /internal/infer 按页选择模式，上面三项仅作回退
+        "mode": "auto" if settings.default_mode_is_auto() else "",
         "max_concurrency": int(effective_concurrency),
         "request_timeout_seconds": settings.pdf_worker_timeout_seconds,
         "render_workers": settings.pdf_render_workers,
+        "transport": settings.pdf_worker_transport,
     }
 
     result_payload = _run_worker(worker_bin, config, progress_callback)
@@ -271,6 +279,10 @@ def _payload_to_result(payload: dict[str, Any]) -> PdfProcessingResult:
                 raw_text=raw_text,
                 image_assets=image_assets,
                 boxes=boxes,
+                truncated=bool(item.get("truncated", False)),
+                tokens_saved=int(item.get("tokens_saved", 0) or 0),
+                mode=item.get("mode") or None,
+                vision_tokens=item.get("vision_tokens"),
             )
         )
 
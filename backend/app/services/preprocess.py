@@ -0,0 +1,345 @@
+"""
+图像预处理阶段
+解码、EXIF 旋转、RGB 转换以及 v0 引擎的 tokenize_with_images 都是 CPU 密集型操作，
+统一放到独立的线程池或进程池中执行，避免阻塞 asyncio 事件循环（包括 /health 等轻量接口）。
+线程池受 GIL 限制，多核主机上应使用进程池：v0 路径的解码、模式选择与分词在同一次 worker 调用中完成
+（prepare），图像不在进程间往返；分词结果中的像素张量经共享内存 slot 交接
+（services/tensor_handoff.py），提交到执行器的任务数有上限，超出时调用方在事件循环中等待。
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Optional, Sequence, Tuple, TypeVar, Union
+
+from PIL import Image, ImageOps
+
+from ..vllm_models.config import OCR_MODES, UINT8_PIXELS, OcrMode
+from . import metrics
+from .decode_plan import DecodedImage, decode_image
+from .mode_selector import ImageSignals, ModePolicy, mode_name, select_mode_name
+
+if TYPE_CHECKING:
+    from .tensor_handoff import SharedSlotPool
+
+T = TypeVar("T")
+
+EXECUTOR_KINDS = {"thread", "process"}
+
+
+@dataclass
+class PreparedImage:
+    """v0 引擎输入：已在 worker 中按所选模式完成切片与分词"""
+
+    # tokenize_with_images 的结果；提示词不含 <image> 时为 None（引擎不使用图像）
+    tokens: Any
+    # 分词所用图像的 (宽, 高)
+    size: Tuple[int, int]
+    mode: OcrMode
+    mode_name: str
+    # auto 时的图像信号；指定模式或选择失败时为 None
+    signals: Optional[ImageSignals]
+    model_path: Optional[str]
+
+
+# ---------------------------------------------------------------------------
+# 以下函数在执行器中运行；进程池要求它们是模块级可 pickle 的函数
+# ---------------------------------------------------------------------------
+
+def decode_image_base64(
+    data: str, modes: Optional[Sequence[OcrMode]] = None
+) -> Tuple[bytes, DecodedImage]:
+    """Base64 解码后再解码图像，返回原始字节（用于缓存摘要）与解码结果"""
+    raw = decode_base64_bytes(data)
+    return raw, decode_image(raw, modes)
+
+
+def decode_base64_bytes(data: str) -> bytes:
+    try:
+        return base64.b64decode(data)
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError(f"无效的 Base64 数据: {exc}") from exc
+
+
+def load_image_file(image_path: str) -> Image.Image:
+    """从文件加载图像，处理 EXIF 旋转并转换为 RGB"""
+    try:
+        with Image.open(image_path) as img:
+            return ImageOps.exif_transpose(img).convert("RGB")
+    except Exception as exc:
+        raise ValueError(f"无法加载图像: {image_path}: {exc}") from exc
+
+
+def ensure_rgb(image: Image.Image) -> Image.Image:
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def tokenize_image(
+    image: Image.Image,
+    mode: OcrMode,
+    model_path: Optional[str],
+    prompt: Optional[str] = None,
+    allocate: Optional[Callable[..., Any]] = None,
+) -> Any:
+    """v0 引擎路径：按实际提示词完成切片与分词；allocate 为像素张量的分配函数（共享内存 slot）"""
+    # 延迟导入，避免仅做解码的工作进程加载 torch / transformers
+    from ..vllm_models.process.image_process import get_cached_processor
+
+    processor = get_cached_processor(**mode.to_mm_kwargs(), model_path=model_path)
+    return processor.tokenize_with_images(
+        images=[image], bos=True, eos=True, cropping=mode.crop_mode, conversation=prompt,
+        allocate=allocate,
+    )
+
+
+def prepare_image(
+    source: Union[bytes, str],
+    decode_modes: Optional[Sequence[OcrMode]],
+    requested: Optional[OcrMode],
+    policy: ModePolicy,
+    fallback: OcrMode,
+    model_path: Optional[str],
+    prompt: Optional[str] = None,
+    slot_name: Optional[str] = None,
+) -> Tuple[DecodedImage, PreparedImage]:
+    """
+    v0 路径的单次 worker 调用：解码 → 模式选择（requested 为 None 时）→ 分词。
+    返回的 DecodedImage 不含图像，像素张量在给定 slot_name 时写入共享内存。
+    """
+    decoded = decode_image(source, decode_modes)
+    image = decoded.image
+    signals = None
+    if requested is None:
+        try:
+            name, signals = select_mode_name(image, policy, decoded.original_size)
+            mode = OCR_MODES[name]
+        except (ValueError, OSError) as exc:
+            # 策略异常不影响识别，退回默认模式
+            print(f"⚠️ 自动模式选择失败，使用默认模式: {exc}")
+            mode, name = fallback, mode_name(fallback)
+    else:
+        mode, name = requested, mode_name(requested)
+    tokens = None
+    try:
+        if prompt is None or "<image>" in prompt:
+            if slot_name is not None:
+                from .tensor_handoff import tokenize_into_slot
+
+                tokens = tokenize_into_slot(slot_name, image, mode, model_path, prompt)
+            else:
+                tokens = tokenize_image(image, mode, model_path, prompt)
+    finally:
+        image.close()
+    decoded.image = None
+    return decoded, PreparedImage(tokens, decoded.size, mode, name, signals, model_path)
+
+
+def init_worker() -> None:
+    """进程池 worker 初始化：每个进程单线程运行 torch 运算，避免多进程 × 多线程超额订阅 CPU"""
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+
+class ImagePreprocessor:
+    """预处理执行器：所有 CPU 密集型图像操作的唯一入口"""
+
+    def __init__(
+        self,
+        workers: int = 0,
+        executor: str = "thread",
+        max_pending: int = 0,
+        shm_slots: int = 0,
+        shm_handoff: bool = True,
+        tokenize_in_worker: bool = False,
+    ) -> None:
+        """
+        Args:
+            workers: 并发数，0 表示按 CPU 自动选择（最多 8）
+            executor: thread / process
+            max_pending: 已提交到执行器但未完成的任务上限，0 表示 4 × workers
+            shm_slots: 进程池分词结果的共享内存 slot 数，0 表示与 workers 相同
+            shm_handoff: 进程池下经共享内存交接像素张量；关闭时随结果 pickle
+            tokenize_in_worker: 进程池下 prepare 在解码的同一次调用中完成模式选择与分词（v0 引擎）
+        """
+        if executor not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"Unknown preprocess executor '{executor}', expected one of: "
+                f"{', '.join(sorted(EXECUTOR_KINDS))}"
+            )
+        self.kind = executor
+        self.workers = workers if workers > 0 else min(8, os.cpu_count() or 1)
+        self.max_pending = max_pending if max_pending > 0 else 4 * self.workers
+        self.shm_slots = shm_slots if shm_slots > 0 else self.workers
+        self.shm_handoff = shm_handoff and executor == "process"
+        self.tokenize_in_worker = tokenize_in_worker and executor == "process"
+        self._executor: Optional[Executor] = None
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._waiting = 0
+        self._slots: Optional[SharedSlotPool] = None
+        self._slots_initialized = False
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # API 进程可能已初始化 CUDA，使用 spawn 避免 fork 带来的问题
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="ocr-preprocess"
+                )
+        return self._executor
+
+    def _get_slots(self) -> Optional[SharedSlotPool]:
+        if self.shm_handoff and not self._slots_initialized:
+            # 仅 API 进程需要；延迟导入，避免只做解码的 worker 加载 torch
+            from .tensor_handoff import SharedSlotPool, slot_nbytes
+
+            self._slots_initialized = True
+            # 按所有模式中最大的输出规划 slot，auto 与按请求指定的模式共用
+            pixel_itemsize = 1 if UINT8_PIXELS else 4
+            self._slots = SharedSlotPool.create(
+                self.shm_slots, slot_nbytes(OCR_MODES.values(), pixel_itemsize)
+            )
+        return self._slots
+
+    @contextlib.asynccontextmanager
+    async def _pending_slot(self) -> AsyncIterator[None]:
+        """背压：执行器中的任务达到 max_pending 时，新任务在事件循环中等待"""
+        if self._pending.locked():
+            self._waiting += 1
+            metrics.PREPROCESS_WAITING.set(self._waiting)
+            try:
+                await self._pending.acquire()
+            finally:
+                self._waiting -= 1
+                metrics.PREPROCESS_WAITING.set(self._waiting)
+        else:
+            await self._pending.acquire()
+        try:
+            yield
+        finally:
+            self._pending.release()
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        async with self._pending_slot():
+            return await loop.run_in_executor(self._get_executor(), partial(func, *args, **kwargs))
+
+    async def decode_base64(
+        self, data: str, modes: Optional[Sequence[OcrMode]] = None
+    ) -> Tuple[bytes, DecodedImage]:
+        return await self.run(decode_image_base64, data, modes)
+
+    async def load_file(self, image_path: str) -> Image.Image:
+        return await self.run(load_image_file, image_path)
+
+    async def ensure_rgb(self, image: Image.Image) -> Image.Image:
+        if image.mode == "RGB":
+            return image
+        return await self.run(ensure_rgb, image)
+
+    async def select_mode(
+        self,
+        source: Union[str, Image.Image],
+        policy: ModePolicy,
+        original_size: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[str, ImageSignals]:
+        return await self.run(select_mode_name, source, policy, original_size)
+
+    async def prepare(
+        self,
+        source: Union[bytes, str],
+        decode_modes: Optional[Sequence[OcrMode]],
+        requested: Optional[OcrMode],
+        policy: ModePolicy,
+        fallback: OcrMode,
+        model_path: Optional[str],
+        prompt: Optional[str] = None,
+    ) -> Tuple[DecodedImage, Optional[PreparedImage]]:
+        """
+        解码字节或文件路径。tokenize_in_worker 时在同一次 worker 调用内完成模式选择与分词，
+        只返回解码统计与分词结果；否则仅解码，PreparedImage 为 None，由调用方继续选择模式
+        """
+        if not self.tokenize_in_worker:
+            return await self.run(decode_image, source, decode_modes), None
+        args = (source, decode_modes, requested, policy, fallback, model_path, prompt)
+        slots = self._get_slots()
+        if slots is None:
+            return await self.run(prepare_image, *args)
+        index, (decoded, prepared) = await self._submit_to_slot(slots, prepare_image, *args)
+        try:
+            if prepared.tokens is not None:
+                slots.materialize(index, prepared.tokens)
+        finally:
+            slots.release(index)
+        return decoded, prepared
+
+    async def tokenize(
+        self, image: Image.Image, mode: OcrMode, model_path: Optional[str], prompt: Optional[str] = None
+    ) -> Any:
+        slots = self._get_slots()
+        if slots is None:
+            return await self.run(tokenize_image, image, mode, model_path, prompt)
+        from .tensor_handoff import tokenize_into_slot
+
+        index, result = await self._submit_to_slot(
+            slots, tokenize_into_slot, image=image, mode=mode, model_path=model_path, prompt=prompt
+        )
+        try:
+            return slots.materialize(index, result)
+        finally:
+            slots.release(index)
+
+    async def _submit_to_slot(
+        self, slots: SharedSlotPool, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> Tuple[int, T]:
+        """借出 slot 后提交 func(..., slot_name=...)；成功时由调用方取回张量并归还 slot"""
+        # 先借 slot 再提交：slot 全部占用时在此等待，不向进程池堆积任务
+        with metrics.stage_timer("slot_wait"):
+            index = await slots.acquire()
+        loop = asyncio.get_running_loop()
+        async with self._pending_slot():
+            future: Future[T] = self._get_executor().submit(
+                partial(func, *args, slot_name=slots.name(index), **kwargs)
+            )
+            try:
+                return index, await asyncio.wrap_future(future)
+            except BaseException:
+                if future.done():
+                    slots.release(index)
+                else:
+                    # worker 可能仍在写入该 slot，任务结束后再归还
+                    future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release, index))
+                raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._slots is not None:
+            self._slots.close()
+            self._slots = None
+        self._slots_initialized = False
+
+    def describe(self) -> dict[str, Any]:
+        info: dict[str, Any] = {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "tokenize_in_worker": self.tokenize_in_worker,
+            "waiting": self._waiting,
+        }
+        if self._slots is not None:
+            info["shm"] = self._slots.describe()
+        return info
@@ -0,0 +1,142 @@
+"""
+OCR 结果缓存
+以图像内容哈希 + 提示词 + 模式 + 采样参数为键，缓存模型原始输出文本。
+内存层为有界 LRU，可选磁盘层位于 STORAGE_DIR/cache/ocr。
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from ..vllm_models.config import OcrMode
+
+
+CACHE_BYPASS_VALUES = {"bypass", "no-cache", "off"}
+
+
+class OcrResultCache:
+    """两级（内存 LRU + 可选磁盘）OCR 结果缓存"""
+
+    def __init__(self, max_entries: int = 1024, disk_dir: Optional[Path] = None) -> None:
+        self.max_entries = max(max_entries, 0)
+        self.disk_dir = disk_dir
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+        }
+
+    @staticmethod
+    def digest_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def digest_file(path: str | Path, chunk_size: int = 1024 * 1024) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(
+        image_digest: str,
+        prompt: str,
+        mode: OcrMode,
+        temperature: float,
+        max_tokens: int,
+        model_path: str = "",
+    ) -> str:
+        """组合缓存键；任何影响输出的参数变化都会得到不同的键"""
+        material = json.dumps(
+            {
+                "image": image_digest,
+                "prompt": prompt,
+                "base_size": mode.base_size,
+                "image_size": mode.image_size,
+                "crop_mode": mode.crop_mode,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "model": model_path,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is not None:
+            self._memory.move_to_end(key)
+            self._stats["memory_hits"] += 1
+            return text
+
+        if self.disk_dir is not None:
+            text = await asyncio.to_thread(self._read_disk, key)
+            if text is not None:
+                self._stats["disk_hits"] += 1
+                self._remember(key, text)
+                return text
+
+        self._stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, text: str) -> None:
+        self._remember(key, text)
+        self._stats["stores"] += 1
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._write_disk, key, text)
+
+    def record_bypass(self) -> None:
+        self._stats["bypassed"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_enabled": self.disk_dir is not None,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, text: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        text = payload.get("text") if isinstance(payload, dict) else None
+        return text if isinstance(text, str) else None
+
+    def _write_disk(self, key: str, text: str) -> None:
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_text(json.dumps({"text": text}, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as exc:
+            print(f"⚠️ 写入 OCR 磁盘缓存失败: {exc}")
@@ -0,0 +1,100 @@
+"""
+服务启动状态
+模型加载需要数分钟，放在后台任务中进行：PDF 上传、任务查询、下载等不依赖模型的接口立即可用，
+推理接口在模型就绪前有限等待或返回 503。各启动阶段（数据库初始化、引擎池创建、模型加载）的耗时
+记录在此，由 /health 对外暴露。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+import traceback
+from typing import Any, Awaitable, Iterator, Optional
+
+
+class ModelNotReady(RuntimeError):
+    """模型仍在加载或加载失败"""
+
+
+class StartupState:
+    """启动阶段：starting → loading → ready | failed"""
+
+    def __init__(self) -> None:
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        # 阶段名 -> 耗时（毫秒），按执行顺序
+        self.timings: dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._ready_at: Optional[float] = None
+        self._settled = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.phase == "ready"
+
+    @property
+    def is_failed(self) -> bool:
+        return self.phase == "failed"
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (time.perf_counter() - started) * 1000
+            print(f"⏱️ 启动阶段 {name}: {self.timings[name]:.0f} ms")
+
+    def start_background(self, name: str, loader: Awaitable[Any]) -> None:
+        """在后台执行加载协程，完成后标记 ready，异常时标记 failed（不终止进程）"""
+        self.phase = "loading"
+        self._task = asyncio.create_task(self._run(name, loader))
+
+    async def _run(self, name: str, loader: Awaitable[Any]) -> None:
+        try:
+            with self.stage(name):
+                await loader
+        except asyncio.CancelledError:
+            self.phase = "failed"
+            self.error = "cancelled"
+            raise
+        except Exception as exc:
+            self.phase = "failed"
+            self.error = f"{type(exc).__name__}: {exc}"
+            print(f"❌ 后台加载失败: {self.error}")
+            traceback.print_exc()
+        else:
+            self.phase = "ready"
+            self._ready_at = time.perf_counter()
+            print(f"✅ 模型已就绪，启动用时 {self._ready_at - self._started:.1f}s")
+        finally:
+            self._settled.set()
+
+    async def wait_ready(self, timeout: float) -> None:
+        """等待模型就绪，超时或加载失败时抛出 ModelNotReady"""
+        if self.is_ready:
+            return
+        if not self.is_failed and timeout > 0:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._settled.wait(), timeout)
+        if self.is_failed:
+            raise ModelNotReady(f"Model failed to load: {self.error}")
+        if not self.is_ready:
+            raise ModelNotReady(f"Model is still {self.phase}")
+
+    async def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    def to_dict(self) -> dict[str, Any]:
+        elapsed_end = self._ready_at if self._ready_at is not None else time.perf_counter()
+        return {
+            "phase": self.phase,
+            "elapsed_ms": round((elapsed_end - self._started) * 1000, 1),
+            "timings_ms": {name: round(value, 1) for name, value in self.timings.items()},
+            **({"error": self.error} if self.error else {}),
+        }
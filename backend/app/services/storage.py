@@ -27,6 +27,11 @@ class StorageManager:
         path.mkdir(parents=True, exist_ok=True)
         return path
 
+    def get_cache_dir(self, name: str) -> Path:
+        path = self.root / "cache" / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
     def get_task_output_dir(self, task_id: str) -> Path:
         path = self.outputs / task_id
         path.mkdir(parents=True, exist_ok=True)
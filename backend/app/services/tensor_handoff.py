@@ -0,0 +1,218 @@
+"""
+共享内存张量交接
+PREPROCESS_EXECUTOR=process 时，v0 引擎路径的切片、归一化与分词在预处理进程中执行。worker 把
+pixel_values / images_crop / images_spatial_crop 直接写入 API 进程预先创建的共享内存 slot，
+管道上只返回 (偏移, 形状, dtype) 描述符与 input_ids 等小张量，不再 pickle 大数组。
+
+slot 数即在途预处理结果的上限：全部占用时新的分词请求在事件循环中等待（背压）。
+vLLM 的多模态处理缓存可能在请求结束后继续持有输入张量，而 slot 会被后续请求复用，
+因此 API 进程收到描述符后把张量拷贝到自身内存一次，随即归还 slot。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import math
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Iterable, Optional
+
+import torch
+
+from ..vllm_models.config import MAX_CROPS, OcrMode
+
+# 各张量在 slot 内的起始偏移按该字节数对齐
+SLOT_ALIGNMENT = 64
+# tokenize_with_images 结果中写入共享内存的字段位置：pixel_values, images_crop, images_spatial_crop
+SHARED_FIELDS = (1, 2, 4)
+SHM_DIR = "/dev/shm"
+
+
+@dataclass(frozen=True)
+class TensorRef:
+    """slot 中一个连续张量的位置"""
+
+    offset: int
+    shape: tuple[int, ...]
+    dtype: str
+
+    @property
+    def nbytes(self) -> int:
+        return math.prod(self.shape) * _dtype(self.dtype).itemsize
+
+    def read(self, block: torch.Tensor) -> torch.Tensor:
+        """从 slot 拷贝出独立的张量"""
+        view = block[self.offset:self.offset + self.nbytes].view(_dtype(self.dtype))
+        return view.view(self.shape).clone()
+
+
+def _dtype(name: str) -> torch.dtype:
+    return getattr(torch, name)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+
+
+def slot_nbytes(modes: Iterable[OcrMode], pixel_itemsize: int, max_crops: int = MAX_CROPS) -> int:
+    """单张图像在给定模式下写入 slot 的最大字节数，按 tokenize_with_images 的分配顺序对齐累加"""
+    largest = 0
+    for mode in modes:
+        sizes = (
+            # pixel_values
+            3 * mode.base_size * mode.base_size * pixel_itemsize,
+            # images_spatial_crop
+            2 * torch.long.itemsize,
+            # images_crop；无局部视图时为一个全零占位切片
+            (max_crops if mode.crop_mode else 1) * 3 * mode.image_size * mode.image_size * pixel_itemsize,
+        )
+        used = 0
+        for nbytes in sizes:
+            used = _align(used) + nbytes
+        largest = max(largest, used)
+    return largest
+
+
+class SlotArena:
+    """worker 侧：在一个 slot 内顺序分配输出张量，容量不足时退回普通内存（随结果 pickle）"""
+
+    def __init__(self, block: torch.Tensor) -> None:
+        self._block = block
+        self._base = block.data_ptr()
+        self._used = 0
+
+    def allocate(self, shape: tuple[int, ...], dtype: torch.dtype) -> torch.Tensor:
+        nbytes = math.prod(shape) * dtype.itemsize
+        offset = _align(self._used)
+        if offset + nbytes > self._block.numel():
+            return torch.empty(shape, dtype=dtype)
+        self._used = offset + nbytes
+        return self._block[offset:offset + nbytes].view(dtype).view(shape)
+
+    def ref(self, tensor: torch.Tensor) -> Optional[TensorRef]:
+        offset = tensor.data_ptr() - self._base
+        if not tensor.is_contiguous() or not 0 <= offset < self._block.numel():
+            return None
+        return TensorRef(offset, tuple(tensor.shape), str(tensor.dtype).removeprefix("torch."))
+
+
+# worker 进程内已映射的 slot（按名称），避免每个请求重新 mmap
+_attached: dict[str, tuple[shared_memory.SharedMemory, torch.Tensor]] = {}
+
+
+def _attach(name: str) -> torch.Tensor:
+    entry = _attached.get(name)
+    if entry is None:
+        shm = shared_memory.SharedMemory(name=name)
+        entry = _attached[name] = (shm, torch.frombuffer(shm.buf, dtype=torch.uint8))
+    return entry[1]
+
+
+def tokenize_into_slot(
+    slot_name: str, image: Any, mode: OcrMode, model_path: Optional[str], prompt: Optional[str] = None
+) -> Any:
+    """在预处理进程中运行：像素张量写入共享内存 slot，结果中对应字段替换为 TensorRef"""
+    from .preprocess import tokenize_image
+
+    arena = SlotArena(_attach(slot_name))
+    result = tokenize_image(image, mode, model_path, prompt, allocate=arena.allocate)
+    fields = result[0]
+    for index in SHARED_FIELDS:
+        ref = arena.ref(fields[index])
+        if ref is not None:
+            fields[index] = ref
+    return result
+
+
+class SharedSlotPool:
+    """API 进程侧：预先创建的共享内存 slot，分词前借出、取回张量后归还"""
+
+    def __init__(self, slots: int, slot_bytes: int) -> None:
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._blocks: list[shared_memory.SharedMemory] = []
+        self._views: list[torch.Tensor] = []
+        self._free: Optional[asyncio.Queue[int]] = None
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def create(cls, slots: int, slot_bytes: int) -> Optional["SharedSlotPool"]:
+        """/dev/shm 空间不足时返回 None（写入超出容量的共享内存会触发 SIGBUS）"""
+        if os.path.isdir(SHM_DIR):
+            free = shutil.disk_usage(SHM_DIR).free
+            if free < slots * slot_bytes:
+                print(
+                    f"⚠️ {SHM_DIR} 可用 {free / 2**20:.0f} MB，不足以容纳 {slots} 个 "
+                    f"{slot_bytes / 2**20:.0f} MB 的预处理 slot，改为 pickle 传输（可调大容器 shm_size）"
+                )
+                return None
+        pool = cls(slots, slot_bytes)
+        try:
+            for _ in range(slots):
+                shm = shared_memory.SharedMemory(create=True, size=slot_bytes)
+                pool._blocks.append(shm)
+                pool._views.append(torch.frombuffer(shm.buf, dtype=torch.uint8))
+        except OSError as exc:
+            print(f"⚠️ 创建预处理共享内存失败，改为 pickle 传输: {exc}")
+            pool.close()
+            return None
+        print(f"🧩 预处理共享内存: {slots} 个 slot × {slot_bytes / 2**20:.1f} MB")
+        return pool
+
+    def _queue(self) -> asyncio.Queue[int]:
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for index in range(len(self._blocks)):
+                self._free.put_nowait(index)
+        return self._free
+
+    def name(self, index: int) -> str:
+        return self._blocks[index].name
+
+    async def acquire(self) -> int:
+        free = self._queue()
+        if not free.empty():
+            return free.get_nowait()
+        self.waiting += 1
+        self.waits += 1
+        started = time.perf_counter()
+        try:
+            return await free.get()
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - started
+
+    def release(self, index: int) -> None:
+        self._queue().put_nowait(index)
+
+    def materialize(self, index: int, result: Any) -> Any:
+        """把结果中的 TensorRef 替换为从 slot 拷贝出的张量"""
+        fields = result[0]
+        for position, value in enumerate(fields):
+            if isinstance(value, TensorRef):
+                fields[position] = value.read(self._views[index])
+        return result
+
+    def close(self) -> None:
+        self._views.clear()
+        for shm in self._blocks:
+            with contextlib.suppress(BufferError):
+                shm.close()
+            with contextlib.suppress(FileNotFoundError):
+                shm.unlink()
+        self._blocks.clear()
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "slot_mb": round(self.slot_bytes / 2**20, 1),
+            "free": self._free.qsize() if self._free is not None else len(self._blocks),
+            "waiting": self.waiting,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
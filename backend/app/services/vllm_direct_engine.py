@@ -3,12 +3,19 @@ vLLM Direct Engine
 直接使用 AsyncLLMEngine 进行推理，避免 OpenAI API 的限制
 参考：third_party/DeepSeek-OCR-vllm/run_dpsk_ocr_image.py
 """
+import asyncio
+import bisect
+import contextlib
+import gc
+import inspect
 import os
 import time
-from typing import Optional
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Mapping, Optional, Sequence, Union
 
 import torch
-from PIL import Image, ImageOps
+from PIL import Image, ImageDraw
 
 from vllm import AsyncLLMEngine, SamplingParams
 from vllm.engine.arg_utils import AsyncEngineArgs
@@ -22,23 +29,166 @@ except ImportError:
     from ..vllm_models.deepseek_ocr import DeepseekOCRForCausalLM  # type: ignore
     _USING_OFFICIAL_MODEL = False
 
-from ..vllm_models.process.image_process import DeepseekOCRProcessor
-from ..vllm_models.process.ngram_norepeat import NoRepeatNGramLogitsProcessor
-from ..vllm_models import config as vllm_config
+from ..vllm_models.process.image_process import get_cached_processor
+from ..vllm_models.process.tiling import plan_tiling
+from . import metrics
+from .loop_detector import LoopDetectionConfig, RepetitionDetector
+from .preprocess import ImagePreprocessor, PreparedImage
+from ..vllm_models.process.ngram_norepeat import (
+    NGRAM_SIZE,
+    NGRAM_WHITELIST_TOKEN_IDS,
+    NGRAM_WINDOW_SIZE,
+    NoRepeatNGramLogitsProcessor,
+)
+
+# v1 批量 logits 处理器接口需要较新的 vLLM
+try:
+    from ..vllm_models.process.ngram_norepeat_v1 import (
+        NoRepeatNGramBatchLogitsProcessor,
+        ngram_extra_args,
+    )
+except ImportError:
+    NoRepeatNGramBatchLogitsProcessor = None  # type: ignore
+from ..vllm_models.config import MAX_CROPS, MIN_CROPS, UINT8_PIXELS, OcrMode
+
+
+@dataclass
+class StreamChunk:
+    """流式推理的一次增量输出"""
+
+    delta: str
+    text: str
+    finished: bool = False
+    num_tokens: int = 0
+    # 检测到重复循环而提前中止时为 True，text 为裁剪掉重复尾部后的结果
+    truncated: bool = False
+    tokens_saved: int = 0
+
+
+@dataclass
+class InferenceResult:
+    """一次完整推理的结果"""
+
+    text: str
+    num_tokens: int = 0
+    truncated: bool = False
+    tokens_saved: int = 0
+
+
+@dataclass
+class InflightRequest:
+    """正在执行的推理请求"""
+
+    request_id: str
+    started_at: float
+    max_tokens: int
+    num_tokens: int = 0
+    first_token_at: Optional[float] = None
+
+
+@dataclass
+class EngineStats:
+    """引擎级累计统计"""
+
+    aborted_requests: int = 0
+    aborted_by_reason: dict[str, int] = field(default_factory=dict)
+    reclaimed_gpu_seconds: float = 0.0
+    loops_detected: int = 0
+    loop_tokens_saved: int = 0
+
+    def merge(self, other: "EngineStats") -> None:
+        """累加另一个引擎副本的统计"""
+        self.aborted_requests += other.aborted_requests
+        for reason, count in other.aborted_by_reason.items():
+            self.aborted_by_reason[reason] = self.aborted_by_reason.get(reason, 0) + count
+        self.reclaimed_gpu_seconds += other.reclaimed_gpu_seconds
+        self.loops_detected += other.loops_detected
+        self.loop_tokens_saved += other.loop_tokens_saved
+
+    def to_dict(self) -> dict:
+        return {
+            "aborted_requests": self.aborted_requests,
+            "aborted_by_reason": dict(self.aborted_by_reason),
+            "reclaimed_gpu_seconds": round(self.reclaimed_gpu_seconds, 3),
+            "loops_detected": self.loops_detected,
+            "loop_tokens_saved": self.loop_tokens_saved,
+        }
+
+
+@dataclass
+class WarmupPlan:
+    """启动预热计划：每个模式 × 代表性切片网格各发一次合成请求"""
+
+    modes: Mapping[str, OcrMode]
+    grids: Sequence[tuple[int, int]] = ((1, 1),)
+    prompt: str = "<image>\nFree OCR."
+    max_tokens: int = 16
+
+
+@dataclass
+class WarmupStep:
+    mode: str
+    grid: str
+    duration_ms: float
+    error: Optional[str] = None
+
+
+@dataclass
+class WarmupReport:
+    steps: list[WarmupStep] = field(default_factory=list)
+    total_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": round(self.total_ms, 1),
+            "steps": [
+                {
+                    "mode": step.mode,
+                    "grid": step.grid,
+                    "duration_ms": round(step.duration_ms, 1),
+                    **({"error": step.error} if step.error else {}),
+                }
+                for step in self.steps
+            ],
+        }
 
 
 class VLLMDirectEngine:
     """直接使用 vLLM AsyncLLMEngine 的推理引擎"""
+
+    # API 进程内存活的 legacy 引擎数；它们共享进程级的模型并行状态
+    _inprocess_engines = 0
     
-    def __init__(self):
+    def __init__(
+        self,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        loop_detection: Optional[LoopDetectionConfig] = None,
+    ):
         self.engine: Optional[AsyncLLMEngine] = None
+        # 解码 / EXIF / tokenize 等 CPU 密集操作在预处理执行器中完成，不阻塞事件循环
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        # v1 引擎在流式输出上在线检测重复循环（覆盖 n-gram 窗口之外的长周期重复）；None 表示关闭
+        self.loop_detection = loop_detection
         self.model_path: Optional[str] = None
         self._loaded = False
         self._use_v1_engine = False
+        self._v1_ngram_enabled = False
+        self._inflight: dict[str, InflightRequest] = {}
+        self.stats = EngineStats()
+        # 生命周期阶段：idle → loading → warming → ready
+        self.phase = "idle"
+        self.warmup_report: Optional[WarmupReport] = None
+        # 加载各步骤耗时（毫秒）：registry / processor / engine_create
+        self.load_timings: dict[str, float] = {}
+        self._warmup_task: Optional[asyncio.Task] = None
         
     def is_loaded(self) -> bool:
         """检查引擎是否已加载"""
         return self._loaded and self.engine is not None
+
+    def is_ready(self) -> bool:
+        """引擎已加载且预热完成，可以接收正式流量"""
+        return self.is_loaded() and self.phase == "ready"
     
     async def load(
         self,
@@ -48,6 +198,8 @@ class VLLMDirectEngine:
         max_model_len: int = 8192,
         enforce_eager: bool = False,
         use_v1_engine: bool = False,
+        warmup: Optional[WarmupPlan] = None,
+        no_repeat_ngram_v1: bool = True,
         **kwargs
     ):
         """
@@ -59,7 +211,12 @@ class VLLMDirectEngine:
             gpu_memory_utilization: GPU 内存利用率
             max_model_len: 最大模型长度
             enforce_eager: 是否强制使用 eager 模式
+            warmup: 预热计划；给定时在后台执行，完成前 phase 为 warming
+            no_repeat_ngram_v1: v1 引擎下注册批量 n-gram 禁止重复处理器
         """
+        self.phase = "loading"
+        self.load_timings = {}
+        step_started = time.perf_counter()
         print(f"🔧 初始化 vLLM Direct Engine...")
         print(f"📦 模型路径: {model_path}")
         
@@ -77,13 +234,32 @@ class VLLMDirectEngine:
         # 注册 DeepSeek-OCR 模型（仅在需要自定义实现时）
         if _USING_OFFICIAL_MODEL:
             print("📝 使用 vLLM 内置 DeepSeek-OCR 模型")
+            if UINT8_PIXELS:
+                print("⚠️ 内置模型自行归一化像素，OCR_UINT8_PIXELS 仅对自定义模型生效，v0 引擎下请关闭")
         else:
             if "DeepseekOCRForCausalLM" not in ModelRegistry.get_supported_archs():
                 print("📝 注册自定义 DeepSeek-OCR 模型...")
                 ModelRegistry.register_model("DeepseekOCRForCausalLM", DeepseekOCRForCausalLM)
             else:
                 print("ℹ️ 自定义 DeepSeek-OCR 模型已注册，跳过重复注册")
-        
+        self._record_load_step("registry", step_started)
+
+        # 预先加载共享 processor/tokenizer，避免首个请求承担加载开销
+        step_started = time.perf_counter()
+        await asyncio.to_thread(get_cached_processor, model_path=model_path)
+        self._record_load_step("processor", step_started)
+
+        # v1 引擎不支持按请求的 logits_processors，改为注册批量处理器，由 extra_args 按请求启用
+        extra_engine_args = {}
+        self._v1_ngram_enabled = False
+        if use_v1_engine and no_repeat_ngram_v1:
+            if NoRepeatNGramBatchLogitsProcessor is None:
+                print("⚠️ 当前 vLLM 不支持 v1 批量 logits 处理器，跳过 n-gram 禁止重复")
+            else:
+                extra_engine_args["logits_processors"] = [NoRepeatNGramBatchLogitsProcessor]
+                self._v1_ngram_enabled = True
+                print(f"🧱 v1 n-gram 禁止重复: ngram={NGRAM_SIZE}, window={NGRAM_WINDOW_SIZE}")
+
         # 创建引擎参数
         engine_args = AsyncEngineArgs(
             model=model_path,
@@ -94,56 +270,436 @@ class VLLMDirectEngine:
             trust_remote_code=True,
             tensor_parallel_size=tensor_parallel_size,
             gpu_memory_utilization=gpu_memory_utilization,
+            **extra_engine_args,
         )
         
         # 创建异步引擎
         print("🚀 创建 AsyncLLMEngine...")
+        step_started = time.perf_counter()
         self.engine = AsyncLLMEngine.from_engine_args(engine_args)
+        self._record_load_step("engine_create", step_started)
+        if not use_v1_engine:
+            VLLMDirectEngine._inprocess_engines += 1
         
         self._loaded = True
         print("✅ vLLM Direct Engine 加载完成!")
+
+        if warmup is not None and warmup.modes:
+            # 预热在后台进行，使 /health 能够报告 warming 状态
+            self.phase = "warming"
+            self._warmup_task = asyncio.create_task(self._run_warmup(warmup))
+        else:
+            self.phase = "ready"
+
+    def _record_load_step(self, name: str, started: float) -> None:
+        self.load_timings[name] = (time.perf_counter() - started) * 1000
+
+    async def wait_until_warm(self) -> None:
+        """等待后台预热结束（单步失败不影响结果），未启用预热时立即返回"""
+        if self._warmup_task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await asyncio.shield(self._warmup_task)
+
+    async def _run_warmup(self, plan: WarmupPlan) -> None:
+        try:
+            self.warmup_report = await self.warmup(plan)
+        finally:
+            if self.is_loaded():
+                self.phase = "ready"
+
+    async def warmup(self, plan: WarmupPlan) -> WarmupReport:
+        """
+        依次对每个模式与代表性切片网格发送合成请求，
+        让 CUDA graph 捕获、kernel 自动调优与显存分配器增长发生在接收流量之前。
+        单步失败只记录错误，不影响服务启动。
+        """
+        report = WarmupReport()
+        started = time.perf_counter()
+        print(f"🔥 开始预热：{len(plan.modes)} 个模式，网格 {plan.grids}")
+        for mode_name, mode in plan.modes.items():
+            # 非裁剪模式只有全局视图，与切片网格无关
+            grids = plan.grids if mode.crop_mode else ((1, 1),)
+            for grid in grids:
+                size = self._warmup_image_size(mode, grid)
+                if size is None:
+                    continue
+                step_started = time.perf_counter()
+                error = None
+                try:
+                    await self.infer(
+                        prompt=plan.prompt,
+                        image_data=self._warmup_image(size),
+                        base_size=mode.base_size,
+                        image_size=mode.image_size,
+                        crop_mode=mode.crop_mode,
+                        max_tokens=plan.max_tokens,
+                        request_id=f"warmup-{uuid.uuid4().hex}",
+                    )
+                except Exception as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                    print(f"⚠️ 预热失败（{mode_name} {grid[0]}x{grid[1]}）: {error}")
+                step = WarmupStep(
+                    mode=mode_name,
+                    grid=f"{grid[0]}x{grid[1]}",
+                    duration_ms=(time.perf_counter() - step_started) * 1000,
+                    error=error,
+                )
+                report.steps.append(step)
+                print(f"🔥 预热 {step.mode} {step.grid}: {step.duration_ms:.0f} ms")
+        report.total_ms = (time.perf_counter() - started) * 1000
+        print(f"✅ 预热完成，用时 {report.total_ms / 1000:.1f}s")
+        return report
+
+    @staticmethod
+    def _warmup_image_size(mode: OcrMode, grid: tuple[int, int]) -> Optional[tuple[int, int]]:
+        """构造能落入指定切片网格的图像尺寸"""
+        cols, rows = grid
+        if not mode.crop_mode or (cols, rows) == (1, 1):
+            side = mode.base_size if not mode.crop_mode else min(mode.image_size, 640)
+            return side, side
+        if not MIN_CROPS <= cols * rows <= MAX_CROPS:
+            print(f"⚠️ 跳过超出切片范围的预热网格 {cols}x{rows}")
+            return None
+        return cols * mode.image_size, rows * mode.image_size
+
+    @staticmethod
+    def _warmup_image(size: tuple[int, int]) -> Image.Image:
+        image = Image.new("RGB", size, color=(255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        for y in range(32, size[1] - 32, 48):
+            draw.rectangle((32, y, size[0] - 32, y + 12), fill=(0, 0, 0))
+        return image
         
+    async def check_health(self) -> bool:
+        """引擎后台进程是否仍然存活"""
+        if self.engine is None:
+            return False
+        if getattr(self.engine, "errored", False):
+            return False
+        check = getattr(self.engine, "check_health", None)
+        if check is not None:
+            try:
+                await check()
+            except Exception as exc:
+                print(f"⚠️ 引擎健康检查失败: {exc}")
+                return False
+        return True
+
     async def unload(self):
-        """卸载引擎"""
-        if self.engine:
-            print("🛑 卸载 vLLM Direct Engine...")
-            # vLLM engine 没有显式的 close 方法，只需要设置为 None
-            self.engine = None
-            self._loaded = False
+        """卸载引擎：中止在途请求、关闭引擎后台进程并释放显存"""
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._warmup_task
+        self._warmup_task = None
+        self.phase = "idle"
+        if self.engine is None:
+            return
+        print("🛑 卸载 vLLM Direct Engine...")
+        for inflight in list(self._inflight.values()):
+            await self._abort_inflight(inflight, "unload")
+        self._inflight.clear()
+        engine, self.engine = self.engine, None
+        self._loaded = False
+        await self._shutdown_engine(engine)
+        destroy_parallel = False
+        if not self._use_v1_engine:
+            VLLMDirectEngine._inprocess_engines -= 1
+            # 仍有其他进程内引擎时保留并行状态，否则会拆掉正在使用的引擎
+            destroy_parallel = VLLMDirectEngine._inprocess_engines == 0
+        await asyncio.to_thread(self._release_memory, destroy_parallel)
+        print("✅ 引擎已卸载")
+
+    @staticmethod
+    async def _shutdown_engine(engine: AsyncLLMEngine) -> None:
+        # v1 的 shutdown() 终止 EngineCore 后台进程；legacy 引擎只需停止后台事件循环
+        try:
+            shutdown = getattr(engine, "shutdown", None)
+            if callable(shutdown):
+                result = shutdown()
+                if inspect.isawaitable(result):
+                    await result
+            else:
+                stop = getattr(engine, "shutdown_background_loop", None)
+                if callable(stop):
+                    stop()
+        except Exception as exc:
+            print(f"⚠️ 关闭引擎失败: {exc}")
+
+    @staticmethod
+    def _release_memory(destroy_parallel: bool) -> None:
+        if destroy_parallel:
+            # legacy 引擎的模型与并行组在 API 进程内，需先销毁才能释放显存
+            try:
+                from vllm.distributed.parallel_state import (
+                    destroy_distributed_environment,
+                    destroy_model_parallel,
+                )
+
+                destroy_model_parallel()
+                destroy_distributed_environment()
+            except Exception as exc:
+                print(f"⚠️ 销毁并行状态失败: {exc}")
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
     
-    def _load_image(self, image_path: str) -> Optional[Image.Image]:
+    async def _build_request(
+        self,
+        prompt: str,
+        image_path: Optional[str],
+        image_data: Optional[Union[Image.Image, PreparedImage]],
+        mode: OcrMode,
+    ) -> dict:
+        """构建 vLLM 请求（含图像预处理）；image_data 可以是预处理 worker 中已分词的 PreparedImage"""
+        image_payload = None
+        image: Optional[Image.Image] = None
+        if isinstance(image_data, PreparedImage):
+            if self._use_v1_engine:
+                raise RuntimeError("v1 引擎需要原始图像，不能使用已分词的输入")
+            if image_data.model_path != self.model_path:
+                raise RuntimeError(
+                    f"图像按 {image_data.model_path} 分词，与当前模型 {self.model_path} 不一致，请重试"
+                )
+            if '<image>' in prompt:
+                metrics.VISION_TOKENS.inc(
+                    plan_tiling(*image_data.size, mode).num_image_tokens,
+                    route=metrics.current_route.get(),
+                )
+                image_payload = image_data.tokens
+        elif '<image>' in prompt:
+            if image_data is not None:
+                image = await self.preprocessor.ensure_rgb(image_data)
+            elif image_path:
+                image = await self.preprocessor.load_file(image_path)
+
+        if image is not None:
+            metrics.VISION_TOKENS.inc(
+                plan_tiling(image.width, image.height, mode).num_image_tokens,
+                route=metrics.current_route.get(),
+            )
+            if self._use_v1_engine:
+                image_payload = image
+            else:
+                image_payload = await self.preprocessor.tokenize(image, mode, self.model_path, prompt)
+
+        if image_payload and '<image>' in prompt:
+            return {
+                "prompt": prompt,
+                "multi_modal_data": {"image": image_payload},
+                "mm_processor_kwargs": mode.to_mm_kwargs(),
+            }
+        return {
+            "prompt": prompt
+        }
+
+    def _build_sampling_params(self, temperature: float, max_tokens: int) -> SamplingParams:
+        """创建采样参数"""
+        # NoRepeatNGramLogitsProcessor: 防止重复 n-gram
+        # whitelist_token_ids: <td>, </td> 标签允许重复
+        logits_processors = None
+        if not self._use_v1_engine:
+            logits_processors = [
+                NoRepeatNGramLogitsProcessor(
+                    ngram_size=NGRAM_SIZE,
+                    window_size=NGRAM_WINDOW_SIZE,
+                    whitelist_token_ids=set(NGRAM_WHITELIST_TOKEN_IDS)
+                )
+            ]
+
+        sampling_params_kwargs = dict(
+            temperature=temperature,
+            max_tokens=max_tokens,
+            skip_special_tokens=False,
+        )
+        if logits_processors is not None:
+            sampling_params_kwargs["logits_processors"] = logits_processors
+        elif self._v1_ngram_enabled:
+            # v1：同样的参数交给引擎注册的批量处理器
+            sampling_params_kwargs["extra_args"] = ngram_extra_args()
+
+        return SamplingParams(**sampling_params_kwargs)
+
+    async def infer_stream(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        image_data: Optional[Union[Image.Image, PreparedImage]] = None,
+        base_size: int = 1024,
+        image_size: int = 640,
+        crop_mode: bool = True,
+        temperature: float = 0.0,
+        max_tokens: int = 8192,
+        request_id: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> AsyncIterator[StreamChunk]:
         """
-        加载图像并处理 EXIF 旋转
-        
-        Args:
-            image_path: 图像文件路径
-            
-        Returns:
-            PIL Image 对象
+        流式推理，逐步产出增量文本
+
+        参数与 infer 相同。最后一个 chunk 的 finished 为 True，text 为完整输出。
+        调用方取消、提前关闭生成器或超过 timeout 时，会立即 abort 引擎中的请求，
+        释放 GPU 与 KV cache。v1 路径下检测到重复循环时同样中止请求，
+        最后一个 chunk 的 truncated 为 True，text 为裁剪掉重复尾部后的内容。
+
+        Raises:
+            TimeoutError: 超过 timeout 秒仍未完成
         """
+        if not self.is_loaded():
+            raise RuntimeError("Engine 未加载，请先调用 load()")
+
+        # 模式参数随请求传递，避免并发请求互相覆盖全局配置
+        mode = OcrMode(base_size=base_size, image_size=image_size, crop_mode=crop_mode)
+        with metrics.stage_timer("preprocess"):
+            request = await self._build_request(prompt, image_path, image_data, mode)
+        sampling_params = self._build_sampling_params(temperature, max_tokens)
+        request_id = request_id or f"ocr-{uuid.uuid4().hex}"
+        if request_id in self._inflight:
+            raise ValueError(f"重复的 request_id: {request_id}")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout and timeout > 0 else None
+        inflight = InflightRequest(
+            request_id=request_id, started_at=time.monotonic(), max_tokens=max_tokens
+        )
+        self._inflight[request_id] = inflight
+        finished = False
+        abort_reason = "cancelled"
+        detector = None
+        if self.loop_detection is not None and self._use_v1_engine:
+            detector = RepetitionDetector(self.loop_detection)
+        # (已生成 token 数, 文本长度) 对照，用于按 token 位置裁剪文本
+        token_marks: list[int] = []
+        text_marks: list[int] = []
+
+        generator = self.engine.generate(request, sampling_params, request_id)
         try:
-            image = Image.open(image_path)
-            # 根据 EXIF 信息自动旋转
-            corrected_image = ImageOps.exif_transpose(image)
-            return corrected_image
-        except Exception as e:
-            print(f"❌ 加载图像失败: {e}")
+            previous_text = ""
+            while True:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        abort_reason = "timeout"
+                        raise TimeoutError(f"推理超时（{timeout}s）: {request_id}")
+                try:
+                    request_output = await asyncio.wait_for(generator.__anext__(), remaining)
+                except StopAsyncIteration:
+                    finished = True
+                    break
+                except asyncio.TimeoutError as exc:
+                    abort_reason = "timeout"
+                    raise TimeoutError(f"推理超时（{timeout}s）: {request_id}") from exc
+
+                if not request_output.outputs:
+                    continue
+                output = request_output.outputs[0]
+                inflight.num_tokens = len(output.token_ids)
+                if inflight.first_token_at is None and inflight.num_tokens:
+                    inflight.first_token_at = time.monotonic()
+                    metrics.observe_stage("ttft", inflight.first_token_at - inflight.started_at)
+                finished = request_output.finished
+                text = output.text
+
+                if detector is not None and not finished:
+                    token_marks.append(inflight.num_tokens)
+                    text_marks.append(len(text))
+                    match = detector.check(output.token_ids)
+                    if match is not None:
+                        abort_reason = "loop"
+                        keep_index = bisect.bisect_right(token_marks, match.keep_tokens) - 1
+                        trimmed = text[:text_marks[keep_index]] if keep_index >= 0 else ""
+                        tokens_saved = max(max_tokens - inflight.num_tokens, 0)
+                        self.stats.loops_detected += 1
+                        self.stats.loop_tokens_saved += tokens_saved
+                        print(
+                            f"🔁 检测到重复循环 {request_id}: 周期 {match.period} tokens，"
+                            f"已生成 {inflight.num_tokens}，节省约 {tokens_saved} tokens"
+                        )
+                        yield StreamChunk(
+                            delta="",
+                            text=trimmed,
+                            finished=True,
+                            num_tokens=inflight.num_tokens,
+                            truncated=True,
+                            tokens_saved=tokens_saved,
+                        )
+                        break
+
+                delta = text[len(previous_text):]
+                previous_text = text
+                if delta or finished:
+                    yield StreamChunk(
+                        delta=delta,
+                        text=text,
+                        finished=finished,
+                        num_tokens=inflight.num_tokens,
+                    )
+        finally:
+            self._inflight.pop(request_id, None)
+            self._record_decode_metrics(inflight, completed=finished or abort_reason == "loop")
+            if not finished:
+                await self._abort_inflight(inflight, abort_reason)
+            await generator.aclose()
+
+    @staticmethod
+    def _record_decode_metrics(inflight: InflightRequest, completed: bool) -> None:
+        route = metrics.current_route.get()
+        metrics.GENERATED_TOKENS.inc(inflight.num_tokens, route=route)
+        if not completed or inflight.first_token_at is None:
+            return
+        decode_seconds = time.monotonic() - inflight.first_token_at
+        metrics.observe_stage("decode", decode_seconds, route)
+        if decode_seconds > 0 and inflight.num_tokens > 1:
+            metrics.DECODE_TOKENS_PER_SECOND.observe(
+                (inflight.num_tokens - 1) / decode_seconds, route=route
+            )
+
+    def inflight_request_ids(self) -> list[str]:
+        """当前在引擎中执行的请求 ID"""
+        return list(self._inflight)
+
+    async def abort(self, request_id: str, reason: str = "manual") -> bool:
+        """主动中止指定请求，返回是否找到该请求"""
+        inflight = self._inflight.pop(request_id, None)
+        if inflight is None:
+            return False
+        await self._abort_inflight(inflight, reason)
+        return True
+
+    async def _abort_inflight(self, inflight: InflightRequest, reason: str) -> None:
+        if self.engine is not None:
             try:
-                return Image.open(image_path)
-            except:
-                return None
-    
+                await self.engine.abort(inflight.request_id)
+            except Exception as exc:
+                print(f"⚠️ 中止请求失败 {inflight.request_id}: {exc}")
+
+        # 以已观测到的解码速度估算剩余 token 本应占用的 GPU 时间
+        reclaimed = 0.0
+        if inflight.first_token_at is not None and inflight.num_tokens > 1:
+            per_token = (time.monotonic() - inflight.first_token_at) / (inflight.num_tokens - 1)
+            reclaimed = max(inflight.max_tokens - inflight.num_tokens, 0) * per_token
+        self.stats.aborted_requests += 1
+        self.stats.aborted_by_reason[reason] = self.stats.aborted_by_reason.get(reason, 0) + 1
+        self.stats.reclaimed_gpu_seconds += reclaimed
+        print(
+            f"🛑 已中止请求 {inflight.request_id}（{reason}），"
+            f"已生成 {inflight.num_tokens} tokens，估算回收 {reclaimed:.1f}s"
+        )
+
     async def infer(
         self,
         prompt: str,
         image_path: Optional[str] = None,
-        image_data: Optional[Image.Image] = None,
+        image_data: Optional[Union[Image.Image, PreparedImage]] = None,
         base_size: int = 1024,
         image_size: int = 640,
         crop_mode: bool = True,
         temperature: float = 0.0,
         max_tokens: int = 8192,
         test_compress: bool = False,
+        request_id: Optional[str] = None,
+        timeout: Optional[float] = None,
         **kwargs
     ) -> str:
         """
@@ -158,84 +714,59 @@ class VLLMDirectEngine:
             temperature: 采样温度
             max_tokens: 最大生成 token 数
             test_compress: 是否测试压缩
+            request_id: 请求 ID（默认自动生成 UUID）
+            timeout: 超时秒数，超时后中止引擎请求并抛出 TimeoutError
             
         Returns:
             生成的文本
         """
-        if not self.is_loaded():
-            raise RuntimeError("Engine 未加载，请先调用 load()")
-        
-        # 设置配置参数（运行时覆盖）
-        vllm_config.BASE_SIZE = base_size
-        vllm_config.IMAGE_SIZE = image_size
-        vllm_config.CROP_MODE = crop_mode
-        
-        # 处理图像（如果提供）
-        image_payload = None
-        source_image: Optional[Image.Image] = None
-        if image_data is not None:
-            source_image = image_data
-        elif image_path and '<image>' in prompt:
-            source_image = self._load_image(image_path)
-            if source_image is None:
-                raise ValueError(f"无法加载图像: {image_path}")
-
-        if source_image is not None and '<image>' in prompt:
-            image = source_image.convert('RGB')
-
-            if self._use_v1_engine:
-                image_payload = image
-            else:
-                processor = DeepseekOCRProcessor()
-                image_payload = processor.tokenize_with_images(
-                    images=[image],
-                    bos=True,
-                    eos=True,
-                    cropping=crop_mode
-                )
-        
-        # 创建采样参数
-        # NoRepeatNGramLogitsProcessor: 防止重复 n-gram
-        # whitelist_token_ids: <td>, </td> 标签允许重复
-        logits_processors = None
-        if not self._use_v1_engine:
-            logits_processors = [
-                NoRepeatNGramLogitsProcessor(
-                    ngram_size=30,
-                    window_size=90,
-                    whitelist_token_ids={128821, 128822}
-                )
-            ]
-        
-        sampling_params_kwargs = dict(
+        result = await self.infer_result(
+            prompt=prompt,
+            image_path=image_path,
+            image_data=image_data,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
             temperature=temperature,
             max_tokens=max_tokens,
-            skip_special_tokens=False,
+            request_id=request_id,
+            timeout=timeout,
         )
-        if logits_processors is not None:
-            sampling_params_kwargs["logits_processors"] = logits_processors
-        
-        sampling_params = SamplingParams(**sampling_params_kwargs)
-        
-        # 构建请求
-        request_id = f"request-{int(time.time() * 1000)}"
-        
-        if image_payload and '<image>' in prompt:
-            request = {
-                "prompt": prompt,
-                "multi_modal_data": {"image": image_payload}
-            }
-        else:
-            request = {
-                "prompt": prompt
-            }
-        
-        # 执行推理（流式）
-        full_text = ""
-        async for request_output in self.engine.generate(
-            request, sampling_params, request_id
+        return result.text
+
+    async def infer_result(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        image_data: Optional[Union[Image.Image, PreparedImage]] = None,
+        base_size: int = 1024,
+        image_size: int = 640,
+        crop_mode: bool = True,
+        temperature: float = 0.0,
+        max_tokens: int = 8192,
+        request_id: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> InferenceResult:
+        """与 infer 相同，但返回包含 token 数与循环截断信息的结构化结果"""
+        result = InferenceResult(text="")
+        async for chunk in self.infer_stream(
+            prompt=prompt,
+            image_path=image_path,
+            image_data=image_data,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            request_id=request_id,
+            timeout=timeout,
         ):
-            if request_output.outputs:
-                full_text = request_output.outputs[0].text
-        
-        return full_text
+            result = InferenceResult(
+                text=chunk.text,
+                num_tokens=chunk.num_tokens,
+                truncated=chunk.truncated,
+                tokens_saved=chunk.tokens_saved,
+            )
+
+        return result
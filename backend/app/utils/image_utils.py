@@ -1,57 +1,19 @@
 """
 图像处理工具函数
 """
-import tempfile
+import io
+import zipfile
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from PIL import Image
 
 
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+
+
 class ImageUtils:
     """图像处理工具类"""
     
-    @staticmethod
-    async def save_upload_file(upload_file, suffix: Optional[str] = None) -> str:
-        """
-        保存上传的文件到临时位置
-        
-        Args:
-            upload_file: FastAPI UploadFile 对象
-        
-        Returns:
-            临时文件路径
-        """
-        ext = suffix or ""
-        if not ext:
-            original = Path(upload_file.filename or "")
-            if original.suffix:
-                ext = original.suffix
-            else:
-                ext = ".png"
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            content = await upload_file.read()
-            tmp.write(content)
-            return tmp.name
-    
-    @staticmethod
-    def get_image_dimensions(image_path: str) -> Tuple[Optional[int], Optional[int]]:
-        """
-        获取图像尺寸
-        
-        Args:
-            image_path: 图像文件路径
-            
-        Returns:
-            (width, height) 或 (None, None)
-        """
-        try:
-            with Image.open(image_path) as img:
-                return img.size
-        except Exception as e:
-            print(f"⚠️ Failed to get image dimensions: {e}")
-            return None, None
-    
     @staticmethod
     def validate_image(image_path: str) -> bool:
         """
@@ -69,3 +31,48 @@ class ImageUtils:
             return True
         except Exception:
             return False
+
+    @staticmethod
+    def is_zip_upload(filename: Optional[str], content_type: Optional[str]) -> bool:
+        """判断上传文件是否为 zip 压缩包"""
+        if (content_type or "").lower() in {"application/zip", "application/x-zip-compressed"}:
+            return True
+        return Path(filename or "").suffix.lower() == ".zip"
+
+    @staticmethod
+    def extract_zip_images(
+        data: bytes, max_items: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> List[Tuple[str, bytes]]:
+        """
+        按压缩包内顺序提取图像文件
+
+        解压前先按中央目录中的条目数与声明的解压后大小检查上限（读取时不会超过声明大小），
+        避免压缩炸弹耗尽内存。
+
+        Args:
+            data: zip 文件字节
+            max_items: 图像条目数上限
+            max_bytes: 图像条目解压后的总字节数上限
+
+        Returns:
+            (文件名, 字节) 列表，忽略目录与非图像文件
+
+        Raises:
+            zipfile.BadZipFile: 不是有效的 zip 文件
+            ValueError: 超过条目数或解压大小上限
+        """
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = []
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = Path(info.filename)
+                if name.name.startswith(".") or name.suffix.lower() not in IMAGE_EXTENSIONS:
+                    continue
+                members.append(info)
+            if max_items is not None and len(members) > max_items:
+                raise ValueError(f"压缩包内图片数量 {len(members)} 超过剩余上限 {max_items}")
+            total = sum(info.file_size for info in members)
+            if max_bytes is not None and total > max_bytes:
+                raise ValueError(f"压缩包解压后 {total} 字节，超过剩余上限 {max_bytes} 字节")
+            return [(info.filename, archive.read(info)) for info in members]
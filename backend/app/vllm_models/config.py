@@ -3,6 +3,7 @@ DeepSeek OCR 配置文件
 适配后端应用使用
 """
 import os
+from typing import NamedTuple, Optional
 
 # 模型配置模式参考：
 # Tiny: base_size=512, image_size=512, crop_mode=False
@@ -12,11 +13,14 @@ import os
 # Gundam: base_size=1024, image_size=640, crop_mode=True (推荐)
 
 # 图像处理参数（从环境变量读取，提供默认值）
+# 注意：以下仅为进程级默认值，单次请求的模式通过 mm_processor_kwargs 传递，运行时不得修改
 BASE_SIZE = int(os.environ.get('BASE_SIZE', '1024'))
 IMAGE_SIZE = int(os.environ.get('IMAGE_SIZE', '640'))
 CROP_MODE = os.environ.get('CROP_MODE', 'True').lower() in ('true', '1', 'yes')
 MIN_CROPS = 2
 MAX_CROPS = 9  # 最大值为9，如果 GPU 内存较小建议设为6
+# 像素保持 uint8 直到进入 GPU，在模型内归一化（仅自定义模型实现支持）
+UINT8_PIXELS = os.environ.get('OCR_UINT8_PIXELS', 'False').lower() in ('true', '1', 'yes')
 
 # 推理引擎参数
 MAX_CONCURRENCY = 200  # 最大并发数，GPU 内存有限时请降低
@@ -31,3 +35,61 @@ MODEL_PATH = os.environ.get('MODEL_PATH', 'deepseek-ai/DeepSeek-OCR')
 
 # 默认提示词
 PROMPT = '<image>\n<|grounding|>Convert the document to markdown.'
+
+
+class OcrMode(NamedTuple):
+    """单次请求使用的 OCR 分辨率模式"""
+
+    base_size: int
+    image_size: int
+    crop_mode: bool
+
+    def to_mm_kwargs(self) -> dict:
+        """转换为 vLLM mm_processor_kwargs"""
+        return {
+            "base_size": self.base_size,
+            "image_size": self.image_size,
+            "crop_mode": self.crop_mode,
+        }
+
+
+# 预设模式档位（名称不区分大小写）
+OCR_MODES = {
+    "tiny": OcrMode(base_size=512, image_size=512, crop_mode=False),
+    "small": OcrMode(base_size=640, image_size=640, crop_mode=False),
+    "base": OcrMode(base_size=1024, image_size=1024, crop_mode=False),
+    "large": OcrMode(base_size=1280, image_size=1280, crop_mode=False),
+    "gundam": OcrMode(base_size=1024, image_size=640, crop_mode=True),
+}
+
+DEFAULT_MODE = OcrMode(base_size=BASE_SIZE, image_size=IMAGE_SIZE, crop_mode=CROP_MODE)
+
+
+def resolve_mode(
+    name: Optional[str] = None,
+    base_size: Optional[int] = None,
+    image_size: Optional[int] = None,
+    crop_mode: Optional[bool] = None,
+    default: Optional[OcrMode] = None,
+) -> OcrMode:
+    """
+    解析请求级 OCR 模式
+
+    优先使用命名档位，其次使用显式参数，未提供的字段回退到 default。
+
+    Raises:
+        ValueError: 未知的模式名称
+    """
+    fallback = default or DEFAULT_MODE
+    if name:
+        mode = OCR_MODES.get(name.strip().lower())
+        if mode is None:
+            raise ValueError(
+                f"Unknown OCR mode '{name}', expected one of: {', '.join(OCR_MODES)}"
+            )
+        return mode
+    return OcrMode(
+        base_size=base_size or fallback.base_size,
+        image_size=image_size or fallback.image_size,
+        crop_mode=fallback.crop_mode if crop_mode is None else crop_mode,
+    )
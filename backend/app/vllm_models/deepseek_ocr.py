@@ -8,6 +8,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange, repeat
+from PIL import Image
 from transformers import BatchFeature
 
 from vllm.config import VllmConfig
@@ -28,7 +29,8 @@ from vllm.transformers_utils.configs.deepseek_vl2 import (DeepseekVLV2Config,
                                                           MlpProjectorConfig,
                                                           VisionEncoderConfig)
 from .process.image_process import (
-    DeepseekOCRProcessor, count_tiles)
+    DeepseekOCRProcessor, get_cached_processor, normalize_pixels)
+from .process.tiling import plan_tiling
 from vllm.transformers_utils.tokenizer import cached_tokenizer_from_config
 # from vllm.utils import is_list_of
 
@@ -42,7 +44,7 @@ from .deepencoder.clip_sdpa import build_clip_l
 from .deepencoder.build_linear import MlpProjector
 from addict import Dict
 # import time
-from .config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, PRINT_NUM_VIS_TOKENS, PROMPT
+from .config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, PRINT_NUM_VIS_TOKENS, PROMPT, OcrMode
 # The image token id may be various
 _IMAGE_TOKEN = "<image>"
 
@@ -62,48 +64,16 @@ class DeepseekOCRProcessingInfo(BaseProcessingInfo):
                              *,
                              image_width: int,
                              image_height: int,
-                             cropping: bool = True) -> int:
-        hf_processor = self.get_hf_processor()
-
-
-        # image_size = hf_processor.image_size
-        # patch_size = hf_processor.patch_size
-        # downsample_ratio = hf_processor.downsample_ratio
-
-        image_size = IMAGE_SIZE
-        base_size = BASE_SIZE
-        patch_size = 16
-        downsample_ratio = 4
-
-        if CROP_MODE:
-            if image_width <= 640 and image_height <= 640:
-                crop_ratio = [1, 1]
-            else:
-                # images_crop_raw, crop_ratio = hf_processor.dynamic_preprocess(image)
-
-                # find the closest aspect ratio to the target
-                crop_ratio = count_tiles(image_width, image_height, image_size=IMAGE_SIZE)
-
-                # print('===========')
-                # print('crop_ratio ', crop_ratio)
-                # print('============')
-                
-            num_width_tiles, num_height_tiles = crop_ratio
-        else:
-            num_width_tiles = num_height_tiles = 1
-
-        h = w = math.ceil((base_size // patch_size) / downsample_ratio)
-
-        h2 = w2 = math.ceil((image_size // patch_size) / downsample_ratio)
-
-        global_views_tokens = h * (w + 1)
-        if num_width_tiles >1 or num_height_tiles>1:
-            local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
-        else:
-            local_views_tokens = 0
-
-
-        return global_views_tokens + local_views_tokens + 1
+                             cropping: Optional[bool] = None,
+                             base_size: Optional[int] = None,
+                             image_size: Optional[int] = None) -> int:
+        # 模式参数来自请求的 mm_processor_kwargs，缺省时使用进程默认值；结果取自共享的切片规划缓存
+        mode = OcrMode(
+            base_size=BASE_SIZE if base_size is None else base_size,
+            image_size=IMAGE_SIZE if image_size is None else image_size,
+            crop_mode=CROP_MODE if cropping is None else cropping,
+        )
+        return plan_tiling(image_width, image_height, mode).num_image_tokens
 
     def get_image_size_with_most_features(self) -> ImageSize:
 
@@ -136,7 +106,7 @@ class DeepseekOCRDummyInputsBuilder(
         if '<image>' in PROMPT:
             return {
                 "image":
-                DeepseekOCRProcessor().tokenize_with_images(images = self._get_dummy_images(width=max_image_size.width,
+                get_cached_processor(model_path=self.info.ctx.model_config.tokenizer).tokenize_with_images(images = self._get_dummy_images(width=max_image_size.width,
                                     height=max_image_size.height,
                                     num_images=num_images), bos=True, eos=True, cropping=CROP_MODE)
             }
@@ -210,14 +180,19 @@ class DeepseekOCRMultiModalProcessor(
             else:
 
                 
-                width = images[0][-1][0][0]
-                height = images[0][-1][0][1]
+                item = images.get(item_idx)
+                if isinstance(item, Image.Image):
+                    width, height = item.size
+                else:
+                    width = images[0][-1][0][0]
+                    height = images[0][-1][0][1]
 
                 num_image_tokens = self.info.get_num_image_tokens(
                     image_width=width,
                     image_height=height,
-                    # flag = True,
-                    cropping=CROP_MODE,
+                    cropping=hf_processor.crop_mode,
+                    base_size=hf_processor.base_size,
+                    image_size=hf_processor.image_size,
                 )
             return [image_token_id] * num_image_tokens
 
@@ -339,7 +314,10 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         images_crop = kwargs.pop("images_crop", None)
 
 
-        if pixel_values is None or torch.sum(pixel_values).item() == 0:
+        # 全零的 float 占位张量表示没有图像；uint8 像素的全零是合法的纯黑图像
+        if pixel_values is None or (
+                isinstance(pixel_values, torch.Tensor) and pixel_values.dtype != torch.uint8
+                and torch.sum(pixel_values).item() == 0):
             return None
 
         if pixel_values is not None:
@@ -385,11 +363,13 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         with torch.no_grad():
             for jdx in range(images_spatial_crop.size(0)):
                 # with torch.set_grad_enabled(False):
-                patches = images_crop[jdx][0].to(torch.bfloat16) # batch_size = 1
+                patches = images_crop[jdx][0] # batch_size = 1
                 image_ori = pixel_values[jdx]
                 crop_shape = images_spatial_crop[jdx][0]
 
-                if torch.sum(patches).item() != 0:  # if all values = 0, no crop
+                # 只有网格大于 1x1 时才有局部切片（uint8 的纯黑切片求和同样为 0，不能据此判断）
+                if crop_shape[0] * crop_shape[1] > 1:
+                    patches = normalize_pixels(patches, dtype=torch.bfloat16)
                     # P, C, H, W = patches.shape
                     # crop_flag = 1
                     local_features_1 = self.sam_model(patches)
@@ -473,7 +453,8 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
 
         # image_input: [pixel_values, images_crop, images_spatial_crop]
     
-        pixel_values = image_input[0].to(torch.bfloat16)
+        # uint8 像素在此（已位于 GPU）归一化，float 像素仅转换类型
+        pixel_values = normalize_pixels(image_input[0], dtype=torch.bfloat16)
         # print(image_input[1][0].shape)
         # print(type(image_input[1]))
         # exit()
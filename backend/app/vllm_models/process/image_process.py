@@ -1,70 +1,47 @@
-import math
-from typing import List, Tuple
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import torch
 import torchvision.transforms as T
 from PIL import Image, ImageOps
 from transformers import AutoProcessor, BatchFeature, LlamaTokenizerFast
 from transformers.processing_utils import ProcessorMixin
-from ..config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS, PROMPT
-
-def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
-    best_ratio_diff = float('inf')
-    best_ratio = (1, 1)
-    area = width * height
-    for ratio in target_ratios:
-        target_aspect_ratio = ratio[0] / ratio[1]
-        ratio_diff = abs(aspect_ratio - target_aspect_ratio)
-        if ratio_diff < best_ratio_diff:
-            best_ratio_diff = ratio_diff
-            best_ratio = ratio
-        elif ratio_diff == best_ratio_diff:
-            if area > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
-                best_ratio = ratio
-    # print(f'width: {width}, height: {height}, best_ratio: {best_ratio}')
-    return best_ratio
+from ..config import (IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS, MODEL_PATH, PROMPT,
+                      UINT8_PIXELS, OcrMode)
+from .tiling import closest_grid, plan_tiling
 
+IMAGE_MEAN = (0.5, 0.5, 0.5)
+IMAGE_STD = (0.5, 0.5, 0.5)
+# 按提示词缓存的 token 模板数量；接口允许自定义提示词，需要有上限
+PROMPT_TEMPLATE_CACHE_SIZE = 512
 
 def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
-    aspect_ratio = orig_width / orig_height
+    return closest_grid(orig_width, orig_height, min_num=min_num, max_num=max_num, image_size=image_size)
 
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
 
-    # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+def resize_for_tiles(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640):
+    """选择切片网格并把图像缩放到 (列数 * image_size, 行数 * image_size)，返回缩放后的图像与 (列数, 行数)"""
+    target_aspect_ratio = count_tiles(*image.size, min_num=min_num, max_num=max_num, image_size=image_size)
+    target_width = image_size * target_aspect_ratio[0]
+    target_height = image_size * target_aspect_ratio[1]
+    return image.resize((target_width, target_height)), target_aspect_ratio
+
 
-    return target_aspect_ratio
+def tile_views(pixels: torch.Tensor, crop_ratio, image_size: int) -> torch.Tensor:
+    """把 [行数 * size, 列数 * size, 3] 的像素视为 [行数, 列数, 3, size, size] 的切片（不复制），
+    展平前两维后的顺序与 dynamic_preprocess 一致：先行后列"""
+    num_width_tiles, num_height_tiles = crop_ratio
+    return pixels.view(num_height_tiles, image_size, num_width_tiles, image_size, 3).permute(0, 2, 4, 1, 3)
 
 
 def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
-    orig_width, orig_height = image.size
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
-
-    # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
-
-    # print(target_aspect_ratio)
-    # calculate the target width and height
-    target_width = image_size * target_aspect_ratio[0]
-    target_height = image_size * target_aspect_ratio[1]
+    resized_img, target_aspect_ratio = resize_for_tiles(
+        image, min_num=min_num, max_num=max_num, image_size=image_size)
+    target_width, _ = resized_img.size
     blocks = target_aspect_ratio[0] * target_aspect_ratio[1]
 
-    # resize the image
-    resized_img = image.resize((target_width, target_height))
     processed_images = []
     for i in range(blocks):
         box = (
@@ -86,15 +63,43 @@ def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=6
 
 
 
+def image_pixels(image: Image.Image) -> torch.Tensor:
+    """RGB 图像转为 [H, W, 3] uint8 张量（一次拷贝）"""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return torch.from_numpy(np.array(image, dtype=np.uint8))
+
+
+def normalize_pixels(
+    pixels: torch.Tensor,
+    mean: Tuple[float, float, float] = IMAGE_MEAN,
+    std: Tuple[float, float, float] = IMAGE_STD,
+    dtype: torch.dtype = torch.float32,
+) -> torch.Tensor:
+    """
+    把 [..., 3, H, W] 的 uint8 像素归一化为 dtype：(x / 255 - mean) / std；非 uint8 输入只做类型转换。
+    运算始终在 float32 中进行再转换为 dtype，结果与 CPU 上 float32 归一化后再转换一致
+    """
+    if pixels.dtype != torch.uint8:
+        return pixels.to(dtype)
+    shape = (3, 1, 1)
+    scale = torch.tensor([1.0 / (255.0 * s) for s in std], dtype=torch.float32, device=pixels.device).view(shape)
+    shift = torch.tensor([m / s for m, s in zip(mean, std)], dtype=torch.float32, device=pixels.device).view(shape)
+    return pixels.to(torch.float32).mul_(scale).sub_(shift).to(dtype)
+
+
 class ImageTransform:
 
     def __init__(self,
-                 mean: Tuple[float, float, float] = (0.5, 0.5, 0.5),
-                 std: Tuple[float, float, float] = (0.5, 0.5, 0.5),
-                 normalize: bool = True):
+                 mean: Tuple[float, float, float] = IMAGE_MEAN,
+                 std: Tuple[float, float, float] = IMAGE_STD,
+                 normalize: bool = True,
+                 uint8: bool = False):
         self.mean = mean
         self.std = std
         self.normalize = normalize
+        # uint8=True 时像素保持 uint8 直到进入模型所在设备，由模型完成归一化
+        self.uint8 = uint8
 
         transform_pipelines = [T.ToTensor()]
 
@@ -102,11 +107,34 @@ class ImageTransform:
             transform_pipelines.append(T.Normalize(mean, std))
 
         self.transform = T.Compose(transform_pipelines)
+        # 与 ToTensor + Normalize 等价的 x * scale - shift
+        if normalize:
+            self._scale = torch.tensor([1.0 / (255.0 * s) for s in std]).view(3, 1, 1)
+            self._shift = torch.tensor([m / s for m, s in zip(mean, std)]).view(3, 1, 1)
+        else:
+            self._scale = torch.full((3, 1, 1), 1.0 / 255.0)
+            self._shift = torch.zeros((3, 1, 1))
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return torch.uint8 if self.uint8 else torch.float32
 
     def __call__(self, pil_img: Image.Image):
         x = self.transform(pil_img)
         return x
 
+    def pack(self, views: torch.Tensor, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """把 [..., 3, H, W] 的 uint8 视图一次性拷贝为连续张量，并以单次向量化运算归一化
+
+        out 为调用方预先分配的同形状连续张量（如共享内存中的输出缓冲），缺省时新建。
+        """
+        if out is None:
+            out = torch.empty(views.shape, dtype=self.dtype)
+        out.copy_(views)
+        if self.uint8:
+            return out
+        return out.mul_(self._scale).sub_(self._shift)
+
 
 class DeepseekOCRProcessor(ProcessorMixin):
     tokenizer_class = ("LlamaTokenizer", "LlamaTokenizerFast")
@@ -118,8 +146,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
         candidate_resolutions: Tuple[Tuple[int, int]] = [[1024, 1024]],
         patch_size: int = 16,
         downsample_ratio: int = 4,
-        image_mean: Tuple[float, float, float] = (0.5, 0.5, 0.5),
-        image_std: Tuple[float, float, float] = (0.5, 0.5, 0.5),
+        image_mean: Tuple[float, float, float] = IMAGE_MEAN,
+        image_std: Tuple[float, float, float] = IMAGE_STD,
         normalize: bool = True,
         image_token: str = "<image>",
         pad_token: str = "<｜▁pad▁｜>",
@@ -127,12 +155,18 @@ class DeepseekOCRProcessor(ProcessorMixin):
         sft_format: str = "deepseek",
         mask_prompt: bool = True,
         ignore_id: int = -100,
+        base_size: int = None,
+        image_size: int = None,
+        crop_mode: bool = None,
+        uint8_pixels: bool = None,
         **kwargs,
     ):
 
         # self.candidate_resolutions = candidate_resolutions # placeholder no use
-        self.image_size = IMAGE_SIZE
-        self.base_size = BASE_SIZE
+        # 模式参数随请求传入（mm_processor_kwargs），未提供时回退到进程默认值
+        self.image_size = IMAGE_SIZE if image_size is None else image_size
+        self.base_size = BASE_SIZE if base_size is None else base_size
+        self.crop_mode = CROP_MODE if crop_mode is None else crop_mode
         # self.patch_size = patch_size
         self.patch_size = 16 
         self.image_mean = image_mean
@@ -141,13 +175,14 @@ class DeepseekOCRProcessor(ProcessorMixin):
         # self.downsample_ratio = downsample_ratio
         self.downsample_ratio = 4
 
-        self.image_transform = ImageTransform(mean=image_mean, std=image_std, normalize=normalize)
+        # uint8 像素跨进程传输量为 float32 的 1/4，由模型在 GPU 上归一化
+        self.uint8_pixels = UINT8_PIXELS if uint8_pixels is None else uint8_pixels
+        self.image_transform = ImageTransform(
+            mean=image_mean, std=image_std, normalize=normalize, uint8=self.uint8_pixels)
 
-        # 如果没有提供 tokenizer，从模型路径加载
+        # 如果没有提供 tokenizer，复用进程级缓存的 tokenizer
         if tokenizer is None:
-            from transformers import AutoTokenizer
-            from ..config import MODEL_PATH
-            self.tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
+            self.tokenizer = get_cached_tokenizer()
         else:
             self.tokenizer = tokenizer
         
@@ -272,6 +307,11 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         sft_format = prompt
 
+        # v1 引擎直接传入 PIL 图像，需要在此完成切片与分词
+        if images and isinstance(images[0], Image.Image):
+            images = self.tokenize_with_images(
+                images=images, bos=True, eos=True, cropping=self.crop_mode, conversation=prompt)
+
         input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, _ = images[0]
 
 
@@ -332,53 +372,55 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
     def tokenize_with_images(
         self,
-        # conversation: str,
         images: List[Image.Image],
         bos: bool = True,
         eos: bool = True,
         cropping: bool = True,
+        conversation: Optional[str] = None,
+        allocate: Optional[Callable[[Tuple[int, ...], torch.dtype], torch.Tensor]] = None,
     ):
-        """Tokenize text with <image> tags."""
+        """Tokenize text with <image> tags.
 
-        # print(conversation)
-        conversation = PROMPT
+        conversation 为调用方的实际提示词，缺省时使用默认 PROMPT。文本片段与图像占位序列取自按
+        (提示词, 图像 token 数) 缓存的模板张量，每次调用只做张量拼接；推理模式下末尾不含 eos。
+        allocate(shape, dtype) 为 pixel_values / images_crop / images_spatial_crop 的分配函数
+        （如共享内存 slot），缺省为 torch.empty；各视图直接归一化写入其中，不再额外拼接。
+        """
+
+        if conversation is None:
+            conversation = PROMPT
         assert conversation.count(self.image_token) == len(images)
-        text_splits = conversation.split(self.image_token)
-        images_list, images_crop_list, images_seq_mask, images_spatial_crop = [], [], [], []
+        if allocate is None:
+            allocate = _empty
+        text_segments = _prompt_template(self.tokenizer, conversation, self.image_token, self.bos_id if bos else None)
+        # 切片网格与缩放目标来自共享的切片规划缓存（与视觉 token 估算一致），先规划再按总量一次分配输出
+        mode = OcrMode(self.base_size, self.image_size, bool(cropping))
+        plans = [plan_tiling(*image.size, mode) for image in images]
+        num_crops = sum(plan.num_tiles for plan in plans if plan.has_local_views)
+        pixel_dtype = self.image_transform.dtype
+        if images:
+            pixel_values = allocate((len(images), 3, self.base_size, self.base_size), pixel_dtype)
+            images_spatial_crop = allocate((len(images), 2), torch.long)
+        else:
+            pixel_values = torch.zeros((1, 3, self.base_size, self.base_size), dtype=pixel_dtype)
+            images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
+        images_crop = allocate((1, max(num_crops, 1), 3, self.image_size, self.image_size), pixel_dtype)
+        if num_crops == 0:
+            images_crop.zero_()
+
         image_shapes = []
         num_image_tokens = []
-        tokenized_str = []
-        # print('image: ', len(images))
-        for text_sep, image in zip(text_splits, images):
-            """encode text_sep"""
-            tokenized_sep = self.encode(text_sep, bos=False, eos=False)
-            tokenized_str += tokenized_sep
-            images_seq_mask += [False] * len(tokenized_sep)
-
-            """select best resolution for anyres"""
-            # if cropping:
-            #     best_width, best_height = self.select_best_resolution(image.size)
-            # else:
-            #     best_width, best_height = self.image_size, self.image_size
+        token_pieces = []
+        crop_offset = 0
+        for index, (text_tokens, image, plan) in enumerate(zip(text_segments, images, plans)):
+            token_pieces.append(text_tokens)
 
             image_shapes.append(image.size)
 
-            if image.size[0] <= 640 and image.size[1] <= 640:
-                crop_ratio = [1, 1]
-            else:
-                if cropping:
-                    # print('image-size: ', image.size)
-                    # best_width, best_height = select_best_resolution(image.size, self.candidate_resolutions)
-                    # print('image ', image.size)
-                    # print('open_size:', image.size)
-                    images_crop_raw, crop_ratio = dynamic_preprocess(image, image_size=IMAGE_SIZE)
-                    # print('crop_ratio: ', crop_ratio)
-                else:
-                    # best_width, best_height = self.image_size, self.image_size
-                    crop_ratio = [1, 1]
-            # print(image.size, (best_width, best_height)) # check the select_best_resolutions func
-
-            # print(crop_ratio)
+            crop_ratio = plan.crop_ratio
+            if plan.has_local_views:
+                tiles_img = image.resize(plan.resize_to)
+
             """process the global view"""
 
             # if cropping
@@ -388,118 +430,112 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
             global_view = ImageOps.pad(image, (self.base_size, self.base_size),
                                     color=tuple(int(x * 255) for x in self.image_transform.mean))
-            images_list.append(self.image_transform(global_view))
+            self.image_transform.pack(image_pixels(global_view).permute(2, 0, 1), out=pixel_values[index])
 
             """record height / width crop num"""
-            # width_crop_num, height_crop_num = best_width // self.image_size, best_height // self.image_size
-            num_width_tiles, num_height_tiles = crop_ratio
-            images_spatial_crop.append([num_width_tiles, num_height_tiles])
-
-
+            images_spatial_crop[index, 0], images_spatial_crop[index, 1] = crop_ratio
 
-
-            if num_width_tiles > 1 or num_height_tiles > 1:
+            if plan.has_local_views:
                 """process the local views"""
-                # local_view = ImageOps.pad(image, (best_width, best_height),
-                #                         color=tuple(int(x * 255) for x in self.image_transform.mean))
-                # for i in range(0, best_height, self.image_size):
-                #     for j in range(0, best_width, self.image_size):
-                #         images_crop_list.append(
-                #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-                for i in range(len(images_crop_raw)):
-                    images_crop_list.append(self.image_transform(images_crop_raw[i]))
-
-            # """process the global view"""
-            # global_view = ImageOps.pad(image, (self.image_size, self.image_size),
-            #                            color=tuple(int(x * 255) for x in self.image_transform.mean))
-            # images_list.append(self.image_transform(global_view))
-
-            # """process the local views"""
-            # local_view = ImageOps.pad(image, (best_width, best_height),
-            #                           color=tuple(int(x * 255) for x in self.image_transform.mean))
-            # for i in range(0, best_height, self.image_size):
-            #     for j in range(0, best_width, self.image_size):
-            #         images_list.append(
-            #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-
-            # """add image tokens"""
-            """add image tokens"""
-            num_queries = math.ceil((self.image_size // self.patch_size) / self.downsample_ratio)
-            num_queries_base = math.ceil((self.base_size // self.patch_size) / self.downsample_ratio)
-
+                # 缩放后的整图只转换一次，切片为视图，所有切片一次性拷贝并归一化
+                tiles = tile_views(image_pixels(tiles_img), crop_ratio, self.image_size)
+                out = images_crop[0, crop_offset:crop_offset + plan.num_tiles]
+                self.image_transform.pack(tiles, out=out.view(tiles.shape))
+                crop_offset += plan.num_tiles
 
-            tokenized_image = ([self.image_token_id] * num_queries_base + [self.image_token_id]) * num_queries_base
-            tokenized_image += [self.image_token_id]
-            if num_width_tiles > 1 or num_height_tiles > 1:
-                tokenized_image += ([self.image_token_id] * (num_queries * num_width_tiles) + [self.image_token_id]) * (
-                            num_queries * num_height_tiles)
-            tokenized_str += tokenized_image
-            images_seq_mask += [True] * len(tokenized_image)
-            num_image_tokens.append(len(tokenized_image))
+            """add image tokens"""
+            # 全局视图每行 + 换行、分隔符、局部视图大网格每行 + 换行，全部为同一个图像 token
+            token_pieces.append(_image_token_template(self.image_token_id, plan.num_image_tokens))
+            num_image_tokens.append(plan.num_image_tokens)
 
         """process the last text split"""
-        tokenized_sep = self.encode(text_splits[-1], bos=False, eos=False)
-        tokenized_str += tokenized_sep
-        images_seq_mask += [False] * len(tokenized_sep)
+        token_pieces.append(text_segments[-1])
 
-        """add the bos and eos tokens"""
-        if bos:
-            tokenized_str = [self.bos_id] + tokenized_str
-            images_seq_mask = [False] + images_seq_mask
-        if eos:
-            tokenized_str = tokenized_str + [self.eos_id]
-            images_seq_mask = images_seq_mask + [False]
+        input_ids = torch.cat(token_pieces)
+        # 文本片段按 <image> 切分后编码，不会产生图像 token，掩码可直接由 token id 得到
+        images_seq_mask = input_ids == self.image_token_id
 
-        assert len(tokenized_str) == len(
-            images_seq_mask), f"tokenize_with_images func: tokenized_str's length {len(tokenized_str)} is not equal to imags_seq_mask's length {len(images_seq_mask)}"
-        
+        input_ids = input_ids.unsqueeze(0)
 
+        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes]]
 
-        masked_tokenized_str = []
-        for token_index in tokenized_str:
-            if token_index != self.image_token_id:
-                masked_tokenized_str.append(token_index)
-            else:
-                masked_tokenized_str.append(self.ignore_id)
 
-        assert len(tokenized_str) == len(images_seq_mask) == len(masked_tokenized_str), \
-            (f"tokenized_str's length {len(tokenized_str)}, input_ids' length {len(masked_tokenized_str)}, "
-             f"imags_seq_mask's length {len(images_seq_mask)}, are not equal")
+def _empty(shape: Tuple[int, ...], dtype: torch.dtype) -> torch.Tensor:
+    return torch.empty(shape, dtype=dtype)
 
-        input_ids = torch.LongTensor(tokenized_str)
-        target_ids = torch.LongTensor(masked_tokenized_str)
-        images_seq_mask = torch.tensor(images_seq_mask, dtype=torch.bool)
 
-        # set input_ids < 0 | input_ids == self.image_token_id as ignore_id
-        target_ids[(input_ids < 0) |
-                   (input_ids == self.image_token_id)] = self.ignore_id
-        input_ids[input_ids < 0] = self.pad_id
+@lru_cache(maxsize=PROMPT_TEMPLATE_CACHE_SIZE)
+def _prompt_template(
+    tokenizer: LlamaTokenizerFast, conversation: str, image_token: str, bos_id: Optional[int]
+) -> Tuple[torch.Tensor, ...]:
+    """提示词按 <image> 切分后各片段的 token id（bos 并入第一段）；返回的张量只读，调用方通过拼接使用"""
+    segments = []
+    for index, text in enumerate(conversation.split(image_token)):
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if index == 0 and bos_id is not None:
+            ids = [bos_id] + ids
+        segments.append(torch.tensor(ids, dtype=torch.long))
+    return tuple(segments)
 
-        inference_mode = True
 
-        if inference_mode:
-            # Remove the ending eos token
-            assert input_ids[-1] == self.eos_id
-            input_ids = input_ids[:-1]
-            target_ids = target_ids[:-1]
-            images_seq_mask = images_seq_mask[:-1]
+@lru_cache(maxsize=256)
+def _image_token_template(image_token_id: int, num_tokens: int) -> torch.Tensor:
+    """单张图像的占位 token 序列；token 数由 (base_size, image_size, 切片网格) 决定"""
+    return torch.full((num_tokens,), image_token_id, dtype=torch.long)
 
-        if len(images_list) == 0:
-            pixel_values = torch.zeros((1, 3, self.base_size, self.base_size))
-            images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
-            images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
-        else:
-            pixel_values = torch.stack(images_list, dim=0)
-            images_spatial_crop = torch.tensor(images_spatial_crop, dtype=torch.long)
-            if images_crop_list:
-                images_crop = torch.stack(images_crop_list, dim=0).unsqueeze(0)
-            else:
-                images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
 
-        input_ids = input_ids.unsqueeze(0)
+AutoProcessor.register("DeepseekVLV2Processor", DeepseekOCRProcessor)
 
-        
-        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes]]
 
+# 进程级缓存：tokenizer 按模型路径缓存，processor 按 (模型路径, 模式) 缓存。
+# AutoTokenizer.from_pretrained 每次耗时数百毫秒，不能放在请求路径上。
+# tokenize_with_images 不修改实例状态，缓存实例可在多线程/协程间共享。
+_cache_lock = threading.Lock()
+_tokenizer_cache: Dict[str, LlamaTokenizerFast] = {}
+_processor_cache: Dict[Tuple[str, int, int, bool], DeepseekOCRProcessor] = {}
 
-AutoProcessor.register("DeepseekVLV2Processor", DeepseekOCRProcessor)
+
+def get_cached_tokenizer(model_path: Optional[str] = None) -> LlamaTokenizerFast:
+    """获取（必要时加载）指定模型路径的共享 tokenizer"""
+    path = model_path or MODEL_PATH
+    tokenizer = _tokenizer_cache.get(path)
+    if tokenizer is not None:
+        return tokenizer
+    with _cache_lock:
+        tokenizer = _tokenizer_cache.get(path)
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+            _tokenizer_cache[path] = tokenizer
+    return tokenizer
+
+
+def get_cached_processor(
+    base_size: Optional[int] = None,
+    image_size: Optional[int] = None,
+    crop_mode: Optional[bool] = None,
+    model_path: Optional[str] = None,
+) -> DeepseekOCRProcessor:
+    """获取指定模型路径与模式的共享 DeepseekOCRProcessor"""
+    path = model_path or MODEL_PATH
+    key = (
+        path,
+        BASE_SIZE if base_size is None else base_size,
+        IMAGE_SIZE if image_size is None else image_size,
+        CROP_MODE if crop_mode is None else crop_mode,
+    )
+    processor = _processor_cache.get(key)
+    if processor is not None:
+        return processor
+    tokenizer = get_cached_tokenizer(path)
+    with _cache_lock:
+        processor = _processor_cache.get(key)
+        if processor is None:
+            processor = DeepseekOCRProcessor(
+                tokenizer=tokenizer,
+                base_size=key[1],
+                image_size=key[2],
+                crop_mode=key[3],
+            )
+            _processor_cache[key] = processor
+    return processor
@@ -1,10 +1,24 @@
 import torch
 from transformers import LogitsProcessor
-from transformers.generation.logits_process import _calc_banned_ngram_tokens
-from typing import List, Set
+from typing import Dict, List, Optional
+
+# 多项式滚动哈希参数（模数为梅森素数 2^61 - 1）
+_HASH_MOD = (1 << 61) - 1
+_HASH_BASE = 1_000_003
+
+# DeepSeek-OCR 推荐参数：90 个 token 窗口内禁止重复 30-gram，<td> / </td> 允许重复
+NGRAM_SIZE = 30
+NGRAM_WINDOW_SIZE = 90
+NGRAM_WHITELIST_TOKEN_IDS = frozenset({128821, 128822})
 
 
 class NoRepeatNGramLogitsProcessor(LogitsProcessor):
+    """禁止在最近 window_size 个 token 内重复出现 ngram_size 元组
+
+    每条序列独占一个实例（引擎为每个请求新建），按解码步增量维护
+    “(n-1) 元前缀哈希 -> 下一个 token 计数” 的滑动窗口索引，每步更新为 O(1)，
+    屏蔽时一次 index_fill_ 完成。输入不是上一步的延续时（如实例被复用）自动重建索引。
+    """
 
     def __init__(self, ngram_size: int, window_size: int = 100, whitelist_token_ids: set = None):
         if not isinstance(ngram_size, int) or ngram_size <= 0:
@@ -14,27 +28,96 @@ class NoRepeatNGramLogitsProcessor(LogitsProcessor):
         self.ngram_size = ngram_size
         self.window_size = window_size
         self.whitelist_token_ids = whitelist_token_ids or set()
-    
+        # 移出哈希窗口最高位 token 时使用的系数 BASE^(n-2)
+        self._drop_factor = pow(_HASH_BASE, max(ngram_size - 2, 0), _HASH_MOD)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._tokens: List[int] = []
+        # _prefix_hashes[i] 为 tokens[i : i + n - 1] 的哈希
+        # n == 1 时前缀为空元组，哈希恒为 0
+        self._prefix_hashes: List[int] = [0] if self.ngram_size == 1 else []
+        self._index: Dict[int, Dict[int, int]] = {}
+        self._banned_cache: Optional[torch.Tensor] = None
+        self._banned_cache_key: Optional[tuple] = None
+
     def __call__(self, input_ids: List[int], scores: torch.FloatTensor) -> torch.FloatTensor:
-        if len(input_ids) < self.ngram_size:
+        self._sync(input_ids)
+        if len(self._tokens) < self.ngram_size:
+            return scores
+
+        next_tokens = self._index.get(self._prefix_hashes[len(self._tokens) - self.ngram_size + 1])
+        if not next_tokens:
             return scores
-        
-        current_prefix = tuple(input_ids[-(self.ngram_size - 1):])
-        
-        search_start = max(0, len(input_ids) - self.window_size)
-        search_end = len(input_ids) - self.ngram_size + 1
-        
-        banned_tokens = set()
-        for i in range(search_start, search_end):
-            ngram = tuple(input_ids[i:i + self.ngram_size])
-            if ngram[:-1] == current_prefix:
-                banned_tokens.add(ngram[-1])
-        
-        banned_tokens = banned_tokens - self.whitelist_token_ids
-        
-        if banned_tokens:
-            scores = scores.clone()
-            for token in banned_tokens:
-                scores[token] = -float("inf")
-        
-        return scores
\ No newline at end of file
+
+        banned = self._banned_tensor(next_tokens, scores.device)
+        scores.index_fill_(-1, banned, -float("inf"))
+        return scores
+
+    def _sync(self, input_ids: List[int]) -> None:
+        """把索引推进到 input_ids 的长度"""
+        known = len(self._tokens)
+        if len(input_ids) < known or (known and input_ids[known - 1] != self._tokens[-1]):
+            self._reset()
+            known = 0
+        for token in input_ids[known:]:
+            self._push(int(token))
+
+    def _push(self, token: int) -> None:
+        n = self.ngram_size
+        self._tokens.append(token)
+        length = len(self._tokens)
+
+        # 以 length - n + 1 为起点的 (n-1) 元前缀已完整
+        start = length - n + 1
+        if start >= 0:
+            if n == 1:
+                prefix_hash = 0
+            elif start == 0:
+                prefix_hash = 0
+                for t in self._tokens[:n - 1]:
+                    prefix_hash = (prefix_hash * _HASH_BASE + t + 1) % _HASH_MOD
+            else:
+                dropped = self._tokens[start - 1] + 1
+                prefix_hash = (
+                    (self._prefix_hashes[start - 1] - dropped * self._drop_factor) * _HASH_BASE
+                    + token + 1
+                ) % _HASH_MOD
+            self._prefix_hashes.append(prefix_hash)
+
+        if self.window_size < n:
+            # 窗口内放不下一个完整 n-gram，不会屏蔽任何 token
+            return
+        # 以 length - n 为起点的 n-gram 进入窗口
+        entering = length - n
+        if entering >= 0:
+            self._add(self._prefix_hashes[entering], token)
+        # 以 length - window - 1 为起点的 n-gram 离开窗口
+        leaving = length - self.window_size - 1
+        if leaving >= 0:
+            self._remove(self._prefix_hashes[leaving], self._tokens[leaving + n - 1])
+
+    def _add(self, prefix_hash: int, token: int) -> None:
+        if token in self.whitelist_token_ids:
+            return
+        counts = self._index.setdefault(prefix_hash, {})
+        counts[token] = counts.get(token, 0) + 1
+
+    def _remove(self, prefix_hash: int, token: int) -> None:
+        if token in self.whitelist_token_ids:
+            return
+        counts = self._index[prefix_hash]
+        if counts[token] == 1:
+            del counts[token]
+            if not counts:
+                del self._index[prefix_hash]
+        else:
+            counts[token] -= 1
+
+    def _banned_tensor(self, next_tokens: Dict[int, int], device: torch.device) -> torch.Tensor:
+        # 循环输出时同一组屏蔽 token 会在多步中反复出现，复用上一次构造的张量
+        key = (tuple(next_tokens), device)
+        if key != self._banned_cache_key:
+            self._banned_cache = torch.tensor(key[0], dtype=torch.long, device=device)
+            self._banned_cache_key = key
+        return self._banned_cache
@@ -0,0 +1,149 @@
+"""
+vLLM v1 批量 n-gram 禁止重复 logits 处理器
+
+v1 引擎不支持按请求传入的 logits_processors，需要在引擎参数中注册批量处理器。
+每个请求通过 SamplingParams.extra_args 启用并携带参数（ngram_size / window_size /
+whitelist_token_ids），语义与 v0 的 NoRepeatNGramLogitsProcessor 一致。
+每个解码步把同参数请求最近 window_size 个输出 token 拼成一个 [R, W] 张量，
+在设备上一次完成 n-gram 前缀匹配并写入 -inf，不逐请求、逐 token 循环。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+from vllm.v1.sample.logits_processor import BatchUpdate, LogitsProcessor, MoveDirectionality
+
+from .ngram_norepeat import NGRAM_SIZE, NGRAM_WHITELIST_TOKEN_IDS, NGRAM_WINDOW_SIZE
+
+
+@dataclass(frozen=True)
+class NGramParams:
+    ngram_size: int
+    window_size: int
+    whitelist_token_ids: frozenset
+
+    @classmethod
+    def from_extra_args(cls, extra_args: Optional[Dict[str, Any]]) -> Optional["NGramParams"]:
+        """未携带 ngram_size 的请求不启用处理器"""
+        if not extra_args or extra_args.get("ngram_size") is None:
+            return None
+        ngram_size = int(extra_args["ngram_size"])
+        window_size = int(extra_args.get("window_size", NGRAM_WINDOW_SIZE))
+        if ngram_size <= 0 or window_size <= 0:
+            raise ValueError(
+                f"ngram_size and window_size must be positive, got {ngram_size} / {window_size}"
+            )
+        whitelist = frozenset(int(t) for t in extra_args.get("whitelist_token_ids") or ())
+        return cls(ngram_size, window_size, whitelist)
+
+
+def ngram_extra_args(
+    ngram_size: int = NGRAM_SIZE,
+    window_size: int = NGRAM_WINDOW_SIZE,
+    whitelist_token_ids: Sequence[int] = tuple(NGRAM_WHITELIST_TOKEN_IDS),
+) -> Dict[str, Any]:
+    """构造启用处理器所需的 SamplingParams.extra_args"""
+    return {
+        "ngram_size": ngram_size,
+        "window_size": window_size,
+        "whitelist_token_ids": sorted(whitelist_token_ids),
+    }
+
+
+@dataclass
+class _RequestState:
+    params: NGramParams
+    # 引擎持有的输出 token 列表引用，随解码原地增长
+    output_token_ids: List[int]
+
+
+class NoRepeatNGramBatchLogitsProcessor(LogitsProcessor):
+    """批量版本的 NoRepeatNGram，注册方式：AsyncEngineArgs(logits_processors=[本类])"""
+
+    @classmethod
+    def validate_params(cls, sampling_params: Any) -> None:
+        NGramParams.from_extra_args(getattr(sampling_params, "extra_args", None))
+
+    def __init__(self, vllm_config: Any, device: torch.device, is_pin_memory: bool) -> None:
+        self.device = device
+        self.pin_memory = is_pin_memory
+        # 持久批次中的行号 -> 请求状态
+        self._requests: Dict[int, _RequestState] = {}
+        self._whitelists: Dict[frozenset, torch.Tensor] = {}
+
+    def is_argmax_invariant(self) -> bool:
+        # 屏蔽 token 会改变贪心解码结果
+        return False
+
+    def update_state(self, batch_update: Optional[BatchUpdate]) -> None:
+        if not batch_update:
+            return
+        for added in batch_update.added:
+            # 不同 vLLM 版本的 added 元组长度不同，首项为行号、次项为采样参数、末项为输出 token
+            index, sampling_params, output_token_ids = added[0], added[1], added[-1]
+            params = NGramParams.from_extra_args(getattr(sampling_params, "extra_args", None))
+            if params is None:
+                self._requests.pop(index, None)
+            else:
+                self._requests[index] = _RequestState(params, output_token_ids)
+
+        if not self._requests:
+            return
+        for index in batch_update.removed:
+            self._requests.pop(index, None)
+        for a_index, b_index, direction in batch_update.moved:
+            a_state = self._requests.pop(a_index, None)
+            b_state = self._requests.pop(b_index, None)
+            if a_state is not None:
+                self._requests[b_index] = a_state
+            if direction == MoveDirectionality.SWAP and b_state is not None:
+                self._requests[a_index] = b_state
+
+    def apply(self, logits: torch.Tensor) -> torch.Tensor:
+        if not self._requests:
+            return logits
+        # 同参数的请求合并为一组，通常整个批次只有一组
+        groups: Dict[NGramParams, List[int]] = {}
+        for index, state in self._requests.items():
+            if len(state.output_token_ids) >= state.params.ngram_size:
+                groups.setdefault(state.params, []).append(index)
+        for params, rows in groups.items():
+            self._apply_group(logits, params, rows)
+        return logits
+
+    def _apply_group(self, logits: torch.Tensor, params: NGramParams, rows: List[int]) -> None:
+        n, window = params.ngram_size, params.window_size
+        if window < n:
+            return
+
+        # 覆盖 [0, max(rows)] 行：组内行取最近 window 个输出 token，其余行与不足部分以 -1 填充
+        num_rows = max(rows) + 1
+        history = [[-1] * window for _ in range(num_rows)]
+        for index in rows:
+            tail = self._requests[index].output_token_ids[-window:]
+            history[index][window - len(tail):] = tail
+        hist = torch.tensor(history, dtype=torch.long, pin_memory=self.pin_memory)
+        hist = hist.to(self.device, non_blocking=True)
+
+        # ngrams[r, i] 为以窗口内第 i 个 token 起始的 n-gram，prefix[r] 为当前 (n-1) 元前缀
+        ngrams = hist.unfold(1, n, 1)
+        prefix = hist[:, window - n + 1:]
+        match = (ngrams[:, :, :-1] == prefix.unsqueeze(1)).all(dim=-1)
+        next_tokens = ngrams[:, :, -1]
+        match &= next_tokens >= 0
+        if params.whitelist_token_ids:
+            match &= ~torch.isin(next_tokens, self._whitelist_tensor(params.whitelist_token_ids))
+
+        # 用 amin 归约把命中的 token 写为 -inf，未命中位置写 +inf 不改变原值；原地写入且无需同步到 CPU
+        fill = torch.full(match.shape, float("inf"), dtype=logits.dtype, device=self.device)
+        fill.masked_fill_(match, -float("inf"))
+        logits[:num_rows].scatter_reduce_(1, next_tokens.clamp(min=0), fill, reduce="amin")
+
+    def _whitelist_tensor(self, whitelist: frozenset) -> torch.Tensor:
+        tensor = self._whitelists.get(whitelist)
+        if tensor is None:
+            tensor = torch.tensor(sorted(whitelist), dtype=torch.long, device=self.device)
+            self._whitelists[whitelist] = tensor
+        return tensor
@@ -0,0 +1,109 @@
+"""
+切片规划
+同一张图像的切片网格、缩放目标与视觉 token 数在请求路径上会被多次计算（准入估算、指标、
+processor 切片、vLLM 的 token 计数）。候选网格表按 (min_crops, max_crops, image_size) 预先构建，
+规划结果按 (宽, 高, 模式) 缓存在 LRU 中，各处共享同一份计算。
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from ..config import MAX_CROPS, MIN_CROPS, OcrMode
+
+PATCH_SIZE = 16
+DOWNSAMPLE_RATIO = 4
+# 长宽均不超过该值的图像不切片，只保留全局视图
+CROP_THRESHOLD = 640
+
+PLAN_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class _GridCandidate:
+    cols: int
+    rows: int
+    aspect_ratio: float
+    # 面积超过该值时，宽高比同样接近的候选中优先选更大的网格
+    min_area: float
+
+
+@dataclass(frozen=True)
+class TilingPlan:
+    # (列数, 行数)；无局部视图时为 (1, 1)
+    crop_ratio: tuple[int, int]
+    # 切片前整图缩放到的 (宽, 高)；无局部视图时为 None
+    resize_to: Optional[tuple[int, int]]
+    # 全局视图 + 局部视图展开后的图像 token 数（与 tokenize_with_images 的布局一致）
+    num_image_tokens: int
+
+    @property
+    def num_tiles(self) -> int:
+        return self.crop_ratio[0] * self.crop_ratio[1]
+
+    @property
+    def has_local_views(self) -> bool:
+        return self.num_tiles > 1
+
+
+@lru_cache(maxsize=None)
+def grid_candidates(min_num: int, max_num: int, image_size: int) -> tuple[_GridCandidate, ...]:
+    """按切片数升序排列的候选网格（与原先每次调用时构建并排序的集合顺序一致）"""
+    target_ratios = set(
+        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1)
+        if min_num <= i * j <= max_num)
+    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
+    return tuple(
+        _GridCandidate(i, j, i / j, 0.5 * image_size * image_size * i * j) for i, j in target_ratios
+    )
+
+
+def closest_grid(
+    width: int, height: int, min_num: int = MIN_CROPS, max_num: int = MAX_CROPS, image_size: int = 640
+) -> tuple[int, int]:
+    """选择宽高比最接近的切片网格 (列数, 行数)"""
+    aspect_ratio = width / height
+    area = width * height
+    best_ratio_diff = float('inf')
+    best = (1, 1)
+    for candidate in grid_candidates(min_num, max_num, image_size):
+        ratio_diff = abs(aspect_ratio - candidate.aspect_ratio)
+        if ratio_diff < best_ratio_diff:
+            best_ratio_diff = ratio_diff
+            best = (candidate.cols, candidate.rows)
+        elif ratio_diff == best_ratio_diff and area > candidate.min_area:
+            best = (candidate.cols, candidate.rows)
+    return best
+
+
+def count_image_tokens(base_size: int, image_size: int, crop_ratio: tuple[int, int]) -> int:
+    """全局视图每行 h 个 token + 换行，局部视图拼成大网格后每行同样追加换行，最后一个分隔 token"""
+    h = math.ceil((base_size // PATCH_SIZE) / DOWNSAMPLE_RATIO)
+    h2 = math.ceil((image_size // PATCH_SIZE) / DOWNSAMPLE_RATIO)
+    num_width_tiles, num_height_tiles = crop_ratio
+    global_views_tokens = h * (h + 1)
+    if num_width_tiles > 1 or num_height_tiles > 1:
+        local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * h2 + 1)
+    else:
+        local_views_tokens = 0
+    return global_views_tokens + local_views_tokens + 1
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def plan_tiling(
+    width: int, height: int, mode: OcrMode, min_num: int = MIN_CROPS, max_num: int = MAX_CROPS
+) -> TilingPlan:
+    """按图像尺寸与模式规划切片（结果缓存）"""
+    crop_ratio = (1, 1)
+    if mode.crop_mode and (width > CROP_THRESHOLD or height > CROP_THRESHOLD):
+        crop_ratio = closest_grid(width, height, min_num, max_num, mode.image_size)
+    resize_to = None
+    if crop_ratio != (1, 1):
+        resize_to = (mode.image_size * crop_ratio[0], mode.image_size * crop_ratio[1])
+    return TilingPlan(
+        crop_ratio=crop_ratio,
+        resize_to=resize_to,
+        num_image_tokens=count_image_tokens(mode.base_size, mode.image_size, crop_ratio),
+    )
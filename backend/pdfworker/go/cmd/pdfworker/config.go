@@ -11,11 +11,20 @@ type Config struct {
 	BaseSize       int    `json:"base_size"`
 	ImageSize      int    `json:"image_size"`
 	CropMode       bool   `json:"crop_mode"`
+	Mode           string `json:"mode"`
 	MaxConcurrency int    `json:"max_concurrency"`
 	RenderWorkers  int    `json:"render_workers"`
 	RequestTimeout int    `json:"request_timeout_seconds"`
+	Transport      string `json:"transport"`
 }
 
+// 推理接口传图方式
+const (
+	transportBase64 = "base64" // JSON 内嵌 base64
+	transportBinary = "binary" // application/octet-stream 原始字节
+	transportPath   = "path"   // JSON 传共享存储内的文件路径
+)
+
 func ensureDefaultConfig(cfg *Config) {
 	if cfg.MaxConcurrency <= 0 {
 		cfg.MaxConcurrency = 2
@@ -26,5 +35,9 @@ func ensureDefaultConfig(cfg *Config) {
 	if cfg.RequestTimeout <= 0 {
 		cfg.RequestTimeout = 300
 	}
+	switch cfg.Transport {
+	case transportBinary, transportPath:
+	default:
+		cfg.Transport = transportBase64
+	}
 }
-
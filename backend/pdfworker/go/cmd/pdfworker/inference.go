@@ -4,10 +4,14 @@ import (
 	"bytes"
 	"context"
 	"encoding/json"
+	"errors"
 	"fmt"
 	"io"
 	"net/http"
+	"net/url"
 	"os"
+	"path/filepath"
+	"strconv"
 	"strings"
 	"sync"
 	"time"
@@ -29,7 +33,7 @@ func getHTTPClient(maxConns int) *http.Client {
 		return sharedHTTPClient
 	}
 	transport := &http.Transport{
-		Proxy: http.ProxyFromEnvironment,
+		Proxy:               http.ProxyFromEnvironment,
 		MaxConnsPerHost:     maxInt(maxConns, 4),
 		MaxIdleConnsPerHost: maxInt(maxConns, 4),
 		MaxIdleConns:        maxInt(maxConns*2, 32),
@@ -42,38 +46,108 @@ func getHTTPClient(maxConns int) *http.Client {
 	return sharedHTTPClient
 }
 
-func runInference(ctx context.Context, cfg Config, imageB64 string) (string, error) {
+// errOverloaded 表示 API 准入控制返回 429，或模型仍在加载（503 + Retry-After），需要按 Retry-After 退避后重试
+type errOverloaded struct {
+	retryAfter time.Duration
+}
+
+func (e *errOverloaded) Error() string {
+	return fmt.Sprintf("inference overloaded: retry after %s", e.retryAfter)
+}
+
+// inferenceBody 是按传图方式编码好的请求体，重试时复用
+type inferenceBody struct {
+	data        []byte
+	contentType string
+	query       string
+}
+
+func buildInferenceBody(cfg Config, imagePath string) (inferenceBody, error) {
+	switch cfg.Transport {
+	case transportBinary:
+		data, err := os.ReadFile(imagePath)
+		if err != nil {
+			return inferenceBody{}, err
+		}
+		query := url.Values{}
+		query.Set("prompt", cfg.Prompt)
+		query.Set("base_size", strconv.Itoa(cfg.BaseSize))
+		query.Set("image_size", strconv.Itoa(cfg.ImageSize))
+		query.Set("crop_mode", strconv.FormatBool(cfg.CropMode))
+		if cfg.Mode != "" {
+			query.Set("mode", cfg.Mode)
+		}
+		if cfg.TaskID != "" {
+			query.Set("task_id", cfg.TaskID)
+		}
+		return inferenceBody{data: data, contentType: "application/octet-stream", query: query.Encode()}, nil
+	case transportPath:
+		absPath, err := filepath.Abs(imagePath)
+		if err != nil {
+			return inferenceBody{}, err
+		}
+		return marshalInferenceRequest(cfg, inferenceRequest{ImagePath: absPath})
+	default:
+		imageB64, err := encodeImageToBase64(imagePath)
+		if err != nil {
+			return inferenceBody{}, err
+		}
+		return marshalInferenceRequest(cfg, inferenceRequest{ImageB64: imageB64})
+	}
+}
+
+func marshalInferenceRequest(cfg Config, reqPayload inferenceRequest) (inferenceBody, error) {
+	reqPayload.Prompt = cfg.Prompt
+	reqPayload.BaseSize = cfg.BaseSize
+	reqPayload.ImageSize = cfg.ImageSize
+	reqPayload.CropMode = cfg.CropMode
+	reqPayload.Mode = cfg.Mode
+	reqPayload.TaskID = cfg.TaskID
+	data, err := json.Marshal(reqPayload)
+	if err != nil {
+		return inferenceBody{}, err
+	}
+	return inferenceBody{data: data, contentType: "application/json"}, nil
+}
+
+func runInference(ctx context.Context, cfg Config, body inferenceBody) (inferenceResponse, error) {
 	const maxAttempts = 3
+	// 过载退避的总等待不超过单次请求超时，API 持续过载时返回过载错误而不是无限重试
+	overloadBudget := time.Duration(cfg.RequestTimeout) * time.Second
+	var overloadWaited time.Duration
 	for attempt := 1; attempt <= maxAttempts; attempt++ {
-		text, err := invokeInference(ctx, cfg, imageB64)
+		resp, err := invokeInference(ctx, cfg, body)
+		var overloaded *errOverloaded
+		for errors.As(err, &overloaded) {
+			// 被卸载的请求不计入重试次数，等待后重新提交
+			if overloadWaited+overloaded.retryAfter > overloadBudget {
+				return inferenceResponse{}, fmt.Errorf("%w (gave up after waiting %s)", err, overloadWaited)
+			}
+			select {
+			case <-ctx.Done():
+				return inferenceResponse{}, ctx.Err()
+			case <-time.After(overloaded.retryAfter):
+			}
+			overloadWaited += overloaded.retryAfter
+			resp, err = invokeInference(ctx, cfg, body)
+		}
 		if err != nil {
-			return "", err
+			return inferenceResponse{}, err
 		}
-		if strings.TrimSpace(text) != "" {
-			return text, nil
+		if strings.TrimSpace(resp.Text) != "" {
+			return resp, nil
 		}
 		if attempt < maxAttempts {
 			time.Sleep(200 * time.Millisecond)
 			continue
 		}
 		fmt.Fprintf(os.Stderr, "pdfworker warning: empty response text after %d attempts (task=%s)\n", attempt, cfg.TaskID)
-		return "", nil
+		return resp, nil
 	}
-	return "", nil
+	return inferenceResponse{}, nil
 }
 
-func invokeInference(ctx context.Context, cfg Config, imageB64 string) (string, error) {
-	reqPayload := inferenceRequest{
-		Prompt:    cfg.Prompt,
-		ImageB64:  imageB64,
-		BaseSize:  cfg.BaseSize,
-		ImageSize: cfg.ImageSize,
-		CropMode:  cfg.CropMode,
-	}
-	body, err := json.Marshal(reqPayload)
-	if err != nil {
-		return "", err
-	}
+func invokeInference(ctx context.Context, cfg Config, body inferenceBody) (inferenceResponse, error) {
 	client := getHTTPClient(cfg.MaxConcurrency)
 	reqCtx := ctx
 	var cancel context.CancelFunc
@@ -81,26 +155,50 @@ func invokeInference(ctx context.Context, cfg Config, imageB64 string) (string,
 		reqCtx, cancel = context.WithTimeout(ctx, time.Duration(cfg.RequestTimeout)*time.Second)
 		defer cancel()
 	}
-	request, err := http.NewRequestWithContext(reqCtx, http.MethodPost, cfg.InferURL, bytes.NewReader(body))
+	target := cfg.InferURL
+	if body.query != "" {
+		separator := "?"
+		if strings.Contains(target, "?") {
+			separator = "&"
+		}
+		target += separator + body.query
+	}
+	request, err := http.NewRequestWithContext(reqCtx, http.MethodPost, target, bytes.NewReader(body.data))
 	if err != nil {
-		return "", err
+		return inferenceResponse{}, err
 	}
-	request.Header.Set("Content-Type", "application/json")
+	request.Header.Set("Content-Type", body.contentType)
 	if cfg.AuthToken != "" {
 		request.Header.Set("X-Internal-Token", cfg.AuthToken)
 	}
+	// 告知 API 本次请求的剩余时间：超时后 API 丢弃排队中的请求、中止生成中的请求，不再为已放弃的页面占用 GPU
+	if deadline, ok := reqCtx.Deadline(); ok {
+		request.Header.Set("X-Timeout", strconv.FormatFloat(time.Until(deadline).Seconds(), 'f', 3, 64))
+	}
 	resp, err := client.Do(request)
 	if err != nil {
-		return "", err
+		return inferenceResponse{}, err
 	}
 	defer resp.Body.Close()
+	retryAfter := resp.Header.Get("Retry-After")
+	if resp.StatusCode == http.StatusTooManyRequests || (resp.StatusCode == http.StatusServiceUnavailable && retryAfter != "") {
+		return inferenceResponse{}, &errOverloaded{retryAfter: parseRetryAfter(retryAfter)}
+	}
 	if resp.StatusCode != http.StatusOK {
 		data, _ := io.ReadAll(io.LimitReader(resp.Body, 1024))
-		return "", fmt.Errorf("inference failed: status %d: %s", resp.StatusCode, string(data))
+		return inferenceResponse{}, fmt.Errorf("inference failed: status %d: %s", resp.StatusCode, string(data))
 	}
 	var parsed inferenceResponse
 	if err := json.NewDecoder(resp.Body).Decode(&parsed); err != nil {
-		return "", err
+		return inferenceResponse{}, err
+	}
+	return parsed, nil
+}
+
+func parseRetryAfter(value string) time.Duration {
+	seconds, err := strconv.Atoi(strings.TrimSpace(value))
+	if err != nil || seconds <= 0 {
+		seconds = 1
 	}
-	return parsed.Text, nil
+	return time.Duration(seconds) * time.Second
 }
@@ -89,10 +89,10 @@ func main() {
 			"pages":         []interface{}{},
 			"images":        []interface{}{},
 			"progress": map[string]interface{}{
-				"current": 0,
-				"total":   0,
-				"percent": 100.0,
-				"message": "已完成",
+				"current":         0,
+				"total":           0,
+				"percent":         100.0,
+				"message":         "已完成",
 				"pages_completed": 0,
 				"pages_total":     0,
 			},
@@ -263,12 +263,16 @@ func main() {
 			out := make([]map[string]interface{}, len(results))
 			for i, page := range results {
 				out[i] = map[string]interface{}{
-					"index":        page.Index,
-					"page_number":  page.Index + 1,
-					"markdown":     page.Markdown,
-					"raw_text":     page.RawText,
-					"image_assets": page.ImageAssets,
-					"boxes":        page.Boxes,
+					"index":         page.Index,
+					"page_number":   page.Index + 1,
+					"markdown":      page.Markdown,
+					"raw_text":      page.RawText,
+					"image_assets":  page.ImageAssets,
+					"boxes":         page.Boxes,
+					"truncated":     page.Truncated,
+					"tokens_saved":  page.TokensSaved,
+					"mode":          page.Mode,
+					"vision_tokens": page.VisionTokens,
 				}
 			}
 			return out
@@ -276,10 +280,10 @@ func main() {
 		"images":       allAssets,
 		"archive_file": filepath.Base(archivePath),
 		"progress": map[string]interface{}{
-			"current": finalTotal,
-			"total":   finalTotal,
-			"percent": 100.0,
-			"message": "已完成",
+			"current":         finalTotal,
+			"total":           finalTotal,
+			"percent":         100.0,
+			"message":         "已完成",
 			"pages_completed": totalPages,
 			"pages_total":     totalPages,
 		},
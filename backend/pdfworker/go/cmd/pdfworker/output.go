@@ -33,12 +33,16 @@ func writeJSON(outputPath string, pages []pageResult) error {
 			list := make([]map[string]interface{}, len(pages))
 			for i, page := range pages {
 				list[i] = map[string]interface{}{
-					"index":        page.Index,
-					"page_number":  page.Index + 1,
-					"raw_text":     page.RawText,
-					"markdown":     page.Markdown,
-					"boxes":        page.Boxes,
-					"image_assets": page.ImageAssets,
+					"index":         page.Index,
+					"page_number":   page.Index + 1,
+					"raw_text":      page.RawText,
+					"markdown":      page.Markdown,
+					"boxes":         page.Boxes,
+					"image_assets":  page.ImageAssets,
+					"truncated":     page.Truncated,
+					"tokens_saved":  page.TokensSaved,
+					"mode":          page.Mode,
+					"vision_tokens": page.VisionTokens,
 				}
 			}
 			return list
@@ -186,4 +190,3 @@ func writeArchive(archivePath string, entries []archiveEntry, progress func(done
 	}
 	return nil
 }
-
@@ -13,14 +13,18 @@ func processPage(ctx context.Context, cfg Config, index int, imagePath string, i
 	if err != nil {
 		return pageResult{}, err
 	}
-	imageB64, err := encodeImageToBase64(imagePath)
+	body, err := buildInferenceBody(cfg, imagePath)
 	if err != nil {
 		return pageResult{}, err
 	}
-	rawText, err := runInference(ctx, cfg, imageB64)
+	inference, err := runInference(ctx, cfg, body)
 	if err != nil {
 		return pageResult{}, err
 	}
+	rawText := inference.Text
+	if inference.Truncated {
+		fmt.Fprintf(os.Stderr, "pdfworker notice: repetition loop truncated (task=%s page=%d tokens_saved=%d)\n", cfg.TaskID, index, inference.TokensSaved)
+	}
 	if strings.TrimSpace(rawText) == "" {
 		fmt.Fprintf(os.Stderr, "pdfworker notice: empty OCR text (task=%s page=%d image=%s)\n", cfg.TaskID, index, filepath.Base(imagePath))
 	}
@@ -30,11 +34,14 @@ func processPage(ctx context.Context, cfg Config, index int, imagePath string, i
 	}
 	boxes := parseDetections(rawText, pageImg.Bounds().Dx(), pageImg.Bounds().Dy())
 	return pageResult{
-		Index:       index,
-		Markdown:    markdown,
-		RawText:     rawText,
-		ImageAssets: assets,
-		Boxes:       boxes,
+		Index:        index,
+		Markdown:     markdown,
+		RawText:      rawText,
+		ImageAssets:  assets,
+		Boxes:        boxes,
+		Truncated:    inference.Truncated,
+		TokensSaved:  inference.TokensSaved,
+		Mode:         inference.Mode,
+		VisionTokens: inference.VisionTokens,
 	}, nil
 }
-
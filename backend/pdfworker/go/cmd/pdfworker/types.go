@@ -2,22 +2,34 @@ package main
 
 type inferenceRequest struct {
 	Prompt    string `json:"prompt"`
-	ImageB64  string `json:"image_base64"`
+	ImageB64  string `json:"image_base64,omitempty"`
+	ImagePath string `json:"image_path,omitempty"`
 	BaseSize  int    `json:"base_size"`
 	ImageSize int    `json:"image_size"`
 	CropMode  bool   `json:"crop_mode"`
+	Mode      string `json:"mode,omitempty"`
+	TaskID    string `json:"task_id,omitempty"`
 }
 
 type inferenceResponse struct {
-	Text string `json:"text"`
+	Text         string `json:"text"`
+	NumTokens    int    `json:"num_tokens"`
+	Truncated    bool   `json:"truncated"`
+	TokensSaved  int    `json:"tokens_saved"`
+	Mode         string `json:"mode"`
+	VisionTokens int    `json:"vision_tokens"`
 }
 
 type pageResult struct {
-	Index       int
-	Markdown    string
-	RawText     string
-	ImageAssets []string
-	Boxes       []map[string]interface{}
+	Index        int
+	Markdown     string
+	RawText      string
+	ImageAssets  []string
+	Boxes        []map[string]interface{}
+	Truncated    bool
+	TokensSaved  int
+	Mode         string
+	VisionTokens int
 }
 
 type pageJob struct {
@@ -30,4 +42,3 @@ type archiveEntry struct {
 	Path   string
 	Method uint16
 }
-
@@ -0,0 +1,102 @@
+"""
+事件循环延迟基准：模拟并发 PDF 页面请求的图像解码，对比在事件循环内同步解码与预处理执行器
+
+每个模拟请求执行 base64 解码 + PIL 解码 + EXIF + RGB 转换（与 /internal/infer 相同），
+同时用一个心跳协程每隔 --tick-ms 毫秒测量一次调度延迟。
+
+用法（在 backend 目录下）：
+    python scripts/bench_event_loop_lag.py --concurrency 24 --requests 96
+    python scripts/bench_event_loop_lag.py --executor process --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.preprocess import ImagePreprocessor, decode_image_base64  # noqa: E402
+
+
+def _make_page(width: int, height: int) -> str:
+    image = Image.new("RGB", (width, height), color=(255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for y in range(40, height - 40, 28):
+        draw.line((60, y, width - 60, y), fill=(20, 20, 20), width=2)
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+async def _monitor(stop: asyncio.Event, tick: float, samples: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + tick
+        await asyncio.sleep(tick)
+        samples.append(max(loop.time() - expected, 0.0) * 1000)
+
+
+async def _run(mode: str, payload: str, args: argparse.Namespace) -> None:
+    preprocessor = ImagePreprocessor(workers=args.workers, executor=args.executor)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_request() -> None:
+        async with semaphore:
+            if mode == "inline":
+                # 旧实现：直接在事件循环中解码
+                _, decoded = decode_image_base64(payload)
+            else:
+                _, decoded = await preprocessor.decode_base64(payload)
+            decoded.image.close()
+            # 让出事件循环，模拟后续的引擎提交
+            await asyncio.sleep(0)
+
+    if mode != "inline":
+        await preprocessor.decode_base64(payload)  # 预热执行器
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor(stop, args.tick_ms / 1000, lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    preprocessor.shutdown()
+
+    lags.sort()
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+    label = mode if mode == "inline" else f"{args.executor}x{preprocessor.workers}"
+    print(
+        f"{label:>12}: lag p50={statistics.median(lags) if lags else 0.0:7.2f} ms  "
+        f"p99={p99:7.2f} ms  max={max(lags, default=0.0):7.2f} ms  "
+        f"throughput={args.requests / elapsed:6.1f} img/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=96)
+    parser.add_argument("--concurrency", type=int, default=24)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--width", type=int, default=1654)
+    parser.add_argument("--height", type=int, default=2339)
+    parser.add_argument("--tick-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    payload = _make_page(args.width, args.height)
+    for mode in ("inline", "executor"):
+        asyncio.run(_run(mode, payload, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+NoRepeatNGramLogitsProcessor 微基准：对比逐步重建 n-gram 的旧实现与增量索引实现
+
+模拟一次解码：每步把已生成的 token 列表与一行 CPU logits 交给处理器，统计每步耗时，
+并校验两种实现屏蔽的 token 集合一致。生成序列由若干短片段随机拼接，保证窗口内存在重复 n-gram。
+
+用法（在 backend 目录下）：
+    python scripts/bench_ngram_norepeat.py
+    python scripts/bench_ngram_norepeat.py --windows 90,512 --ngrams 3,30 --steps 4000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.vllm_models.process.ngram_norepeat import NoRepeatNGramLogitsProcessor  # noqa: E402
+
+WHITELIST = {128821, 128822}
+
+
+class LegacyNoRepeatNGram:
+    """旧实现：每步在窗口内重建所有 n-gram 元组，clone 后逐个写入"""
+
+    def __init__(self, ngram_size: int, window_size: int, whitelist_token_ids: set) -> None:
+        self.ngram_size = ngram_size
+        self.window_size = window_size
+        self.whitelist_token_ids = whitelist_token_ids
+
+    def __call__(self, input_ids: List[int], scores: torch.Tensor) -> torch.Tensor:
+        if len(input_ids) < self.ngram_size:
+            return scores
+        current_prefix = tuple(input_ids[-(self.ngram_size - 1):])
+        search_start = max(0, len(input_ids) - self.window_size)
+        search_end = len(input_ids) - self.ngram_size + 1
+        banned_tokens = set()
+        for i in range(search_start, search_end):
+            ngram = tuple(input_ids[i:i + self.ngram_size])
+            if ngram[:-1] == current_prefix:
+                banned_tokens.add(ngram[-1])
+        banned_tokens = banned_tokens - self.whitelist_token_ids
+        if banned_tokens:
+            scores = scores.clone()
+            for token in banned_tokens:
+                scores[token] = -float("inf")
+        return scores
+
+
+def _make_sequence(steps: int, seed: int) -> List[int]:
+    rng = random.Random(seed)
+    fragments = [[rng.randrange(1000, 120000) for _ in range(rng.randint(4, 40))] for _ in range(24)]
+    fragments.append([128821, 128822])
+    tokens: List[int] = []
+    while len(tokens) < steps:
+        tokens.extend(rng.choice(fragments))
+    return tokens[:steps]
+
+
+def _run(processor, tokens: List[int], vocab: int, verify: List[set] | None) -> tuple[float, List[set]]:
+    base = torch.zeros(vocab)
+    banned_sets: List[set] = []
+    elapsed = 0.0
+    for step in range(1, len(tokens) + 1):
+        scores = base.clone()
+        prefix = tokens[:step]
+        start = time.perf_counter()
+        out = processor(prefix, scores)
+        elapsed += time.perf_counter() - start
+        if verify is not None:
+            banned_sets.append(set(torch.nonzero(torch.isinf(out)).flatten().tolist()))
+    return elapsed, banned_sets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--windows", default="90,256,1024")
+    parser.add_argument("--ngrams", default="3,10,30")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--vocab", type=int, default=129280)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-verify", action="store_true")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    tokens = _make_sequence(args.steps, args.seed)
+    print(f"steps={args.steps} vocab={args.vocab}")
+    for window in (int(x) for x in args.windows.split(",")):
+        for ngram in (int(x) for x in args.ngrams.split(",")):
+            verify = None if args.no_verify else []
+            legacy_s, legacy_sets = _run(
+                LegacyNoRepeatNGram(ngram, window, WHITELIST), tokens, args.vocab, verify
+            )
+            fast_s, fast_sets = _run(
+                NoRepeatNGramLogitsProcessor(ngram, window, WHITELIST), tokens, args.vocab, verify
+            )
+            status = "" if args.no_verify else ("  ok" if legacy_sets == fast_sets else "  MISMATCH")
+            print(
+                f"window={window:5d} ngram={ngram:3d}: "
+                f"legacy={legacy_s * 1e6 / args.steps:8.1f} us/step  "
+                f"incremental={fast_s * 1e6 / args.steps:8.1f} us/step  "
+                f"speedup={legacy_s / fast_s:5.1f}x{status}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+预处理吞吐基准：按 worker 数对比线程池、进程池（结果 pickle）与进程池 + 共享内存交接
+
+每页执行与 v0 引擎请求相同的流水线：按模式缩小解码 JPEG → 切片 / 归一化 / 分词（进程池下为一次 worker 调用）。
+输出各配置的 pages/s 与相对单线程的加速比。需要可加载的 tokenizer（--model-path）。
+开始前先检查每个模式在 MAX_CROPS 切片下三个像素张量都能放入共享内存 slot（否则会退回 pickle）。
+
+用法（在 backend 目录下）：
+    python scripts/bench_preprocess_pool.py --model-path deepseek-ai/DeepSeek-OCR --workers 1,2,4,8,16 --pages 128
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.mode_selector import load_mode_policy  # noqa: E402
+from app.services.preprocess import ImagePreprocessor  # noqa: E402
+from app.services.tensor_handoff import (  # noqa: E402
+    SHARED_FIELDS,
+    SharedSlotPool,
+    TensorRef,
+    slot_nbytes,
+    tokenize_into_slot,
+)
+from app.vllm_models.config import MAX_CROPS, MODEL_PATH, OCR_MODES, PROMPT, UINT8_PIXELS, resolve_mode  # noqa: E402
+from app.vllm_models.process.tiling import grid_candidates, plan_tiling  # noqa: E402
+
+CASES = {
+    "thread": ("thread", False),
+    "process": ("process", False),
+    "process-shm": ("process", True),
+}
+
+
+def make_page(seed: int, width: int, height: int) -> bytes:
+    """白底黑色文本行的合成页面（JPEG）"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    y = height // 20
+    while y < height - height // 20:
+        x = width // 12
+        while x < width - width // 12:
+            word = rng.randint(width // 60, width // 12)
+            draw.rectangle((x, y, min(x + word, width - width // 12), y + height // 120), fill="black")
+            x += word + width // 80
+        y += height // 40
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def max_crops_size(image_size: int) -> tuple[int, int]:
+    """切片数恰为 MAX_CROPS 的图像尺寸"""
+    for candidate in grid_candidates(2, MAX_CROPS, image_size):
+        if candidate.cols * candidate.rows == MAX_CROPS:
+            return candidate.cols * image_size, candidate.rows * image_size
+    raise ValueError(f"No grid with {MAX_CROPS} tiles")
+
+
+def check_shared_refs(model_path: str) -> None:
+    """每个模式的最大输出都应以共享内存描述符返回，任何字段退回普通内存即失败"""
+    pool = SharedSlotPool.create(1, slot_nbytes(OCR_MODES.values(), 1 if UINT8_PIXELS else 4))
+    if pool is None:
+        raise SystemExit("❌ 无法创建共享内存 slot")
+    try:
+        for name, mode in OCR_MODES.items():
+            size = max_crops_size(mode.image_size)
+            if mode.crop_mode:
+                assert plan_tiling(*size, mode).num_tiles == MAX_CROPS, (name, size)
+            result = tokenize_into_slot(pool.name(0), Image.new("RGB", size, "white"), mode, model_path, PROMPT)
+            pickled = [index for index in SHARED_FIELDS if not isinstance(result[0][index], TensorRef)]
+            if pickled:
+                raise SystemExit(f"❌ {name} {size}: 字段 {pickled} 未写入共享内存 slot")
+        print(f"✅ 所有模式在 MAX_CROPS={MAX_CROPS} 时均经共享内存交接")
+    finally:
+        pool.close()
+
+
+async def run_case(
+    executor: str, handoff: bool, workers: int, pages: list[bytes], mode_name: str, model_path: str
+) -> float:
+    mode = resolve_mode(mode_name)
+    policy = load_mode_policy("heuristic")
+    preprocessor = ImagePreprocessor(
+        workers=workers, executor=executor, shm_handoff=handoff, tokenize_in_worker=True
+    )
+
+    async def one(data: bytes) -> None:
+        decoded, prepared = await preprocessor.prepare(data, [mode], mode, policy, mode, model_path, PROMPT)
+        if prepared is None:
+            # 线程池：解码后再单独提交分词
+            await preprocessor.tokenize(decoded.image, mode, model_path, PROMPT)
+            decoded.close()
+
+    try:
+        # 预热：启动 worker 并加载 tokenizer / processor
+        await asyncio.gather(*(one(pages[0]) for _ in range(workers * 2)))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(page) for page in pages))
+        return len(pages) / (time.perf_counter() - started)
+    finally:
+        preprocessor.shutdown()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--workers", default="1,2,4,8", help="逗号分隔的 worker 数")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"逗号分隔，可选: {', '.join(CASES)}")
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--width", type=int, default=1654, help="默认约为 A4 @ 200 DPI")
+    parser.add_argument("--height", type=int, default=2339)
+    parser.add_argument("--mode", default="gundam")
+    args = parser.parse_args()
+
+    check_shared_refs(args.model_path)
+    pages = [make_page(seed, args.width, args.height) for seed in range(args.pages)]
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    baseline = None
+    print(f"{'case':>12} {'workers':>8} {'pages/s':>10} {'speedup':>8}")
+    for case in args.cases.split(","):
+        executor, handoff = CASES[case]
+        for workers in worker_counts:
+            rate = await run_case(executor, handoff, workers, pages, args.mode, args.model_path)
+            baseline = baseline or rate
+            print(f"{case:>12} {workers:>8} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+预处理耗时基准：每请求新建 DeepseekOCRProcessor vs 进程级缓存
+
+用法（在 backend 目录下）：
+    python scripts/bench_processor.py --model-path deepseek-ai/DeepSeek-OCR --iterations 20
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.vllm_models.process import image_process  # noqa: E402
+from app.vllm_models.process.image_process import (  # noqa: E402
+    DeepseekOCRProcessor,
+    get_cached_processor,
+)
+
+
+def _time_ms(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model-path", default=image_process.MODEL_PATH)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--width", type=int, default=1240)
+    parser.add_argument("--height", type=int, default=1754)
+    args = parser.parse_args()
+
+    image = Image.new("RGB", (args.width, args.height), color=(255, 255, 255))
+
+    def uncached() -> None:
+        # 旧实现：每次请求都重新加载 tokenizer
+        image_process._tokenizer_cache.clear()
+        image_process._processor_cache.clear()
+        tokenizer = image_process.get_cached_tokenizer(args.model_path)
+        DeepseekOCRProcessor(tokenizer=tokenizer).tokenize_with_images(
+            images=[image], bos=True, eos=True, cropping=True)
+
+    def cached() -> None:
+        get_cached_processor(model_path=args.model_path).tokenize_with_images(
+            images=[image], bos=True, eos=True, cropping=True)
+
+    cached()  # 预热缓存
+    results = {}
+    for name, func in (("per-request", uncached), ("cached", cached)):
+        samples = [_time_ms(func) for _ in range(args.iterations)]
+        results[name] = samples
+        print(
+            f"{name:>12}: mean={statistics.mean(samples):8.1f} ms  "
+            f"p50={statistics.median(samples):8.1f} ms  max={max(samples):8.1f} ms"
+        )
+
+    speedup = statistics.mean(results["per-request"]) / statistics.mean(results["cached"])
+    print(f"speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
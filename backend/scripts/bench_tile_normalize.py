@@ -0,0 +1,90 @@
+"""
+切片归一化 CPU 基准：逐切片 ToTensor + Normalize + torch.stack vs 整图 uint8 视图 + 单次向量化归一化
+
+只测量 tokenize_with_images 中的图像部分（全局视图 + 局部切片），不需要加载 tokenizer。
+
+用法（在 backend 目录下）：
+    python scripts/bench_tile_normalize.py --iterations 20 --width 1240 --height 1754
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.vllm_models.process.image_process import (  # noqa: E402
+    ImageTransform,
+    dynamic_preprocess,
+    image_pixels,
+    resize_for_tiles,
+    tile_views,
+)
+
+
+def _time_ms(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--width", type=int, default=1240)
+    parser.add_argument("--height", type=int, default=1754)
+    parser.add_argument("--base-size", type=int, default=1024)
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=1, help="torch CPU 线程数（预处理执行器中通常为 1）")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8))
+    float_transform = ImageTransform()
+    uint8_transform = ImageTransform(uint8=True)
+    pad_color = tuple(int(x * 255) for x in float_transform.mean)
+
+    def global_view() -> Image.Image:
+        return ImageOps.pad(image, (args.base_size, args.base_size), color=pad_color)
+
+    def per_tile() -> None:
+        # 旧实现：每个 PIL 切片单独 ToTensor + Normalize，再 stack
+        crops, _ = dynamic_preprocess(image, image_size=args.image_size)
+        torch.stack([float_transform(global_view())], dim=0)
+        torch.stack([float_transform(crop) for crop in crops], dim=0)
+
+    def vectorized(transform: ImageTransform) -> None:
+        resized, crop_ratio = resize_for_tiles(image, image_size=args.image_size)
+        transform.pack(image_pixels(global_view()).permute(2, 0, 1)).unsqueeze(0)
+        transform.pack(tile_views(image_pixels(resized), crop_ratio, args.image_size)).flatten(0, 1)
+
+    cases = (
+        ("per-tile", per_tile),
+        ("vectorized", lambda: vectorized(float_transform)),
+        ("uint8", lambda: vectorized(uint8_transform)),
+    )
+    results = {}
+    for name, func in cases:
+        func()  # 预热
+        samples = [_time_ms(func) for _ in range(args.iterations)]
+        results[name] = samples
+        print(
+            f"{name:>12}: mean={statistics.mean(samples):8.1f} ms  "
+            f"p50={statistics.median(samples):8.1f} ms  max={max(samples):8.1f} ms"
+        )
+
+    baseline = statistics.mean(results["per-tile"])
+    for name in ("vectorized", "uint8"):
+        print(f"speedup ({name}): {baseline / statistics.mean(results[name]):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+EnginePool 行为检查：用 CPU 上的桩引擎验证副本路由、排空与重启，不需要 GPU 与模型
+
+- 最小负载路由：请求按在途 token 数选择副本，大请求占用的副本不再接收新请求
+- 排空：drain 在在途请求完成前不返回（超时返回 False），排空期间新请求只路由到其他副本
+- 重启：推理失败且健康检查不通过的副本被摘除，restart 以工厂新建引擎后恢复路由
+
+用法（在 backend 目录下）：
+    python scripts/check_engine_pool.py
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.engine_pool import EnginePool  # noqa: E402
+from app.services.vllm_direct_engine import EngineStats, InferenceResult  # noqa: E402
+
+
+class StubEngine:
+    """实现 EnginePool 用到的引擎接口；prompt 为 "hold" 时阻塞到 release()，为 "fail" 时抛出异常并报告不健康"""
+
+    _ids = itertools.count()
+
+    def __init__(self) -> None:
+        self.engine_id = next(self._ids)
+        self.phase = "idle"
+        self.warmup_report = None
+        self.stats = EngineStats()
+        self.healthy = True
+        self.served = 0
+        self._released = asyncio.Event()
+        self._inflight: set[str] = set()
+
+    async def load(self, **kwargs: Any) -> None:
+        self.phase = "ready"
+
+    async def unload(self) -> None:
+        self.phase = "idle"
+
+    def is_loaded(self) -> bool:
+        return self.phase != "idle"
+
+    def is_ready(self) -> bool:
+        return self.phase == "ready"
+
+    async def check_health(self) -> bool:
+        return self.healthy
+
+    def inflight_request_ids(self) -> list[str]:
+        return list(self._inflight)
+
+    async def abort(self, request_id: str, reason: str = "manual") -> bool:
+        return False
+
+    def hold(self) -> None:
+        self._released.clear()
+
+    def release(self) -> None:
+        self._released.set()
+
+    async def infer_result(self, prompt: str, request_id: Optional[str] = None, **kwargs: Any) -> InferenceResult:
+        request_id = request_id or f"stub-{self.engine_id}-{self.served}"
+        self._inflight.add(request_id)
+        try:
+            if prompt == "fail":
+                self.healthy = False
+                raise RuntimeError(f"engine {self.engine_id} died")
+            if prompt == "hold":
+                await self._released.wait()
+            self.served += 1
+            return InferenceResult(text=str(self.engine_id))
+        finally:
+            self._inflight.discard(request_id)
+
+
+def _check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"❌ {message}")
+
+
+async def _served_by(pool: EnginePool, prompt: str = "ok", cost: int = 10) -> int:
+    """返回处理该请求的副本编号"""
+    result = await pool.infer_result(prompt=prompt, token_cost=cost)
+    engine_id = int(result.text)
+    return next(r.replica_id for r in pool.replicas if r.engine.engine_id == engine_id)
+
+
+async def check_routing(pool: EnginePool) -> None:
+    held = asyncio.create_task(pool.infer_result(prompt="hold", token_cost=5000))
+    await asyncio.sleep(0)
+    busy = next(r for r in pool.replicas if r.inflight_requests)
+    _check(busy.inflight_tokens == 5000, f"在途 token 数应为 5000，实际 {busy.inflight_tokens}")
+    served = [await _served_by(pool) for _ in range(4)]
+    _check(busy.replica_id not in served, f"副本 {busy.replica_id} 在途 5000 token 仍接收了新请求: {served}")
+    busy.engine.release()
+    await held
+    _check(busy.inflight_tokens == 0 and busy.idle.is_set(), "请求完成后在途计数未归零")
+    print(f"✅ 最小负载路由：大请求占用副本 {busy.replica_id} 期间新请求路由到 {sorted(set(served))}")
+
+
+async def check_drain(pool: EnginePool) -> None:
+    target = pool.replicas[0]
+    target.engine.hold()
+    # 两个副本均空闲时选择编号最小的副本
+    held = asyncio.create_task(pool.infer_result(prompt="hold", token_cost=100))
+    await asyncio.sleep(0)
+    _check(target.inflight_requests == 1, "保持中的请求应路由到副本 0")
+    _check(not await pool.drain(0, timeout=0.2), "在途请求未完成时 drain 不应返回 True")
+    _check(target.state == "draining", f"副本状态应为 draining，实际 {target.state}")
+    served = {await _served_by(pool) for _ in range(3)}
+    _check(served == {1}, f"排空期间请求应只路由到副本 1，实际 {served}")
+    waiter = asyncio.create_task(pool.drain(0, timeout=5))
+    await asyncio.sleep(0.05)
+    _check(not waiter.done(), "在途请求未完成时 drain 提前返回")
+    target.engine.release()
+    await held
+    _check(await waiter, "在途请求完成后 drain 应返回 True")
+    pool.resume(0)
+    _check(target.state == "ready", f"resume 后副本状态应为 ready，实际 {target.state}")
+    print("✅ 排空：等待在途请求完成，排空期间请求只路由到其他副本")
+
+
+async def _served_by_only(pool: EnginePool, replica_id: int, prompt: str = "ok") -> int:
+    """排空其他副本后发送一个请求"""
+    others = [r.replica_id for r in pool.replicas if r.replica_id != replica_id]
+    for other in others:
+        await pool.drain(other, timeout=0)
+    try:
+        return await _served_by(pool, prompt)
+    finally:
+        for other in others:
+            pool.resume(other)
+
+
+async def check_restart(pool: EnginePool) -> None:
+    failing = pool.replicas[1]
+    old_engine = failing.engine
+    try:
+        await _served_by_only(pool, 1, prompt="fail")
+    except RuntimeError:
+        pass
+    else:
+        raise SystemExit("❌ 失败请求应抛出 RuntimeError")
+    _check(failing.state == "unhealthy", f"健康检查失败后副本状态应为 unhealthy，实际 {failing.state}")
+    error = failing.last_error
+    served = {await _served_by(pool) for _ in range(3)}
+    _check(served == {0}, f"故障副本不应接收请求，实际路由到 {served}")
+    await pool.restart(1, drain_timeout=1)
+    _check(failing.engine is not old_engine, "restart 应以工厂新建引擎")
+    _check(failing.state == "ready" and failing.restarts == 1, f"重启后状态 {failing.state}，restarts={failing.restarts}")
+    _check(await _served_by_only(pool, 1) == 1, "重启后的副本应重新接收请求")
+    print(f"✅ 重启：故障副本（{error}）被摘除，重启后恢复路由")
+
+
+async def main() -> None:
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    pool = EnginePool(StubEngine, [("0",), ("1",)])
+    await pool.load(model_path="stub", use_v1_engine=True)
+    await check_routing(pool)
+    await check_drain(pool)
+    await check_restart(pool)
+    await pool.unload()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())